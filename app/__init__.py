@@ -2,7 +2,10 @@ from .download_stocks import download_stock_data, read_stock_numbers_from_file,
 from .clean_data import clean_downloaded_stocks
 from .download_shareholder import download_data
 from .backtest import process_stocks
-from .helpers import save_to_csv, create_folder, read_excel, read_csv, run_process, check_all_folders, parse_custom_date, get_most_recent_friday
+from .backtest_panel import process_stocks_panel, load_panel
+from .sweep import run_sweep
+from .walk_forward import process_stocks_walk_forward
+from .helpers import save_to_csv, create_folder, read_excel, read_csv, run_process, check_all_folders, parse_custom_date, parse_custom_dates, get_most_recent_friday
 from .app_logging import setup_logging, log_separator
 from .config import (
     BASE_DIR,
@@ -26,6 +29,10 @@ __all__ = [
     "clean_downloaded_stocks",
     "download_data",
     "process_stocks",
+    "process_stocks_panel",
+    "load_panel",
+    "run_sweep",
+    "process_stocks_walk_forward",
     "save_to_csv",
     "create_folder",
     "read_excel",
@@ -33,6 +40,7 @@ __all__ = [
     "run_process",
     "check_all_folders",
     "parse_custom_date",
+    "parse_custom_dates",
     "get_most_recent_friday"
     "setup_logging",
     "log_separator",
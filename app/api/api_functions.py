@@ -1,9 +1,12 @@
 from flask import Blueprint, jsonify, request, Response, json
 from app.db.db_CRUD import CRUDHelper
+import logging
 import os
 from app.config import INPUT_STOCK_DIR, RESOURCES_DIR
 from app.backtest_dev import process_stocks
-from app.download_stocks import download_stock_data
+from app.download_stocks import check_and_download_stocks
+from app.panel_store import open_panel_store, update_panel_store
+from app.download_journal import DownloadJournal, run_download_job, UPDATE_ALL_JOB
 import pandas as pd
 
 # Get database URL from environment variable
@@ -18,6 +21,24 @@ api = Blueprint('api', __name__)
 crud_helper = CRUDHelper(database_url=DATABASE_URL)
 
 
+def stock_records_json(stock_id, stocks, price_key="price"):
+    """Serialize a frame from `CRUDHelper.get_stock_frame` as the API's stock records."""
+    result_df = pd.DataFrame({
+        "stock_id": stock_id,
+        "date": [date.isoformat() for date in stocks["date"]],
+        price_key: stocks["price"],
+        "EPS": stocks["EPS"],
+        "PER": stocks["PER"]
+    })
+    return result_df.to_json(orient='records')
+
+
+@api.teardown_app_request
+def remove_db_session(exception=None):
+    """Return the request thread's database connection to the pool."""
+    crud_helper.remove_session()
+
+
 @api.route('/stock', methods=['GET'])
 def get_stock_data():
     """Fetch all stock data with pagination."""
@@ -28,20 +49,12 @@ def get_stock_data():
     if not stock_id:
         return Response('{"error": "Stock ID is required"}', status=400, mimetype='application/json')
 
-    stocks = crud_helper.get_all_stock_info(stock_id)
-    if not stocks:
+    # Only the requested page is read, as float columns
+    stocks = crud_helper.get_stock_frame(stock_id, limit, offset)
+    if stocks is None or (stocks.empty and not (offset and crud_helper.get_latest_dates([stock_id]))):
         return Response('{"error": "No stocks found"}', status=404, mimetype='application/json')
 
-    # Serialize the results
-    result_df = pd.DataFrame([{
-        "stock_id": stock.stock_id,
-        "date": stock.date.isoformat(),
-        "price": stock.price,
-        "EPS": stock.EPS,
-        "PER": stock.PER
-    } for stock in stocks[offset:offset + limit]])
-
-    result_json = result_df.to_json(orient='records')
+    result_json = stock_records_json(stock_id, stocks)
     return Response(result_json, status=200, mimetype='application/json')
 
 
@@ -53,18 +66,36 @@ def get_stock_data_5years():
     if not stock_id:
         return Response('{"error": "Stock ID is required"}', status=400, mimetype='application/json')
 
-    stocks = crud_helper.get_5_years_stock_info(stock_id)
-    if not stocks:
+    stocks = crud_helper.get_stock_frame(stock_id, limit=260)
+    if stocks is None or stocks.empty:
+        return Response('{"error": "No stocks found"}', status=404, mimetype='application/json')
+
+    result_json = stock_records_json(stock_id, stocks)
+    return Response(result_json, status=200, mimetype='application/json')
+
+
+@api.route('/stock/panel', methods=['GET'])
+def get_stock_panel():
+    """Fetch the full weekly PER, Price and EPS history of a stock from the memory-mapped panel."""
+    stock_id = request.args.get("stock_id", type=str)
+
+    if not stock_id:
+        return Response('{"error": "Stock ID is required"}', status=400, mimetype='application/json')
+
+    store = open_panel_store()
+    if store is None or stock_id not in store.stock_index:
         return Response('{"error": "No stocks found"}', status=404, mimetype='application/json')
 
-    # Serialize the results
-    result_df = pd.DataFrame([{
-        "stock_id": stock.stock_id,
-        "date": stock.date.isoformat(),
-        "price": stock.price,
-        "EPS": stock.EPS,
-        "PER": stock.PER
-    } for stock in stocks])
+    # Slices of the mapped arrays; nothing is parsed
+    start, end = store.span(stock_id)
+    row = store.stock(stock_id)
+    result_df = pd.DataFrame({
+        "stock_id": stock_id,
+        "week": store.weeks[start:end],
+        "price": row["price"][start:end],
+        "EPS": row["eps"][start:end],
+        "PER": row["per"][start:end]
+    })
 
     result_json = result_df.to_json(orient='records')
     return Response(result_json, status=200, mimetype='application/json')
@@ -80,16 +111,11 @@ def update_stock_data():
 
     crud_helper.update_stock_data(stock_id)
 
-    stocks = crud_helper.get_all_stock_info(stock_id)
-    result_df = pd.DataFrame([{
-        "stock_id": stock.stock_id,
-        "date": stock.date.isoformat(),
-        "Price": stock.price,
-        "EPS": stock.EPS,
-        "PER": stock.PER
-    } for stock in stocks])
+    stocks = crud_helper.get_stock_frame(stock_id)
+    if stocks is None:
+        return Response('{"error": "Failed to read stock data"}', status=500, mimetype='application/json')
 
-    result_json = result_df.to_json(orient='records')
+    result_json = stock_records_json(stock_id, stocks, price_key="Price")
     return Response(result_json, status=200, mimetype='application/json')
 
 
@@ -99,29 +125,48 @@ def update_all_stock_data():
     with open(RESOURCES_DIR / "all_stocks_number.txt", "r") as f:
         stock_numbers = f.read().splitlines()
 
-    # Download all stock data first
-    download_stock_data(stock_numbers)
+    # Download stale stocks first, oldest data first; only new weeks unless a full re-fetch
+    # is requested. The run is journaled, so an interrupted run resumes where it stopped.
+    full_refetch = request.args.get("full_refetch", "false").lower() == "true"
+    download_errors = run_download_job(
+        UPDATE_ALL_JOB, stock_numbers,
+        lambda stocks, journal: check_and_download_stocks(stocks, full_refetch, journal=journal),
+        full_refetch=full_refetch)
+
+    # Add the new weeks to the memory-mapped panel; the database update does not depend on it
+    try:
+        update_panel_store(stock_numbers)
+    except Exception as e:
+        logging.error(f"Error updating the stock panel: {e}")
 
-    all_missing_records = []  # Collect all missing records
+    stock_frames = []         # New rows of each stock, typed for the bulk loader
     updated_stocks = []       # Stocks that need to be updated
     already_updated_stocks = []  # Stocks that are already up-to-date
     error_stocks = []         # Stocks that encountered errors
 
+    # Latest stored dates of all stocks in one grouped query
+    latest_dates = crud_helper.get_latest_dates(stock_numbers)
+    if latest_dates is None:
+        return Response('{"error": "Failed to read the database."}', status=500, mimetype='application/json')
+
     for stock_id in stock_numbers:
         try:
-            missing_records = crud_helper.update_stock_data(stock_id)
-            if missing_records:
-                all_missing_records.extend(missing_records)
+            stock_frame = crud_helper.prepare_stock_frame(stock_id, latest_dates)
+            if stock_frame is None:
+                error_stocks.append(stock_id)
+            elif not stock_frame.empty:
+                stock_frames.append(stock_frame)
                 updated_stocks.append(stock_id)
             else:
                 already_updated_stocks.append(stock_id)
         except Exception as e:
             error_stocks.append(stock_id)
 
-    # Insert all missing records into the database at once
-    if all_missing_records:
-        success = crud_helper.add_bulk_stock_data(all_missing_records)
-        if not success:
+    # Bulk load the missing rows in batches, skipping rows already stored
+    load_stats = None
+    if stock_frames:
+        load_stats = crud_helper.bulk_load_stock_frames(stock_frames)
+        if load_stats is None:
             return Response(
                 '{"error": "Failed to insert missing records into the database."}',
                 status=500,
@@ -132,7 +177,9 @@ def update_all_stock_data():
     result = {
         "updated": updated_stocks,
         "already_updated": already_updated_stocks,
-        "errors": error_stocks
+        "errors": error_stocks,
+        "download_errors": download_errors,
+        "load": load_stats
     }
 
     # Use json.dumps with separators to format JSON as a single line per array
@@ -143,6 +190,19 @@ def update_all_stock_data():
         mimetype='application/json'
     )
 
+@api.route('/stock/update_all/status', methods=['GET'])
+def get_update_all_status():
+    """Report the progress of the latest update-all download job from its journal."""
+    status = DownloadJournal(UPDATE_ALL_JOB).status()
+    return Response(json.dumps(status), status=200, mimetype='application/json')
+
+
+@api.route('/db/pool', methods=['GET'])
+def get_db_pool_status():
+    """Report database connection pool statistics."""
+    return Response(json.dumps(crud_helper.pool_status()), status=200, mimetype='application/json')
+
+
 @api.route('/stock/backtest', methods=['POST'])
 def perform_backtest():
     """Perform backtesting for Median Reversion strategy."""
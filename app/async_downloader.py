@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from app.config import (GOODINFO_BASE_URL, DOWNLOAD_RATE_LIMIT, DOWNLOAD_BURST,
+                        ASYNC_CONCURRENCY, ASYNC_PER_HOST_LIMIT)
+
+
+class TokenBucket:
+    """
+    Global request rate limit for the async scheduler.
+
+    Tokens refill at `rate` per second up to `capacity`; each request takes one. A
+    rate of None or 0 disables the limit.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity or 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait for a token."""
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _print_throughput(description, done, total, started):
+    elapsed = time.monotonic() - started
+    rate = done / elapsed * 60 if elapsed > 0 else 0.0
+    sys.stdout.write(f"\r{description}: {done}/{total} ({rate:.1f} stocks/min)")
+    sys.stdout.flush()
+
+
+async def _run(items, make_client, fetch, store, concurrency, rate_limit, burst, per_host_limit, host,
+               description, on_error):
+    bucket = TokenBucket(rate_limit, burst)
+    host_limits = {host: asyncio.Semaphore(per_host_limit or concurrency)}
+    clients = asyncio.Queue()
+    for _ in range(concurrency):
+        clients.put_nowait(None)  # Clients are created on first use
+    started_clients = []
+    errors = set()
+    done = 0
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+
+    fetch_executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="async-fetch")
+    # A single thread writes the store and the manifest, like the pool's writer thread
+    write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-writer")
+
+    def fail(item, stage, e):
+        logging.error(f"Error {stage} {item}: {e}")
+        errors.add(item)
+        if on_error is not None:
+            on_error(item, f"Error {stage}: {e}")
+
+    async def download(item):
+        nonlocal done
+        client = await clients.get()
+        try:
+            if client is None:
+                client = await loop.run_in_executor(fetch_executor, make_client)
+                started_clients.append(client)
+            await bucket.acquire()
+            async with host_limits[host]:
+                data = await loop.run_in_executor(fetch_executor, fetch, client, item)
+        except Exception as e:
+            fail(item, "downloading", e)
+            done += 1
+            return
+        finally:
+            clients.put_nowait(client)
+
+        try:
+            await loop.run_in_executor(write_executor, store, item, data)
+        except Exception as e:
+            fail(item, "storing", e)
+        finally:
+            done += 1
+
+    async def report():
+        while True:
+            _print_throughput(description, done, len(items), started)
+            await asyncio.sleep(1)
+
+    reporter = asyncio.create_task(report())
+    try:
+        await asyncio.gather(*(download(item) for item in items))
+    finally:
+        reporter.cancel()
+        _print_throughput(description, done, len(items), started)
+        sys.stdout.write("\n")
+        try:
+            for client in started_clients:
+                try:
+                    await loop.run_in_executor(fetch_executor, client.quit)
+                except Exception as e:
+                    logging.warning(f"Error closing a download client: {e}")
+        finally:
+            fetch_executor.shutdown()
+            write_executor.shutdown()
+
+    elapsed = time.monotonic() - started
+    logging.info(f"{description}: {len(items) - len(errors)}/{len(items)} succeeded in {elapsed:.1f}s "
+                 f"({len(items) / elapsed * 60 if elapsed > 0 else 0:.1f} stocks/min).")
+    return [item for item in items if item in errors]
+
+
+def run_async_download(items, make_client, fetch, store, concurrency=ASYNC_CONCURRENCY,
+                       rate_limit=DOWNLOAD_RATE_LIMIT, burst=DOWNLOAD_BURST,
+                       per_host_limit=ASYNC_PER_HOST_LIMIT, host=None, description="Downloading",
+                       on_error=None):
+    """
+    Downloads items on an asyncio event loop with many requests in flight.
+
+    Requests are admitted by a global token bucket and a per-host concurrency cap.
+    Fetching and parsing run in a thread pool with one client per in-flight request,
+    and results are stored by a single writer thread, so the event loop never blocks.
+    Live throughput is printed instead of a spinner per stock.
+
+    Takes the same `make_client`, `fetch` and `store` callables as `run_download_pool`,
+    so either engine can drive the same downloader.
+
+    Args:
+    - items (list): Items to download, e.g. stock numbers.
+    - make_client (callable): Returns a new client with a `quit()` method.
+    - fetch (callable): fetch(client, item) downloads and parses one item.
+    - store (callable): store(item, data) saves one item.
+    - concurrency (int): Maximum requests in flight.
+    - rate_limit (float): Token refill rate, in requests per second.
+    - burst (int): Token bucket capacity.
+    - per_host_limit (int): Maximum requests in flight to one host.
+    - host (str): Host the requests go to. Default is the GOODINFO_BASE_URL host.
+    - description (str): Progress text.
+    - on_error (callable): on_error(item, error) is called with each failure.
+
+    Returns:
+    - error_items (list): Items that failed to download or store, in input order.
+    """
+    if not items:
+        return []
+    host = host or urlparse(GOODINFO_BASE_URL).netloc
+    concurrency = max(1, min(concurrency or 1, len(items)))
+    return asyncio.run(_run(items, make_client, fetch, store, concurrency, rate_limit, burst,
+                            per_host_limit, host, description, on_error))
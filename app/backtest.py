@@ -1,11 +1,13 @@
 import pandas as pd
 import os
 import logging
+from functools import partial
 from .helpers import *
-from .config import PROCESS_DATA_PATH, STOCK_DATA_DIR, OUTPUT_DATA_PATH
-
-
-NaN_THRESHOLD = 0.2
+from .data_store import read_stock, stock_exists
+from .config import PROCESS_DATA_PATH, STOCK_DATA_DIR, OUTPUT_DATA_PATH, PARALLEL_WORKERS, PARALLEL_CHUNK_SIZE
+from .config import MR_HORIZONS, VERDICT_THRESHOLD
+from .mr_engine import NaN_THRESHOLD, median_reversion_rates
+from .mr_state import update_stock_mr_state
 
 
 def median_reversion_calculation(data, weeks, median_per, quartile_per):
@@ -22,50 +24,151 @@ def median_reversion_calculation(data, weeks, median_per, quartile_per):
     - success_rate (float): Success rate as a percentage.
     - total_improve_median (int): Total number of successful median improvements.
     """
+    return median_reversion_calculations(data, [weeks], median_per, quartile_per)[weeks]
 
-    logging.info(
-        f"Starting backtest for {weeks} weeks with median PER: {median_per}")
 
-    total_under_median = 0
-    total_improve_median = 0
+def median_reversion_calculations(data, horizons, median_per, quartile_per, state_key=None):
+    """
+    Perform Median Reversion (MR) backtests for several horizons in one pass.
 
-    # Convert PER to numeric
-    data['PER'] = pd.to_numeric(data['PER'], errors='coerce')
-    total_NaN = 0
-    total_NaN = data['PER'].isna().sum()
+    Args:
+    - data (DataFrame): Stock data containing the PER column.
+    - horizons (list): Numbers of rows to look ahead, e.g. [4, 8, 12].
+    - median_per (float): The median PER value.
+    - quartile_per (float): The 25th percentile PER value.
+    - state_key (str): If set, reuse and update the saved MR state under this key
+      (the stock ID) so only newly appended weeks are processed.
 
-    # Check if NaN values exceed the threshold
-    if total_NaN / len(data) > NaN_THRESHOLD:
-        logging.warning(
-            f"NaN values exceed the threshold of {NaN_THRESHOLD * 100}%. Returning NaN.")
-        return float('nan'), float('nan')
+    Returns:
+    - results (dict): {weeks: (success_rate, total_improve_median)} for each horizon.
+    """
+
+    logging.info(
+        f"Starting backtest for {horizons} weeks with median PER: {median_per}")
 
-    for i in range(len(data) - weeks):
-        enter_PER = data["PER"].iloc[i]
-        if enter_PER > quartile_per:
+    # Convert PER to numeric
+    data["PER"] = pd.to_numeric(data["PER"], errors="coerce")
+    per = data["PER"].to_numpy(dtype=float)
+    if state_key is not None:
+        rates = update_stock_mr_state(state_key, per, horizons, median_per, quartile_per)
+    else:
+        rates = median_reversion_rates(per, horizons, median_per, quartile_per)
+
+    results = {}
+    for weeks, (success_rate, total_improve_median, total_under_median, nan_exceeded) in rates.items():
+        # Check if NaN values exceed the threshold
+        if nan_exceeded:
+            logging.warning(
+                f"NaN values exceed the threshold of {NaN_THRESHOLD * 100}%. Returning NaN.")
+            results[weeks] = (float('nan'), float('nan'))
             continue
-        total_under_median += 1
-        initial_deviation = abs(enter_PER - median_per)
+        success_rate = success_rate if total_under_median > 0 else 0
+        logging.info(f"Backtest completed for {weeks} weeks. Success rate: {success_rate:.2f}%")
+        results[weeks] = (success_rate, total_improve_median)
+    return results
 
-        for j in range(1, weeks + 1):
-            future_per = data["PER"].iloc[i + j]
-            future_deviation = abs(future_per - median_per)
-            if future_deviation < initial_deviation:
-                total_improve_median += 1
-                break
 
-    success_rate = (total_improve_median /
-                    total_under_median) if total_under_median > 0 else 0
-    logging.info(f"Backtest completed. Success rate: {success_rate:.2f}%")
-    return success_rate, total_improve_median
+def backtest_stock(stock_id, process_data_df, incremental=False):
+    """
+    Backtest Median Reversion (MR) success rates for one stock.
 
+    Args:
+    - stock_id (str): Stock number to process.
+    - process_data_df (DataFrame): Contents of process_data.csv.
+    - incremental (bool): If True, update the stock's saved MR state instead of
+      recomputing every week.
 
-def process_stocks(stock_numbers):
+    Returns:
+    - result (dict): One row of backtest_MR_data.csv, or None if the stock was skipped.
+    """
+    logging.info(f"Processing stock: {stock_id}")
+    # Check if stock file exists
+    if not stock_exists(STOCK_DATA_DIR, stock_id):
+        logging.warning(
+            f"Stock file for {stock_id} not found in {STOCK_DATA_DIR}. Skipping.")
+        return None
+
+    # Load the stock data
+    stock_data_df = read_stock(STOCK_DATA_DIR, stock_id)
+    if stock_data_df is None:
+        logging.error(
+            f"Failed to read data for stock {stock_id}. Skipping.")
+        return None
+
+    # Reverse data for chronological order
+    stock_data_df = stock_data_df.iloc[::-1].reset_index(drop=True)
+
+    # Filter the process_data_df for the current stock
+    stock_row = process_data_df[process_data_df["Stock ID"].astype(
+        str) == stock_id]
+    if stock_row.empty:
+        logging.warning(
+            f"No matching stock ID for {stock_id} in process_data.csv. Skipping.")
+        return None
+
+    # S => Z information
+    median_per = stock_row["GEP MED"].iloc[0]
+    current_per = stock_row["Current PER"].iloc[0]
+    quartile_per = stock_row["GEP.25"].iloc[0]
+
+    # S T V
+    current_price = stock_row["Price"].iloc[0]
+    median_price = (median_per / current_per) * \
+        current_price if current_per != 0 else None
+    mp_updown = (median_price - current_price) / \
+        current_price if current_price != 0 else None
+
+    # Perform Median Reversion backtests
+    # W X Y Z
+    mr_results = median_reversion_calculations(
+        stock_data_df, MR_HORIZONS, median_per, quartile_per,
+        state_key=stock_id if incremental else None)
+    MR_1_month, MR_cases_1_month = mr_results[MR_HORIZONS[0]]
+    MR_2_month, MR_cases_2_month = mr_results[MR_HORIZONS[1]]
+    MR_3_month, MR_cases_3_month = mr_results[MR_HORIZONS[2]]
+    avg_mr = pd.Series([MR_1_month, MR_2_month, MR_3_month]).mean()
+
+    # AB => AG
+    kelly = (avg_mr * (mp_updown + 1) - 1) / \
+        mp_updown if mp_updown != 0 else None
+    verdict = False
+    if mp_updown > 0 and avg_mr > VERDICT_THRESHOLD:
+        verdict = True
+
+    logging.info(f"Processing for stock {stock_id} completed.")
+    return {
+        "Stock ID": stock_id,
+        "C$": current_price,
+        "M$": median_price,
+        "T$": "####",  # Leave blank
+        "MP UpDown": mp_updown,
+        "1M MR": MR_1_month,
+        "2M MR": MR_2_month,
+        "3M MR": MR_3_month,
+        "Avg.": avg_mr,
+        "####": "####",  # Leave blank
+        "Kelly": kelly,
+        "Verdict": verdict,
+        "#####": "#####",  # Leave blank
+        "1M Incident": MR_cases_1_month,
+        "2M Incident": MR_cases_2_month,
+        "3M Incident": MR_cases_3_month
+    }
+
+
+def process_stocks(stock_numbers, parallel=False, workers=PARALLEL_WORKERS, chunk_size=PARALLEL_CHUNK_SIZE,
+                   incremental=False):
     """
     Process selected stocks for backtesting Median Reversion (MR) success rates.
 
     Args:
     - stock_numbers (list): List of stock numbers to process.
+    - parallel (bool): If True, spread the stocks across a process pool.
+    - workers (int): Number of worker processes in parallel mode.
+    - chunk_size (int): Number of stocks sent to a worker at a time in parallel mode.
+    - incremental (bool): If True, keep per-stock MR state in MR_STATE_DIR and only
+      process weeks added since the last run. The state is rebuilt automatically when
+      the history or the median/quartile changes.
     """
     logging.info(f"Processing stocks: {stock_numbers}")
 
@@ -77,86 +180,14 @@ def process_stocks(stock_numbers):
         logging.error("Failed to read process_data.csv. Exiting.")
         return
 
-    result_list = []
-
     # Loop through each stock number
-    for stock_id in stock_numbers:
-        logging.info(f"Processing stock: {stock_id}")
-        stock_file_path = os.path.join(STOCK_DATA_DIR, f"{stock_id}.csv")
-
-        # Check if stock file exists
-        if not os.path.exists(stock_file_path):
-            logging.warning(
-                f"Stock file for {stock_id} not found in {STOCK_DATA_DIR}. Skipping.")
-            continue
-
-        # Load the stock CSV
-        stock_data_df = read_csv(stock_file_path)
-        if stock_data_df is None:
-            logging.error(
-                f"Failed to read data for stock {stock_id}. Skipping.")
-            continue
-
-        # Reverse data for chronological order
-        stock_data_df = stock_data_df.iloc[::-1].reset_index(drop=True)
-
-        # Filter the process_data_df for the current stock
-        stock_row = process_data_df[process_data_df["Stock ID"].astype(
-            str) == stock_id]
-        if stock_row.empty:
-            logging.warning(
-                f"No matching stock ID for {stock_id} in process_data.csv. Skipping.")
-            continue
-
-        # S => Z information
-        median_per = stock_row["GEP MED"].iloc[0]
-        current_per = stock_row["Current PER"].iloc[0]
-        quartile_per = stock_row["GEP.25"].iloc[0]
-
-        # S T V
-        current_price = stock_row["Price"].iloc[0]
-        median_price = (median_per / current_per) * \
-            current_price if current_per != 0 else None
-        mp_updown = (median_price - current_price) / \
-            current_price if current_price != 0 else None
-
-        # Perform Median Reversion backtests
-        # W X Y Z
-        MR_1_month, MR_cases_1_month = median_reversion_calculation(
-            stock_data_df, 4, median_per, quartile_per)
-        MR_2_month, MR_cases_2_month = median_reversion_calculation(
-            stock_data_df, 8, median_per, quartile_per)
-        MR_3_month, MR_cases_3_month = median_reversion_calculation(
-            stock_data_df, 12, median_per, quartile_per)
-        avg_mr = pd.Series([MR_1_month, MR_2_month, MR_3_month]).mean()
-
-        # AB => AG
-        kelly = (avg_mr * (mp_updown + 1) - 1) / \
-            mp_updown if mp_updown != 0 else None
-        verdict = False
-        if mp_updown > 0 and avg_mr > 0.84:
-            verdict = True
-
-        # Append the results to the list
-        result_list.append({
-            "Stock ID": stock_id,
-            "C$": current_price,
-            "M$": median_price,
-            "T$": "####",  # Leave blank
-            "MP UpDown": mp_updown,
-            "1M MR": MR_1_month,
-            "2M MR": MR_2_month,
-            "3M MR": MR_3_month,
-            "Avg.": avg_mr,
-            "####": "####",  # Leave blank
-            "Kelly": kelly,
-            "Verdict": verdict,
-            "#####": "#####",  # Leave blank
-            "1M Incident": MR_cases_1_month,
-            "2M Incident": MR_cases_2_month,
-            "3M Incident": MR_cases_3_month
-        })
-        logging.info(f"Processing for stock {stock_id} completed.")
+    task = partial(backtest_stock, process_data_df=process_data_df, incremental=incremental)
+    if parallel:
+        logging.info(f"Backtesting {len(stock_numbers)} stocks in parallel (workers={workers}, chunk_size={chunk_size}).")
+        results = parallel_map(task, stock_numbers, workers, chunk_size)
+    else:
+        results = [task(stock_id) for stock_id in stock_numbers]
+    result_list = [result for result in results if result is not None]
 
     # Convert results to DataFrame and save
     result_df = pd.DataFrame(result_list)
@@ -4,13 +4,14 @@ import os
 import logging
 from app.helpers import *
 from app.config import PROCESS_DATA_PATH, STOCK_DATA_DIR, OUTPUT_DATA_PATH
+from app.config import ENTRY_QUANTILE, MR_HORIZONS, VERDICT_THRESHOLD
+from app.mr_engine import NaN_THRESHOLD, median_reversion_rates
 from app.db.db_CRUD import CRUDHelper
+from app.result_cache import backtest_cache
 from app.app_logging import setup_logging
 
 setup_logging(debug_mode=True)
 
-NaN_THRESHOLD = 0.2
-
 # Get database URL from environment variable
 DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
@@ -33,108 +34,171 @@ def median_reversion_calculation(data, weeks, median_per, quartile_per):
     - success_rate (float): Success rate as a percentage.
     - total_improve_median (int): Total number of successful median improvements.
     """
+    return median_reversion_calculations(data, [weeks], median_per, quartile_per)[weeks]
 
-    logging.info(
-        f"Starting backtest for {weeks} weeks with median PER: {median_per}")
 
-    total_under_median = 0
-    total_improve_median = 0
+def median_reversion_calculations(data, horizons, median_per, quartile_per):
+    """
+    Perform Median Reversion (MR) backtests for several horizons in one pass.
+
+    Args:
+    - data (DataFrame): Stock data containing the PER column.
+    - horizons (list): Numbers of rows to look ahead, e.g. [4, 8, 12].
+    - median_per (float): The median PER value.
+    - quartile_per (float): The 25th percentile PER value.
+
+    Returns:
+    - results (dict): {weeks: (success_rate, total_improve_median)} for each horizon.
+    """
+
+    logging.info(
+        f"Starting backtest for {horizons} weeks with median PER: {median_per}")
 
     # Convert PER to numeric
     data["PER"] = pd.to_numeric(data["PER"], errors="coerce")
-    total_NaN = 0
-    total_NaN = data["PER"].isna().sum()
-
-    # Check if NaN values exceed the threshold
-    if total_NaN / len(data) > NaN_THRESHOLD:
-        logging.warning(
-            f"NaN values exceed the threshold of {NaN_THRESHOLD * 100}%. Returning NaN.")
-        return float('nan'), 0
-
-    for i in range(len(data) - weeks):
-        enter_PER = data["PER"].iloc[i]
-        if enter_PER > quartile_per:
+    rates = median_reversion_rates(
+        data["PER"].to_numpy(dtype=float), horizons, median_per, quartile_per)
+
+    results = {}
+    for weeks, (success_rate, total_improve_median, total_under_median, nan_exceeded) in rates.items():
+        # Check if NaN values exceed the threshold
+        if nan_exceeded:
+            logging.warning(
+                f"NaN values exceed the threshold of {NaN_THRESHOLD * 100}%. Returning NaN.")
+            results[weeks] = (float('nan'), 0)
             continue
-        total_under_median += 1
-        initial_deviation = abs(enter_PER - median_per)
+        success_rate = success_rate if total_under_median > 0 else 0
+        logging.info(f"Backtest completed for {weeks} weeks. Success rate: {success_rate:.2f}%")
+        results[weeks] = (success_rate, total_improve_median)
+    return results
 
-        for j in range(1, weeks + 1):
-            future_per = data["PER"].iloc[i + j]
-            future_deviation = abs(future_per - median_per)
-            if future_deviation < initial_deviation:
-                total_improve_median += 1
-                break
 
-    success_rate = (total_improve_median /
-                    total_under_median) if total_under_median > 0 else 0
-    logging.info(f"Backtest completed. Success rate: {success_rate:.2f}%")
-    return success_rate, total_improve_median
+def backtest_stock(stock_id, stocks):
+    """
+    Backtest Median Reversion (MR) success rates for one stock from database rows.
+
+    Args:
+    - stock_id (str or int): Stock number being processed.
+    - stocks (list): Stock_Prices_Weekly rows for the stock.
+
+    Returns:
+    - result (dict): One row of the backtest results.
+    """
+    return backtest_history(stock_id, {
+        "date": [stock.date for stock in stocks],
+        "price": [float(stock.price) if isinstance(stock.price, Decimal) else stock.price for stock in stocks],
+        "EPS": [float(stock.EPS) if isinstance(stock.EPS, Decimal) else stock.EPS for stock in stocks],
+        "PER": [float(stock.PER) if isinstance(stock.PER, Decimal) else stock.PER for stock in stocks],
+    })
+
+
+def backtest_history(stock_id, history):
+    """
+    Backtest Median Reversion (MR) success rates for one stock from column arrays.
+
+    Args:
+    - stock_id (str or int): Stock number being processed.
+    - history (dict): {"date", "price", "EPS", "PER"} arrays, e.g. from
+      `CRUDHelper.get_recent_stock_histories`.
+
+    Returns:
+    - result (dict): One row of the backtest results.
+    """
+    # Build the DataFrame straight from the columns
+    stock_data_df = pd.DataFrame({
+        "Date": history["date"],
+        "Price": history["price"],
+        "EPS": history["EPS"],
+        "PER": history["PER"]
+    })
+
+    # Ensure the data is sorted chronologically
+    stock_data_df = stock_data_df.sort_values(
+        by="Date").reset_index(drop=True)
+    # Calculate required statistics
+    median_per = stock_data_df["PER"].median()
+    quartile_per = stock_data_df["PER"].quantile(ENTRY_QUANTILE)  # Entry PER at the ENTRY_QUANTILE
+    current_per = stock_data_df["PER"].iloc[-1]  # Most recent PER
+    current_price = stock_data_df["Price"].iloc[-1]  # Most recent price
+    median_price = (median_per / current_per) * current_price if current_per != 0 else None
+    new_median = stock_data_df["Price"].median()
+    mp_updown = (median_price - current_price) / current_price if current_price != 0 else None
+
+    # Perform Median Reversion backtests
+    mr_results = median_reversion_calculations(stock_data_df, MR_HORIZONS, median_per, quartile_per)
+    MR_1_month, MR_cases_1_month = mr_results[MR_HORIZONS[0]]
+    MR_2_month, MR_cases_2_month = mr_results[MR_HORIZONS[1]]
+    MR_3_month, MR_cases_3_month = mr_results[MR_HORIZONS[2]]
+    avg_mr = pd.Series([MR_1_month, MR_2_month, MR_3_month]).mean()
+
+    # Calculate Kelly Criterion and verdict
+    kelly = (avg_mr * (mp_updown + 1) - 1) / mp_updown if mp_updown != 0 else None
+    verdict = False
+    if mp_updown > 0 and avg_mr > VERDICT_THRESHOLD:
+        verdict = True
+
+    logging.info(f"Processing for stock {stock_id} completed.")
+    return {
+        "Stock ID": stock_id,
+        "C$": round(current_price, 2) if current_price is not None else None,
+        "M$": round(median_price, 2) if median_price is not None else None,
+        "T$": "####",  # Leave blank
+        "MP UpDown": round(mp_updown, 2) if mp_updown is not None else None,
+        "1M MR": round(MR_1_month, 2) if MR_1_month is not None else None,
+        "2M MR": round(MR_2_month, 2) if MR_2_month is not None else None,
+        "3M MR": round(MR_3_month, 2) if MR_3_month is not None else None,
+        "Avg.": round(avg_mr, 2) if avg_mr is not None else None,
+        "Kelly": round(kelly, 2) if kelly is not None else None,
+        "Verdict": verdict,
+        "1M Incident": MR_cases_1_month,
+        "2M Incident": MR_cases_2_month,
+        "3M Incident": MR_cases_3_month
+    }
 
 
 def process_stocks(stock_numbers):
     logging.info(f"Processing stocks: {stock_numbers}")
 
-    result_list = []
+    params = {
+        "weeks": 260,
+        "entry_quantile": ENTRY_QUANTILE,
+        "horizons": MR_HORIZONS,
+        "verdict_threshold": VERDICT_THRESHOLD,
+    }
 
+    # Latest stored dates of all stocks in one grouped query, for the cache keys
+    latest_dates = crud_helper.get_latest_dates(stock_numbers) or {}
+
+    results = {}
+    pending = []  # Stocks with no cached result
     for stock_id in stock_numbers:
         logging.info(f"Processing stock: {stock_id}")
 
-        # Fetch 5 years of stock data from the database
-        stocks = crud_helper.get_5_years_stock_info(stock_id)
-        if not stocks:
+        # Reuse the cached result when the stock has no newer data
+        latest_date = latest_dates.get(stock_id)
+        if latest_date is None:
+            logging.warning(f"No data found for stock {stock_id}. Skipping.")
+            continue
+        cached = backtest_cache.get(stock_id, latest_date, params)
+        if cached is not None:
+            logging.info(f"Using cached backtest result for stock {stock_id}.")
+            results[stock_id] = cached
+            continue
+        pending.append(stock_id)
+
+    # Fetch 5 years of data for every remaining stock in one windowed query
+    histories = (crud_helper.get_recent_stock_histories(pending, params["weeks"]) or {}) if pending else {}
+    for stock_id in pending:
+        history = histories.get(stock_id)
+        if history is None:
             logging.warning(f"No data found for stock {stock_id}. Skipping.")
             continue
 
-        # Convert the fetched data to a DataFrame
-        stock_data_df = pd.DataFrame([{
-            "Date": stock.date,
-            "Price": float(stock.price) if isinstance(stock.price, Decimal) else stock.price,
-            "EPS": float(stock.EPS) if isinstance(stock.EPS, Decimal) else stock.EPS,
-            "PER": float(stock.PER) if isinstance(stock.PER, Decimal) else stock.PER
-        } for stock in stocks])
-
-        # Ensure the data is sorted chronologically
-        stock_data_df = stock_data_df.sort_values(
-            by="Date").reset_index(drop=True)
-        # Calculate required statistics
-        median_per = stock_data_df["PER"].median()
-        quartile_per = stock_data_df["PER"].quantile(0.25)  # 25th percentile PER
-        current_per = stock_data_df["PER"].iloc[-1]  # Most recent PER
-        current_price = stock_data_df["Price"].iloc[-1]  # Most recent price
-        median_price = (median_per / current_per) * current_price if current_per != 0 else None
-        new_median = stock_data_df["Price"].median()
-        mp_updown = (median_price - current_price) / current_price if current_price != 0 else None
-
-        # Perform Median Reversion backtests
-        MR_1_month, MR_cases_1_month = median_reversion_calculation(stock_data_df, 4, median_per, quartile_per)
-        MR_2_month, MR_cases_2_month = median_reversion_calculation(stock_data_df, 8, median_per, quartile_per)
-        MR_3_month, MR_cases_3_month = median_reversion_calculation(stock_data_df, 12, median_per, quartile_per)
-        avg_mr = pd.Series([MR_1_month, MR_2_month, MR_3_month]).mean()
-
-        # Calculate Kelly Criterion and verdict
-        kelly = (avg_mr * (mp_updown + 1) - 1) / mp_updown if mp_updown != 0 else None
-        verdict = False
-        if mp_updown > 0 and avg_mr > 0.84:
-            verdict = True
-
-        # Append the results to the list
-        result_list.append({
-            "Stock ID": stock_id,
-            "C$": round(current_price, 2) if current_price is not None else None,
-            "M$": round(median_price, 2) if median_price is not None else None,
-            "T$": "####",  # Leave blank
-            "MP UpDown": round(mp_updown, 2) if mp_updown is not None else None,
-            "1M MR": round(MR_1_month, 2) if MR_1_month is not None else None,
-            "2M MR": round(MR_2_month, 2) if MR_2_month is not None else None,
-            "3M MR": round(MR_3_month, 2) if MR_3_month is not None else None,
-            "Avg.": round(avg_mr, 2) if avg_mr is not None else None,
-            "Kelly": round(kelly, 2) if kelly is not None else None,
-            "Verdict": verdict,
-            "1M Incident": MR_cases_1_month,
-            "2M Incident": MR_cases_2_month,
-            "3M Incident": MR_cases_3_month
-        })
-        logging.info(f"Processing for stock {stock_id} completed.")
+        result = backtest_history(stock_id, history)
+        backtest_cache.put(stock_id, latest_dates[stock_id], params, result)
+        results[stock_id] = result
+
+    result_list = [results[stock_id] for stock_id in stock_numbers if stock_id in results]
 
     # Convert results to DataFrame and save
     result_df = pd.DataFrame(result_list)
@@ -0,0 +1,232 @@
+import logging
+import os
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .helpers import *
+from .data_store import read_consolidated, read_stock, stock_exists
+from .panel_store import open_panel_store
+from .config import STOCK_DATA_DIR, OUTPUT_DATA_PATH, ENTRY_QUANTILE, MR_HORIZONS, VERDICT_THRESHOLD
+from .mr_engine import median_reversion_rates
+
+# Aligned stocks x weeks arrays; start/end give each stock's column span (end exclusive)
+# and `present` marks the weeks a stock has a row for
+StockPanel = namedtuple(
+    "StockPanel", ["stock_ids", "stock_index", "weeks", "week_index", "per", "price", "start", "end", "present"])
+
+
+def load_panel(stock_numbers, data_dir=None, consolidated=False, memmap=False):
+    """
+    Load PER and Price for many stocks into one aligned stocks x weeks panel.
+
+    Columns are the union of all week codes in chronological order. Weeks a stock
+    has no row for are NaN and False in `present`.
+
+    Args:
+    - stock_numbers (list): List of stock IDs to load.
+    - data_dir (str or Path): Store directory with the per-stock data. Defaults to STOCK_DATA_DIR.
+    - consolidated (bool): If True, read the single consolidated dataset of `data_dir`
+      (see `data_store.consolidate_store`) instead of one file per stock. Falls back to
+      the files if it has not been built or a stock was written since.
+    - memmap (bool): If True, slice the memory-mapped panel in PANEL_DIR instead of
+      reading any per-stock files. Falls back to the files if it has not been built.
+
+    Returns:
+    - panel (StockPanel): The aligned panel, or None if no stock could be loaded.
+    """
+    if memmap:
+        store = open_panel_store()
+        if store is not None:
+            return _panel_from_store(store, stock_numbers)
+        logging.warning("Memory-mapped panel not found. Reading per-stock files.")
+
+    data_dir = data_dir or STOCK_DATA_DIR
+    stored = read_consolidated(data_dir, stock_numbers) if consolidated else None
+    if consolidated and stored is None:
+        logging.warning("Consolidated dataset not found or out of date. Reading per-stock files.")
+    frames = {}
+    for stock_id in stock_numbers:
+        stock_id = str(stock_id)
+        if stored is not None:
+            stock_data_df = stored.get(stock_id)
+        elif stock_exists(data_dir, stock_id):
+            stock_data_df = read_stock(data_dir, stock_id)
+        else:
+            logging.warning(
+                f"Stock file for {stock_id} not found in {data_dir}. Skipping.")
+            continue
+
+        if stock_data_df is None:
+            logging.error(
+                f"Failed to read data for stock {stock_id}. Skipping.")
+            continue
+        frames[stock_id] = stock_data_df
+
+    if not frames:
+        logging.warning("No stock data loaded for the panel.")
+        return None
+
+    weeks = sorted({code for df in frames.values() for code in df["Date"].astype(str)},
+                   key=week_code_sort_key)
+    week_index = {code: column for column, code in enumerate(weeks)}
+    stock_ids = list(frames)
+    stock_index = {stock_id: row for row, stock_id in enumerate(stock_ids)}
+
+    per = np.full((len(stock_ids), len(weeks)), np.nan)
+    price = np.full((len(stock_ids), len(weeks)), np.nan)
+    present = np.zeros((len(stock_ids), len(weeks)), dtype=bool)
+    start = np.zeros(len(stock_ids), dtype=np.int64)
+    end = np.zeros(len(stock_ids), dtype=np.int64)
+
+    for row, stock_id in enumerate(stock_ids):
+        df = frames[stock_id]
+        columns = df["Date"].astype(str).map(week_index).to_numpy(dtype=np.int64)
+        if len(columns) == 0:
+            continue
+        per[row, columns] = pd.to_numeric(df["PER"], errors="coerce").to_numpy(dtype=float)
+        price[row, columns] = pd.to_numeric(df["Price"], errors="coerce").to_numpy(dtype=float)
+        present[row, columns] = True
+        start[row] = columns.min()
+        end[row] = columns.max() + 1
+
+    logging.info(f"Loaded panel with {len(stock_ids)} stocks and {len(weeks)} weeks.")
+    return StockPanel(stock_ids, stock_index, weeks, week_index, per, price, start, end, present)
+
+
+def _panel_from_store(store, stock_numbers):
+    """Build a StockPanel from the memory-mapped store without parsing any files."""
+    stock_ids = []
+    for stock_id in map(str, stock_numbers):
+        if stock_id in store.stock_index:
+            stock_ids.append(stock_id)
+        else:
+            logging.warning(f"Stock {stock_id} not found in the panel. Skipping.")
+    if not stock_ids:
+        return None
+
+    rows = [store.stock_index[stock_id] for stock_id in stock_ids]
+    if rows == list(range(len(store.stock_ids))):
+        # Whole universe in stored order: use the mapped arrays directly
+        per, price = store.per, store.price
+    else:
+        per, price = store.per[rows], store.price[rows]
+    start = np.array([store.span(stock_id)[0] for stock_id in stock_ids], dtype=np.int64)
+    end = np.array([store.span(stock_id)[1] for stock_id in stock_ids], dtype=np.int64)
+    stock_index = {stock_id: row for row, stock_id in enumerate(stock_ids)}
+    # The store keeps no row mask: a week inside a stock's span is taken as one of its rows
+    # unless both PER and Price are missing
+    columns = np.arange(len(store.weeks))[None, :]
+    present = ((columns >= start[:, None]) & (columns < end[:, None])
+               & ~(np.isnan(per[:, :len(store.weeks)]) & np.isnan(price[:, :len(store.weeks)])))
+    return StockPanel(stock_ids, stock_index, store.weeks, store.week_index, per, price, start, end, present)
+
+
+def compact_rows(panel):
+    """
+    Packs each stock's own rows to the left of the panel, dropping the weeks it has no row for.
+
+    Columns of the union panel that only other stocks have are holes inside a stock's
+    span. The MR kernel would take such a hole as an entry and count it as a look-ahead
+    week, so it runs on each stock's own rows instead, like the per-stock backtest.
+
+    Args:
+    - panel (StockPanel): Panel from `load_panel`.
+
+    Returns:
+    - (per, lengths) (tuple): Stocks x rows PER array, each row left-aligned with NaN
+      after it, and the number of rows of each stock (its exclusive end column).
+    """
+    present = panel.present
+    lengths = present.sum(axis=1).astype(np.int64)
+    # A stable sort of the absent flags moves each stock's rows to the front in week order
+    order = np.argsort(~present, axis=1, kind="stable")[:, :max(int(lengths.max(initial=0)), 1)]
+    per = np.take_along_axis(np.asarray(panel.per, dtype=float)[:, :present.shape[1]], order, axis=1)
+    per[np.arange(per.shape[1])[None, :] >= lengths[:, None]] = np.nan
+    return per, lengths
+
+
+def horizon_label(weeks):
+    """Column label of a look-ahead horizon: months for multiples of 4 weeks (4 -> "1M"), else weeks ("6W")."""
+    return f"{weeks // 4}M" if weeks % 4 == 0 else f"{weeks}W"
+
+
+def process_stocks_panel(stock_numbers, horizons=MR_HORIZONS, memmap=False):
+    """
+    Backtest Median Reversion (MR) success rates for the whole universe at once.
+
+    Same output columns as `backtest.process_stocks`, but the statistics are computed
+    directly from the aligned panel instead of process_data.csv.
+
+    Args:
+    - stock_numbers (list): List of stock numbers to process.
+    - horizons (tuple): Look-ahead windows in weeks; each gets "<label> MR" and
+      "<label> Incident" columns (see `horizon_label`), 1M/2M/3M for the default.
+    - memmap (bool): If True, read the memory-mapped panel in PANEL_DIR.
+
+    Returns:
+    - result_df (DataFrame): Backtest results, also saved to OUTPUT_DATA_PATH.
+    """
+    logging.info(f"Processing {len(stock_numbers)} stocks in panel mode.")
+
+    panel = load_panel(stock_numbers, memmap=memmap)
+    if panel is None:
+        return pd.DataFrame()
+
+    rows = np.arange(len(panel.stock_ids))
+    last = np.maximum(panel.end - 1, 0)
+
+    # Same statistics as clean_data.py, rounded the same way as process_data.csv
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        median_per = np.round(np.nanmedian(panel.per, axis=1), 2)
+        quartile_per = np.round(np.nanquantile(panel.per, ENTRY_QUANTILE, axis=1), 2)
+
+    current_per = panel.per[rows, last]
+    current_price = panel.price[rows, last]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        median_price = np.where(current_per != 0, median_per / current_per * current_price, np.nan)
+        mp_updown = np.where(current_price != 0, (median_price - current_price) / current_price, np.nan)
+
+    compact_per, lengths = compact_rows(panel)
+    mr_results = median_reversion_rates(compact_per, list(horizons), median_per, quartile_per, end=lengths)
+    mr_rates = np.column_stack([mr_results[weeks][0] for weeks in horizons])
+    mr_cases = [np.where(mr_results[weeks][3], np.nan, mr_results[weeks][1]) for weeks in horizons]
+
+    avg_mr = pd.DataFrame(mr_rates).mean(axis=1).to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kelly = np.where(mp_updown != 0, (avg_mr * (mp_updown + 1) - 1) / mp_updown, np.nan)
+    verdict = (mp_updown > 0) & (avg_mr > VERDICT_THRESHOLD)
+
+    labels = [horizon_label(weeks) for weeks in horizons]
+    result_df = pd.DataFrame({
+        "Stock ID": panel.stock_ids,
+        "C$": current_price,
+        "M$": median_price,
+        "T$": "####",  # Leave blank
+        "MP UpDown": mp_updown,
+        **{f"{label} MR": mr_rates[:, i] for i, label in enumerate(labels)},
+        "Avg.": avg_mr,
+        "####": "####",  # Leave blank
+        "Kelly": kelly,
+        "Verdict": verdict,
+        "#####": "#####",  # Leave blank
+        **{f"{label} Incident": mr_cases[i] for i, label in enumerate(labels)}
+    })
+
+    save_to_csv(result_df, OUTPUT_DATA_PATH, False)
+    logging.info(f"Panel results saved to {OUTPUT_DATA_PATH}.")
+    return result_df
+
+
+if __name__ == "__main__":
+    logging.info("Script execution started.")
+    stock_numbers = ["1213", "2330", "2303"]  # Example stock numbers
+    try:
+        print(process_stocks_panel(stock_numbers))
+    except Exception as e:
+        logging.critical(
+            f"Unhandled exception during processing: {e}", exc_info=True)
+    logging.info("Script execution finished.")
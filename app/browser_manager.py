@@ -0,0 +1,288 @@
+import atexit
+import logging
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+from app.config import (DOWNLOAD_DIR, WEB_CHROMEDRIVER_PATH, BROWSER_POOL_SIZE, BROWSER_IDLE_TIMEOUT,
+                        BROWSER_MAX_PAGES, BROWSER_MAX_RSS_MB, BROWSER_BLOCKED_URLS)
+
+# Chrome content settings that stop images, stylesheets and fonts from loading (2 = block)
+BLOCKED_CONTENT_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.managed_default_content_settings.stylesheets": 2,
+    "profile.managed_default_content_settings.fonts": 2,
+    "profile.managed_default_content_settings.popups": 2,
+    "profile.managed_default_content_settings.notifications": 2,
+}
+
+# Browser memory is measured every this many page loads, as reading /proc is not free
+MEMORY_CHECK_INTERVAL = 10
+
+
+@lru_cache(maxsize=1)
+def chromedriver_path():
+    """Resolves the ChromeDriver executable once per process."""
+    # Use Heroku ChromeDriver if available
+    if WEB_CHROMEDRIVER_PATH.exists():
+        logging.info("Using Heroku's ChromeDriver.")
+        return str(WEB_CHROMEDRIVER_PATH)
+    logging.warning("Heroku ChromeDriver not found. Falling back to WebDriverManager.")
+    return ChromeDriverManager().install()
+
+
+def get_service():
+    try:
+        return ChromeService(executable_path=chromedriver_path())
+    except Exception as e:
+        logging.error(f"Failed to initialize ChromeDriver service: {e}")
+        raise
+
+
+def chrome_options(block_resources=True):
+    """Headless Chrome options for Goodinfo downloads, with images, fonts and CSS disabled."""
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    # Return from get() at DOMContentLoaded; the client waits for tblDetail itself
+    options.page_load_strategy = "eager"
+    prefs = {
+        "download.default_directory": str(Path(DOWNLOAD_DIR).resolve()),
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True,
+    }
+    if block_resources:
+        prefs.update(BLOCKED_CONTENT_PREFS)
+        options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", prefs)
+    return options
+
+
+def start_browser(blocked_urls=BROWSER_BLOCKED_URLS):
+    """
+    Starts a headless Chrome that does not load static assets or third-party scripts.
+
+    Args:
+    - blocked_urls (list): URL patterns blocked through the DevTools protocol.
+
+    Returns:
+    - driver (webdriver.Chrome): The browser.
+    """
+    driver = webdriver.Chrome(service=get_service(), options=chrome_options())
+    if blocked_urls:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(blocked_urls)})
+        except Exception as e:
+            logging.warning(f"Could not block URLs in the browser: {e}")
+    return driver
+
+
+def _process_rss_kb(pid):
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def process_tree_rss_mb(pid):
+    """
+    Resident memory of a process and all its descendants, in MB.
+
+    Returns None where /proc is not available.
+    """
+    proc = Path("/proc")
+    if not (proc / str(pid)).exists():
+        return None
+    children = {}
+    for stat_path in proc.glob("[0-9]*/stat"):
+        try:
+            # The parent pid follows the parenthesized command name, which may contain spaces
+            fields = stat_path.read_text().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(stat_path.parent.name))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    total_kb, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total_kb += _process_rss_kb(current)
+        stack.extend(children.get(current, []))
+    return total_kb / 1024
+
+
+def browser_rss_mb(driver):
+    """Memory of a browser's ChromeDriver and Chrome processes in MB, or None if unknown."""
+    try:
+        return process_tree_rss_mb(driver.service.process.pid)
+    except AttributeError:
+        return None
+
+
+class BrowserSession:
+    """
+    A browser leased from a BrowserManager.
+
+    Behaves like the WebDriver it wraps. Page loads are counted so the manager can
+    recycle the browser, and `quit()` hands the browser back to the manager instead of
+    closing it.
+    """
+
+    def __init__(self, manager, driver):
+        self._manager = manager
+        self.driver = driver
+        self.pages = 0
+        self.idle_since = None
+
+    def get(self, url):
+        if self._manager.needs_recycle(self):
+            self._manager.recycle(self)
+        self.driver.get(url)
+        self.pages += 1
+
+    def quit(self):
+        self._manager.release(self)
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+
+class BrowserManager:
+    """
+    Keeps warm Chrome sessions for reuse across downloads and API requests.
+
+    `lease()` returns an idle browser or starts one; `quit()` on the lease returns it.
+    Up to `pool_size` browsers are kept idle, each closed after `idle_timeout` seconds
+    unused. A browser is restarted after `max_pages` page loads or once its processes
+    use more than `max_rss_mb` MB, so long runs do not grow Chrome's memory without limit.
+    """
+
+    def __init__(self, make_driver=start_browser, pool_size=BROWSER_POOL_SIZE,
+                 idle_timeout=BROWSER_IDLE_TIMEOUT, max_pages=BROWSER_MAX_PAGES,
+                 max_rss_mb=BROWSER_MAX_RSS_MB):
+        self.make_driver = make_driver
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.stats = {"started": 0, "reused": 0, "recycled": 0, "closed": 0}
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        driver = self.make_driver()
+        with self._lock:
+            self.stats["started"] += 1
+        return driver
+
+    def _close(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"Error closing browser: {e}")
+        with self._lock:
+            self.stats["closed"] += 1
+
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def _take_expired(self):
+        """Removes idle sessions past the idle timeout; called with the lock held."""
+        if not self.idle_timeout:
+            return []
+        now = time.monotonic()
+        expired = [s for s in self._idle if now - s.idle_since > self.idle_timeout]
+        self._idle = [s for s in self._idle if s not in expired]
+        return expired
+
+    def lease(self):
+        """Returns a warm browser session, starting a browser if none is idle."""
+        while True:
+            with self._lock:
+                expired = self._take_expired()
+                session = self._idle.pop() if self._idle else None
+            for stale in expired:
+                self._close(stale.driver)
+            if session is None:
+                return BrowserSession(self, self._start())
+            if self._is_alive(session.driver):
+                with self._lock:
+                    self.stats["reused"] += 1
+                session.idle_since = None
+                return session
+            logging.info("Discarding an idle browser that is no longer responding.")
+            self._close(session.driver)
+
+    def release(self, session):
+        """Takes a session back, keeping it warm unless it is due for recycling or the pool is full."""
+        if not self.needs_recycle(session):
+            with self._lock:
+                expired = self._take_expired()
+                keep = len(self._idle) < self.pool_size
+                if keep:
+                    session.idle_since = time.monotonic()
+                    self._idle.append(session)
+            for stale in expired:
+                self._close(stale.driver)
+            if keep:
+                return
+        self._close(session.driver)
+
+    def needs_recycle(self, session):
+        """Checks whether a session reached its page limit or memory threshold."""
+        if self.max_pages and session.pages >= self.max_pages:
+            logging.info(f"Recycling browser after {session.pages} pages.")
+            return True
+        if self.max_rss_mb and session.pages and session.pages % MEMORY_CHECK_INTERVAL == 0:
+            rss_mb = browser_rss_mb(session.driver)
+            if rss_mb is not None and rss_mb > self.max_rss_mb:
+                logging.info(f"Recycling browser using {rss_mb:.0f} MB after {session.pages} pages.")
+                return True
+        return False
+
+    def recycle(self, session):
+        """Replaces a session's browser with a fresh one."""
+        self._close(session.driver)
+        session.driver = self._start()
+        session.pages = 0
+        with self._lock:
+            self.stats["recycled"] += 1
+
+    def close_all(self):
+        """Closes every idle browser."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            self._close(session.driver)
+        logging.debug(f"Browser manager closed: {self.stats}")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def browser_manager():
+    """Returns the process-wide BrowserManager; its idle browsers are closed at exit."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = BrowserManager()
+            atexit.register(_manager.close_all)
+        return _manager
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Define the base directory dynamically (root of your project)
@@ -10,6 +11,11 @@ APP_DIR = BASE_DIR
 DATA_DIR = APP_DIR / "data"
 STOCK_DATA_DIR = DATA_DIR / "stock_data"
 RESULTS_DIR = DATA_DIR / "results"
+MR_STATE_DIR = DATA_DIR / "mr_state"
+BACKTEST_CACHE_DIR = DATA_DIR / "cache" / "backtest"
+RAW_CACHE_DIR = DATA_DIR / "cache" / "raw"
+JOURNAL_DIR = DATA_DIR / "journal"
+PANEL_DIR = DATA_DIR / "panel"
 DOWNLOAD_DIR = DATA_DIR / "raw"
 RESOURCES_DIR = BASE_DIR.parent / "resources"
 INPUT_STOCK_DIR = APP_DIR / "input_stock"
@@ -18,7 +24,98 @@ LOGS_DIR = BASE_DIR.parent / "logs"
 # Paths to specific files
 PROCESS_DATA_PATH = RESULTS_DIR / "process_data.csv"
 OUTPUT_DATA_PATH = RESULTS_DIR / "backtest_MR_data.csv"
+SWEEP_OUTPUT_PATH = RESULTS_DIR / "sweep_results.csv"
+WALK_FORWARD_OUTPUT_PATH = RESULTS_DIR / "backtest_MR_walk_forward.csv"
 STOCK_NUMBERS_PATH = INPUT_STOCK_DIR / "stock_numbers.txt"
+DOWNLOAD_MANIFEST_PATH = DATA_DIR / "raw_manifest.json"
+TRADING_HOLIDAYS_PATH = RESOURCES_DIR / "trading_holidays.txt"
+
+# Strategy parameters: entry quantile of PER, MR look-ahead horizons (weeks) for
+# 1M/2M/3M, and the average MR rate a stock must exceed for a positive verdict
+ENTRY_QUANTILE = 0.25
+MR_HORIZONS = (4, 8, 12)
+VERDICT_THRESHOLD = 0.84
+
+# Walk-forward backtest: rolling window (weeks) for the median and entry quantile
+WALK_FORWARD_WINDOW = 260
+
+# Number of per-stock backtest results kept in memory (the disk tier is unbounded)
+BACKTEST_CACHE_SIZE = 4096
+
+# Format of the per-stock stores in DOWNLOAD_DIR and STOCK_DATA_DIR: "parquet", "feather" or "csv"
+DATA_STORE_FORMAT = "parquet"
+
+# Downloads: first date of the full history, and how often a stock's full history is
+# re-fetched to pick up revisions (weekly updates otherwise fetch only the new weeks)
+HISTORY_START_DATE = "2001-03-28"
+FULL_REFETCH_INTERVAL_DAYS = 28
+
+# Downloads write their manifest entries in batches of this many stored partitions
+MANIFEST_FLUSH_EVERY = 50
+
+# Goodinfo site root; point it at tools/goodinfo_standin_server.py to work offline
+GOODINFO_BASE_URL = os.getenv("GOODINFO_BASE_URL", "https://goodinfo.tw/tw").rstrip("/")
+# Plain HTTP fetches tried before falling back to Chrome: timeout (seconds) and browser-like user agent
+HTTP_TIMEOUT = 15
+HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+
+# Resumable download jobs: download rounds per job, and the wait (seconds) before the
+# first retry of failed stocks, doubled for every further round
+DOWNLOAD_MAX_ATTEMPTS = 3
+DOWNLOAD_RETRY_BACKOFF = 30
+
+# Keep every fetched page, gzip-compressed, so the store can be rebuilt offline (replay)
+RAW_CACHE_ENABLED = True
+
+# Browser download pool: number of headless Chrome workers, and the maximum page
+# loads per second across all of them
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_RATE_LIMIT = 1.0
+
+# Download engine: "pool" (thread per worker) or "async" (asyncio scheduler with a token
+# bucket of DOWNLOAD_BURST tokens refilled at DOWNLOAD_RATE_LIMIT, ASYNC_CONCURRENCY
+# requests in flight and at most ASYNC_PER_HOST_LIMIT of them to one host)
+DOWNLOAD_ENGINE = "pool"
+DOWNLOAD_BURST = 4
+ASYNC_CONCURRENCY = 16
+ASYNC_PER_HOST_LIMIT = 8
+
+# Browser sessions: up to BROWSER_POOL_SIZE warm Chromes are kept between downloads and
+# API requests and closed after BROWSER_IDLE_TIMEOUT seconds unused. A browser is
+# restarted after BROWSER_MAX_PAGES page loads or once its processes use more than
+# BROWSER_MAX_RSS_MB of memory. Images, fonts and CSS are disabled, and requests
+# matching BROWSER_BLOCKED_URLS (static assets, third-party ad and analytics scripts)
+# are blocked
+BROWSER_POOL_SIZE = DOWNLOAD_WORKERS
+BROWSER_IDLE_TIMEOUT = 600
+BROWSER_MAX_PAGES = 200
+BROWSER_MAX_RSS_MB = 1024
+BROWSER_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.css",
+    "*googlesyndication.com*", "*doubleclick.net*", "*google-analytics.com*",
+    "*googletagmanager.com*", "*googletagservices.com*", "*adservice.google.*",
+    "*facebook.net*", "*facebook.com/tr*", "*scorecardresearch.com*",
+]
+
+# Database connection pool (ignored for SQLite): connections kept open per process,
+# extra connections allowed under load, seconds to wait for a free connection, seconds
+# after which a connection is replaced, and whether to test connections before use
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# Rows per batch (and transaction) of the bulk loader
+DB_BULK_BATCH_SIZE = 10000
+
+# Empty week columns reserved in the memory-mapped panel so new weeks can be added in place
+PANEL_SPARE_WEEKS = 104
+
+# Parallel execution (opt-in); None lets the pool use every CPU core
+PARALLEL_WORKERS = None
+PARALLEL_CHUNK_SIZE = 16
 
 # ChromeDriver path
 CHROMEDRIVER_PATH = RESOURCES_DIR / "chromedriver"
@@ -32,6 +129,11 @@ if __name__ == "__main__":
     print(f"DATA_DIR: {DATA_DIR}")
     print(f"STOCK_DATA_DIR: {STOCK_DATA_DIR}")
     print(f"RESULTS_DIR: {RESULTS_DIR}")
+    print(f"MR_STATE_DIR: {MR_STATE_DIR}")
+    print(f"BACKTEST_CACHE_DIR: {BACKTEST_CACHE_DIR}")
+    print(f"RAW_CACHE_DIR: {RAW_CACHE_DIR}")
+    print(f"JOURNAL_DIR: {JOURNAL_DIR}")
+    print(f"PANEL_DIR: {PANEL_DIR}")
     print(f"DOWNLOAD_DIR: {DOWNLOAD_DIR}")
     print(f"RESOURCES_DIR: {RESOURCES_DIR}")
     print(f"INPUT_STOCK_DIR: {INPUT_STOCK_DIR}")
@@ -39,6 +141,10 @@ if __name__ == "__main__":
 
     print(f"PROCESS_DATA_PATH: {PROCESS_DATA_PATH}")
     print(f"OUTPUT_DATA_PATH: {OUTPUT_DATA_PATH}")
+    print(f"SWEEP_OUTPUT_PATH: {SWEEP_OUTPUT_PATH}")
+    print(f"WALK_FORWARD_OUTPUT_PATH: {WALK_FORWARD_OUTPUT_PATH}")
     print(f"STOCK_NUMBERS_PATH: {STOCK_NUMBERS_PATH}")
+    print(f"DOWNLOAD_MANIFEST_PATH: {DOWNLOAD_MANIFEST_PATH}")
+    print(f"TRADING_HOLIDAYS_PATH: {TRADING_HOLIDAYS_PATH}")
     print(f"WEB_CHROMEDRIVER_PATH: {WEB_CHROMEDRIVER_PATH}")
     print(f"CHROMEDRIVER_PATH: {CHROMEDRIVER_PATH}")
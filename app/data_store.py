@@ -0,0 +1,245 @@
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from app.config import DATA_STORE_FORMAT
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Columns that hold week codes or stock IDs and must stay as text
+TEXT_COLUMNS = {"Date", "End Date", "Stock ID"}
+EXTENSIONS = {"parquet": ".parquet", "feather": ".feather", "csv": ".csv"}
+
+
+def store_format():
+    """Returns the configured store format, falling back to CSV when pyarrow is missing."""
+    if DATA_STORE_FORMAT in ("parquet", "feather") and not HAS_PYARROW:
+        return "csv"
+    return DATA_STORE_FORMAT
+
+
+if store_format() != DATA_STORE_FORMAT:
+    logging.warning(f"pyarrow is not installed; storing data as CSV instead of {DATA_STORE_FORMAT}.")
+
+
+def stock_path(data_dir, name, fmt=None):
+    """Returns the path of a stock's partition in the given format."""
+    return Path(data_dir) / f"{name}{EXTENSIONS[fmt or store_format()]}"
+
+
+def find_stock_file(data_dir, name):
+    """Returns the existing partition for a stock, preferring the configured format, or None."""
+    preferred = store_format()
+    for fmt in [preferred] + [fmt for fmt in EXTENSIONS if fmt != preferred]:
+        if fmt != "csv" and not HAS_PYARROW:
+            continue
+        path = stock_path(data_dir, name, fmt)
+        if path.exists():
+            return path
+    return None
+
+
+def stored_names(data_dir):
+    """
+    Names of all partitions in a store, from one directory listing.
+
+    Returns:
+    - names (set): Partition names that `find_stock_file` would find.
+    """
+    data_dir = Path(data_dir)
+    if not data_dir.is_dir():
+        return set()
+    suffixes = tuple(EXTENSIONS[fmt] for fmt in EXTENSIONS if fmt == "csv" or HAS_PYARROW)
+    names = set()
+    for entry in os.scandir(data_dir):
+        if entry.name.endswith(suffixes) and entry.is_file():
+            names.add(os.path.splitext(entry.name)[0])
+    return names
+
+
+def stock_exists(data_dir, name):
+    """Checks whether a stock has a partition in the store."""
+    return find_stock_file(data_dir, name) is not None
+
+
+def to_typed(dataframe):
+    """
+    Converts every non-week-code column to float where this loses nothing.
+
+    A column is converted only if all of its non-empty values parse as numbers, so text
+    such as thousands-separated figures is kept exactly as downloaded.
+    """
+    dataframe = dataframe.copy()
+    for column in dataframe.columns:
+        if column not in TEXT_COLUMNS:
+            try:
+                dataframe[column] = pd.to_numeric(dataframe[column]).astype("float64")
+                continue
+            except (ValueError, TypeError):
+                pass
+        dataframe[column] = dataframe[column].map(lambda value: value if pd.isna(value) else str(value))
+    return dataframe
+
+
+def _read_file(path):
+    suffix = Path(path).suffix
+    if suffix == ".parquet":
+        return pd.read_parquet(path)
+    if suffix == ".feather":
+        return pd.read_feather(path)
+    return pd.read_csv(path)
+
+
+def read_stock(data_dir, name):
+    """
+    Reads one stock's partition from the store.
+
+    Args:
+    - data_dir (str or Path): Store directory (e.g. DOWNLOAD_DIR or STOCK_DATA_DIR).
+    - name (str): Partition name, usually the stock ID.
+
+    Returns:
+    - dataframe (pd.DataFrame): The stored data, or None if missing or unreadable.
+    """
+    path = find_stock_file(data_dir, name)
+    if path is None:
+        return None
+    try:
+        return _read_file(path)
+    except Exception as e:
+        print(f"Error reading stored data {path}: {e}")
+        return None
+
+
+def write_stock(dataframe, data_dir, name):
+    """
+    Writes one stock's partition to the store with typed columns.
+
+    Partitions of the same stock in other formats are removed so reads never see
+    stale data, and so is the store's consolidated dataset, which no longer matches
+    the partitions; `consolidate_store` rebuilds it.
+
+    Args:
+    - dataframe (pd.DataFrame): Data to store.
+    - data_dir (str or Path): Store directory.
+    - name (str): Partition name, usually the stock ID.
+
+    Returns:
+    - path (Path): The written file, or None on error.
+    """
+    fmt = store_format()
+    path = stock_path(data_dir, name, fmt)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        typed = to_typed(dataframe).reset_index(drop=True)
+        if fmt == "parquet":
+            typed.to_parquet(tmp_path, index=False)
+        elif fmt == "feather":
+            typed.to_feather(tmp_path)
+        else:
+            typed.to_csv(tmp_path, index=False, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+        for other in EXTENSIONS:
+            other_path = stock_path(data_dir, name, other)
+            if other != fmt and other_path.exists():
+                other_path.unlink()
+        consolidated = consolidated_path(data_dir)
+        if consolidated.exists():
+            consolidated.unlink()
+            logging.info(f"Removed consolidated dataset {consolidated}, which no longer matches {path}.")
+        return path
+    except Exception as e:
+        print(f"Error saving stored data to {path}: {e}")
+        return None
+
+
+def merge_weeks(stored, fetched):
+    """
+    Merges newly fetched weeks into a stock's stored data.
+
+    Both frames are newest-first with a "Date" column of week codes. Fetched rows
+    replace stored rows of the same week, so a partially downloaded last week is
+    overwritten by its final values.
+
+    Args:
+    - stored (pd.DataFrame): The stored data, or None.
+    - fetched (pd.DataFrame): The newly downloaded tail.
+
+    Returns:
+    - merged (pd.DataFrame): Fetched rows followed by the older stored rows.
+    """
+    if stored is None or stored.empty:
+        return fetched.reset_index(drop=True)
+    older = stored[~stored["Date"].astype(str).isin(set(fetched["Date"].astype(str)))]
+    return pd.concat([fetched, older], ignore_index=True)
+
+
+def consolidated_path(data_dir):
+    """Returns the path of the single-file dataset built from a store directory."""
+    data_dir = Path(data_dir)
+    return data_dir.parent / f"{data_dir.name}.parquet"
+
+
+def consolidate_store(data_dir, names=None, output_path=None):
+    """
+    Combines every partition of a store into one Parquet dataset with a "Stock ID" column.
+
+    Args:
+    - data_dir (str or Path): Store directory.
+    - names (list): Partitions to include. Default is every partition in the directory.
+    - output_path (str or Path): Where to write the dataset. Default is next to `data_dir`.
+
+    Returns:
+    - output_path (Path): The written dataset.
+    """
+    output_path = Path(output_path or consolidated_path(data_dir))
+    if names is None:
+        names = sorted({path.stem for path in Path(data_dir).iterdir()
+                        if path.suffix in EXTENSIONS.values() and not path.name.startswith(".")})
+
+    frames = []
+    for name in names:
+        dataframe = read_stock(data_dir, name)
+        if dataframe is None:
+            continue
+        frames.append(dataframe.assign(**{"Stock ID": str(name)}))
+
+    dataset = to_typed(pd.concat(frames, ignore_index=True)) if frames else pd.DataFrame(columns=["Stock ID"])
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    dataset.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, output_path)
+    logging.info(f"Consolidated {len(frames)} partitions from {data_dir} into {output_path}.")
+    return output_path
+
+
+def read_consolidated(data_dir, names=None):
+    """
+    Reads partitions from the consolidated dataset of a store directory.
+
+    Args:
+    - data_dir (str or Path): Store directory the dataset was built from.
+    - names (list): Partitions to load. Default is all of them.
+
+    Returns:
+    - frames (dict): {name: DataFrame} in the stored row order, or None if the dataset
+      has not been built (or was invalidated by `write_stock`) or cannot be read.
+    """
+    path = consolidated_path(data_dir)
+    if not path.exists():
+        return None
+    filters = [("Stock ID", "in", [str(name) for name in names])] if names is not None else None
+    try:
+        dataset = pd.read_parquet(path, filters=filters)
+    except Exception as e:
+        logging.warning(f"Error reading consolidated dataset {path}: {e}")
+        return None
+    return {name: frame.drop(columns="Stock ID").reset_index(drop=True)
+            for name, frame in dataset.groupby("Stock ID", sort=False)}
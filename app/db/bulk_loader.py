@@ -0,0 +1,145 @@
+import csv
+import io
+import logging
+import math
+import time
+
+from sqlalchemy import insert
+
+from app.config import DB_BULK_BATCH_SIZE
+from app.db.db_models import Stock_Prices_Weekly
+
+# Columns loaded, in the order of the rows built by `iter_row_batches`
+LOAD_COLUMNS = ["stock_id", "date", "price", "EPS", "PER"]
+
+
+def _cell(value):
+    """Converts a DataFrame value to a DB-API value, with NaN as None."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def iter_row_batches(frames, batch_size=DB_BULK_BATCH_SIZE, columns=LOAD_COLUMNS):
+    """
+    Streams typed row tuples from DataFrames in batches.
+
+    Args:
+    - frames (iterable): DataFrames with the `columns`, e.g. from `prepare_stock_frame`.
+    - batch_size (int): Rows per batch.
+    - columns (list): Columns to take, in row order.
+
+    Yields:
+    - batch (list): Up to `batch_size` tuples of plain Python values.
+    """
+    batch = []
+    for df in frames:
+        if df is None or df.empty:
+            continue
+        for row in zip(*(df[column].tolist() for column in columns)):
+            batch.append(tuple(_cell(value) for value in row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _column_list(engine, table, columns):
+    quote = engine.dialect.identifier_preparer.quote
+    return ", ".join(quote(table.c[column].name) for column in columns)
+
+
+def _load_sqlite(connection, engine, table, batch, columns):
+    sql = (f"INSERT OR IGNORE INTO {table.name} ({_column_list(engine, table, columns)}) "
+           f"VALUES ({', '.join('?' for _ in columns)})")
+    cursor = connection.cursor()
+    cursor.executemany(sql, [tuple(v.isoformat() if hasattr(v, "isoformat") else v for v in row)
+                             for row in batch])
+    return cursor.rowcount
+
+
+def _load_postgresql(connection, engine, table, batch, columns):
+    # COPY into a session-local staging table, then move the rows over, skipping keys
+    # already in the table
+    staging = f"{table.name}_load"
+    column_list = _column_list(engine, table, columns)
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+                   f"(LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(["" if value is None else value for value in row])
+    buffer.seek(0)
+    copy_sql = f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+    if engine.dialect.driver == "psycopg2":
+        cursor.copy_expert(copy_sql, buffer)
+    else:
+        with cursor.copy(copy_sql) as copy:
+            copy.write(buffer.getvalue())
+
+    primary_key = ", ".join(engine.dialect.identifier_preparer.quote(c.name) for c in table.primary_key)
+    cursor.execute(f"INSERT INTO {table.name} ({column_list}) SELECT {column_list} FROM {staging} "
+                   f"ON CONFLICT ({primary_key}) DO NOTHING")
+    return cursor.rowcount
+
+
+def bulk_load(engine, frames, batch_size=DB_BULK_BATCH_SIZE, model=Stock_Prices_Weekly, columns=LOAD_COLUMNS):
+    """
+    Inserts DataFrame rows into a table in batches, skipping rows whose key already exists.
+
+    Each batch is committed on its own, so a failing batch does not undo earlier ones
+    and duplicate keys are skipped instead of failing the load. PostgreSQL loads each
+    batch with COPY into a staging table followed by INSERT ... ON CONFLICT DO NOTHING;
+    SQLite uses one executemany of INSERT OR IGNORE. Other databases get batched
+    executemany inserts without conflict skipping.
+
+    Args:
+    - engine (sqlalchemy.Engine): Database to load into.
+    - frames (iterable): DataFrames with the `columns`.
+    - batch_size (int): Rows per batch and transaction.
+    - model (class): ORM model of the target table.
+    - columns (list): Model attributes loaded, in row order.
+
+    Returns:
+    - stats (dict): {"rows", "inserted", "skipped", "batches", "seconds", "rows_per_second"}.
+    """
+    table = model.__table__
+    dialect = engine.dialect.name
+    started = time.perf_counter()
+    rows = inserted = batches = 0
+
+    for batch in iter_row_batches(frames, batch_size, columns):
+        if dialect in ("sqlite", "postgresql"):
+            connection = engine.raw_connection()
+            try:
+                load = _load_sqlite if dialect == "sqlite" else _load_postgresql
+                count = load(connection, engine, table, batch, columns)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.close()
+        else:
+            with engine.begin() as connection:
+                count = connection.execute(insert(table), [dict(zip(columns, row)) for row in batch]).rowcount
+        rows += len(batch)
+        inserted += max(count, 0)
+        batches += 1
+        logging.debug(f"Loaded batch {batches}: {count} of {len(batch)} rows inserted.")
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "rows": rows,
+        "inserted": inserted,
+        "skipped": rows - inserted,
+        "batches": batches,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds) if seconds > 0 else 0,
+    }
+    logging.info(f"Bulk loaded {inserted} of {rows} rows into {table.name} in {seconds:.1f}s "
+                 f"({stats['rows_per_second']:,} rows/s, {stats['skipped']} existing rows skipped).")
+    return stats
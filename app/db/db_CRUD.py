@@ -1,12 +1,18 @@
+import numpy as np
 import pandas as pd
 import logging
+import threading
 import warnings
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, desc
+from sqlalchemy.orm import sessionmaker, scoped_session
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import Float, cast, create_engine, desc, func, select
 from app.db.db_models import Stock_Prices_Weekly
-from app.helpers import parse_custom_date
-from app.config import DOWNLOAD_DIR
-from app.helpers import read_csv
+from app.helpers import parse_custom_dates
+from app.config import (DOWNLOAD_DIR, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+                        DB_POOL_PRE_PING, DB_BULK_BATCH_SIZE)
+from app.db.bulk_loader import bulk_load
+from app.data_store import read_stock, stock_exists
+from app.result_cache import backtest_cache
 
 # Suppress warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -17,13 +23,54 @@ logging.basicConfig(level=logging.WARNING)
 logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 
 
+def _stock_id_keys(stock_ids):
+    """
+    Maps the stored value of each stock ID to the IDs as given.
+
+    Stock IDs are stored as Numeric, so rows are matched on their decimal value.
+    """
+    keys = {}
+    for stock_id in stock_ids:
+        try:
+            keys.setdefault(Decimal(str(stock_id)), []).append(stock_id)
+        except InvalidOperation:
+            logging.warning(f"Skipping invalid stock ID {stock_id!r}.")
+    return keys
+
+
+def _float_columns(table):
+    """Price, EPS and PER cast to float in SQL, so the driver returns floats instead of Decimal."""
+    return [cast(table.c[name], Float).label(name) for name in ("price", "EPS", "PER")]
+
+
+def _column_arrays(dates, prices, eps, per):
+    """Builds the {"date", "price", "EPS", "PER"} NumPy arrays of fetched columns, NULL as NaN."""
+    return {
+        "date": np.array(dates, dtype=object),
+        "price": np.array(prices, dtype=float),
+        "EPS": np.array(eps, dtype=float),
+        "PER": np.array(per, dtype=float),
+    }
+
+
 class CRUDHelper:
+    """
+    Database access shared by the API, the update scripts and the backtests.
+
+    One instance per process owns the engine and its connection pool. Sessions are
+    scoped to the calling thread, so concurrent requests under threaded gunicorn
+    workers each get their own session; methods release it with `remove_session()`
+    when they are done, returning the connection to the pool.
+    """
     _instance = None  # Class-level attribute for singleton instance
+    _instance_lock = threading.Lock()
 
     def __new__(cls, database_url=None):
-        if cls._instance is None:
-            cls._instance = super(CRUDHelper, cls).__new__(cls)
-            cls._instance._init(database_url)
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(CRUDHelper, cls).__new__(cls)
+                instance._init(database_url)
+                cls._instance = instance
         return cls._instance
 
     def _init(self, database_url):
@@ -33,9 +80,37 @@ class CRUDHelper:
         if database_url.startswith("postgres://"):
             database_url = database_url.replace(
                 "postgres://", "postgresql://", 1)
-        self.engine = create_engine(database_url, echo=False)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        engine_options = {"echo": False, "pool_pre_ping": DB_POOL_PRE_PING}
+        # SQLite picks its own pool class, which may not take these settings
+        if not database_url.startswith("sqlite"):
+            engine_options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                  pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE)
+        self.engine = create_engine(database_url, **engine_options)
+        self.Session = scoped_session(sessionmaker(bind=self.engine))
+
+    @property
+    def session(self):
+        """The calling thread's session."""
+        return self.Session()
+
+    def remove_session(self):
+        """Close the calling thread's session and return its connection to the pool."""
+        self.Session.remove()
+
+    def pool_status(self):
+        """
+        Connection pool statistics.
+
+        Returns:
+        - status (dict): Pool class and, for pools that track them, its size and the
+          connections checked in, checked out and in overflow.
+        """
+        pool = self.engine.pool
+        status = {"pool": type(pool).__name__, "status": pool.status()}
+        for key in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, key):
+                status[key] = getattr(pool, key)()
+        return status
 
     def get_latest_stock_info(self, stock_id):
         """Fetch the latest stock information for a given stock symbol."""
@@ -51,7 +126,83 @@ class CRUDHelper:
             logging.error(f"Error fetching latest stock info: {e}")
             return None
         finally:
-            self.session.close()
+            self.remove_session()
+
+    def get_stock_columns(self, stock_id, limit=None, offset=0):
+        """
+        Fetch a stock's weeks, newest first, as column arrays.
+
+        A core SELECT of (date, price, EPS, PER) with the prices cast to float in SQL,
+        so no ORM objects or Decimal values are built.
+
+        Args:
+        - stock_id (str or int): Stock to fetch.
+        - limit (int): Maximum weeks. Default is all.
+        - offset (int): Newest weeks to skip.
+
+        Returns:
+        - columns (dict): {"date", "price", "EPS", "PER"} NumPy arrays, or None on error.
+        """
+        logging.info(f"Fetching stock columns for {stock_id}")
+        table = Stock_Prices_Weekly.__table__
+        query = (
+            select(table.c.date, *_float_columns(table))
+            .where(table.c.stock_id == stock_id)
+            .order_by(table.c.date.desc())
+            .limit(limit)
+            .offset(offset or None)
+        )
+        try:
+            rows = self.session.execute(query).all()
+            return _column_arrays(*zip(*rows)) if rows else _column_arrays([], [], [], [])
+        except Exception as e:
+            logging.error(f"Error fetching stock columns: {e}")
+            return None
+        finally:
+            self.remove_session()
+
+    def get_stock_frame(self, stock_id, limit=None, offset=0):
+        """
+        Fetch a stock's weeks, newest first, as a DataFrame; see `get_stock_columns`.
+
+        Returns:
+        - df (pd.DataFrame): date, price, EPS and PER columns (floats), or None on error.
+        """
+        columns = self.get_stock_columns(stock_id, limit, offset)
+        return None if columns is None else pd.DataFrame(columns)
+
+    def get_latest_dates(self, stock_ids, chunk_size=1000):
+        """
+        Fetch the latest stored date of many stocks with one grouped query per chunk.
+
+        Args:
+        - stock_ids (list): Stocks to look up, as str or int.
+        - chunk_size (int): Stocks per query, to keep IN lists within database limits.
+
+        Returns:
+        - latest_dates (dict): {stock_id: date} keyed by the given IDs; stocks with no
+          rows are left out.
+        """
+        logging.info(f"Fetching latest dates for {len(stock_ids)} stocks")
+        keys = _stock_id_keys(stock_ids)
+        values = list(keys)
+        latest_dates = {}
+        try:
+            for start in range(0, len(values), chunk_size):
+                query = (
+                    select(Stock_Prices_Weekly.stock_id, func.max(Stock_Prices_Weekly.date))
+                    .where(Stock_Prices_Weekly.stock_id.in_(values[start:start + chunk_size]))
+                    .group_by(Stock_Prices_Weekly.stock_id)
+                )
+                for stored_id, latest_date in self.session.execute(query):
+                    for stock_id in keys.get(Decimal(stored_id), []):
+                        latest_dates[stock_id] = latest_date
+            return latest_dates
+        except Exception as e:
+            logging.error(f"Error fetching latest dates: {e}")
+            return None
+        finally:
+            self.remove_session()
 
     def get_all_stock_info(self, stock_id):
         """Fetch all stock information for a given stock symbol."""
@@ -67,7 +218,7 @@ class CRUDHelper:
             logging.error(f"Error fetching all stock info: {e}")
             return None
         finally:
-            self.session.close()
+            self.remove_session()
 
     def get_5_years_stock_info(self, stock_id):
         """Fetch 5 years of stock information for a given stock symbol."""
@@ -84,71 +235,171 @@ class CRUDHelper:
             logging.error(f"Error fetching 5 years of stock info: {e}")
             return None
         finally:
-            self.session.close()
+            self.remove_session()
 
-    def update_stock_data(self, stock_id):
-        """Prepare missing stock data for insertion."""
-        stock_file_path = DOWNLOAD_DIR / f"{stock_id}.csv"
+    def get_recent_stock_histories(self, stock_ids, weeks=260, chunk_size=1000):
+        """
+        Fetch the last `weeks` weeks of many stocks with one windowed query per chunk.
+
+        Rows are numbered per stock with ROW_NUMBER() OVER (PARTITION BY stock_id
+        ORDER BY date DESC) and only the first `weeks` of each stock are returned, read
+        as plain tuples with prices cast to float in SQL and grouped into column arrays
+        without ORM objects or Decimal values.
+
+        Args:
+        - stock_ids (list): Stocks to fetch, as str or int.
+        - weeks (int): Most recent weeks per stock.
+        - chunk_size (int): Stocks per query, to keep IN lists within database limits.
+
+        Returns:
+        - histories (dict): {stock_id: {"date", "price", "EPS", "PER"}} keyed by the
+          given IDs, each a NumPy array in date order (oldest first; prices and ratios
+          as float with NaN for NULL); stocks with no rows are left out.
+        """
+        logging.info(f"Fetching {weeks} weeks of stock info for {len(stock_ids)} stocks")
+        keys = _stock_id_keys(stock_ids)
+        values = list(keys)
+        table = Stock_Prices_Weekly.__table__
+        histories = {}
+        try:
+            for start in range(0, len(values), chunk_size):
+                row_number = func.row_number().over(
+                    partition_by=table.c.stock_id, order_by=table.c.date.desc()).label("row_number")
+                ranked = (
+                    select(table.c.stock_id, table.c.date, *_float_columns(table), row_number)
+                    .where(table.c.stock_id.in_(values[start:start + chunk_size]))
+                    .subquery()
+                )
+                query = (
+                    select(ranked.c.stock_id, ranked.c.date, ranked.c.price, ranked.c.EPS, ranked.c.PER)
+                    .where(ranked.c.row_number <= weeks)
+                    .order_by(ranked.c.stock_id, ranked.c.date)
+                )
+                rows = self.session.execute(query).all()
+                if not rows:
+                    continue
+
+                stored_ids, *fetched = zip(*rows)
+                columns = _column_arrays(*fetched)
+                # Rows are ordered by stock, so each stock is one contiguous slice
+                boundaries = [0] + [i for i in range(1, len(rows)) if stored_ids[i] != stored_ids[i - 1]] + [len(rows)]
+                for begin, end in zip(boundaries[:-1], boundaries[1:]):
+                    history = {name: column[begin:end] for name, column in columns.items()}
+                    for stock_id in keys.get(Decimal(stored_ids[begin]), []):
+                        histories[stock_id] = history
+            return histories
+        except Exception as e:
+            logging.error(f"Error fetching stock histories: {e}")
+            return None
+        finally:
+            self.remove_session()
+
+    def prepare_stock_frame(self, stock_id, latest_dates=None):
+        """
+        Prepare the downloaded weeks of a stock that are not in the database yet.
+
+        Args:
+        - stock_id (str or int): Stock to prepare.
+        - latest_dates (dict): Latest stored dates from `get_latest_dates`, so no query
+          is made for the stock. Default is to query it.
+
+        Returns:
+        - df (pd.DataFrame): Typed rows with the `Stock_Prices_Weekly` columns stock_id,
+          date, price, EPS and PER; empty if the database is up to date, None if the
+          stock file is missing or unreadable.
+        """
+        stock_file_path = DOWNLOAD_DIR / f"{stock_id}"
 
         # Check if the stock file exists
-        if not stock_file_path.exists():
+        if not stock_exists(DOWNLOAD_DIR, stock_id):
             logging.error(f"Stock file {stock_file_path} not found. Please ensure data is downloaded.")
-            return []
+            return None
 
         try:
-            # Fetch the latest stock info
-            latest_stock = self.get_latest_stock_info(stock_id)
+            # Fetch the latest stored date
+            if latest_dates is None:
+                latest_stock = self.get_latest_stock_info(stock_id)
+                latest_date = latest_stock.date if latest_stock else None
+            else:
+                latest_date = latest_dates.get(stock_id)
 
             # Read and parse the downloaded data
-            df = read_csv(stock_file_path)
-            df['Date'] = df['Date'].apply(parse_custom_date)
-            df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
-            df['EPS'] = pd.to_numeric(df['EPS'], errors='coerce')
-            df['PER'] = pd.to_numeric(df['PER'], errors='coerce')
-
-            # If no data exists in the database, return all rows as missing
-            if not latest_stock:
+            raw = read_stock(DOWNLOAD_DIR, stock_id)
+            df = pd.DataFrame({
+                "stock_id": stock_id,
+                "date": parse_custom_dates(raw["Date"]),
+                "price": pd.to_numeric(raw["Price"], errors="coerce"),
+                "EPS": pd.to_numeric(raw["EPS"], errors="coerce"),
+                "PER": pd.to_numeric(raw["PER"], errors="coerce"),
+            })
+            # Rows without a valid week cannot be keyed
+            df = df[df["date"].notna()]
+
+            # If no data exists in the database, all rows are missing
+            if latest_date is None:
                 logging.info(f"No data for stock {stock_id} in the database. Preparing all rows for insertion.")
             else:
                 # Filter data to include only new entries
-                df = df[df['Date'] > latest_stock.date]
+                df = df[df["date"] > latest_date]
                 if df.empty:
                     logging.info(f"No new data for stock {stock_id}. Data is already up-to-date.")
-                    return []
-
-            # Create and return a list of Stock_Prices_Weekly objects
-            stock_records = [
-                Stock_Prices_Weekly(
-                    stock_id=stock_id,
-                    date=row['Date'],
-                    price=row['Price'],
-                    EPS=row['EPS'],
-                    PER=row['PER']
-                )
-                for _, row in df.iterrows()
-            ]
 
-            logging.info(f"Prepared {len(stock_records)} new records for stock {stock_id}.")
-            return stock_records
+            return df.reset_index(drop=True)
         except Exception as e:
             logging.error(f"Error preparing stock {stock_id}: {e}")
+            return None
+
+    def update_stock_data(self, stock_id):
+        """Prepare missing stock data for insertion."""
+        df = self.prepare_stock_frame(stock_id)
+        if df is None or df.empty:
             return []
 
-            
+        # Create and return a list of Stock_Prices_Weekly objects
+        stock_records = [
+            Stock_Prices_Weekly(**{column: (None if pd.isna(value) else value) for column, value in row.items()})
+            for row in df.to_dict("records")
+        ]
+        logging.info(f"Prepared {len(stock_records)} new records for stock {stock_id}.")
+        return stock_records
+
+    def bulk_load_stock_frames(self, frames, batch_size=DB_BULK_BATCH_SIZE):
+        """
+        Insert prepared stock frames in batches, skipping rows already in the database.
+
+        Args:
+        - frames (list): DataFrames from `prepare_stock_frame`.
+        - batch_size (int): Rows per batch and transaction.
+
+        Returns:
+        - stats (dict): Load statistics from `bulk_load`, or None if the load failed.
+        """
+        try:
+            stats = bulk_load(self.engine, frames, batch_size)
+        except Exception as e:
+            logging.error(f"Error bulk loading stock data: {e}")
+            return None
+        finally:
+            # Cached backtests of these stocks are now stale, including after a partial load
+            backtest_cache.invalidate({df["stock_id"].iloc[0] for df in frames if df is not None and not df.empty})
+        return stats
+
     def add_bulk_stock_data(self, stock_records):
         """Insert multiple stock records into the database in bulk."""
         try:
             self.session.bulk_save_objects(stock_records)
             self.session.commit()
             logging.info(f"Inserted {len(stock_records)} records into the database successfully.")
+            # Cached backtests of these stocks are now stale
+            backtest_cache.invalidate({record.stock_id for record in stock_records})
             return True
         except Exception as e:
             logging.error(f"Error inserting bulk stock data: {e}")
             self.session.rollback()
             return False
         finally:
-            self.session.close()
+            self.remove_session()
 
     def close(self):
         """Close the session."""
-        self.session.close()
+        self.remove_session()
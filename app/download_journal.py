@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app.config import JOURNAL_DIR, DOWNLOAD_MAX_ATTEMPTS, DOWNLOAD_RETRY_BACKOFF
+from app.trading_calendar import latest_trading_week_end
+
+# Job shared by the update-all CLI and API so progress carries across both
+UPDATE_ALL_JOB = "update_all"
+
+
+def _done_stocks(events):
+    """Stocks marked done or fresh since the latest "start" event."""
+    done = []
+    for event in events:
+        if event["event"] == "start":
+            done = []
+        elif event["event"] == "done":
+            done.append(event["stock"])
+        elif event["event"] == "fresh":
+            done.extend(event["stocks"])
+    return done
+
+
+class DownloadJournal:
+    """
+    Append-only checkpoint journal of one download job.
+
+    Each line is a JSON event: "start" with the job's stocks, target week and
+    full_refetch flag, "done" or "failed" per stock, "fresh" for the stocks that were
+    already up to date, "retry" before each retry round and "finish" at the end. Lines
+    are flushed and fsynced as they are written, so after a crash the journal tells
+    which stocks were completed and the next run of the same job resumes from there,
+    as long as it targets the same week with the same full_refetch flag.
+    """
+
+    def __init__(self, job, journal_dir=JOURNAL_DIR):
+        self.job = job
+        self.path = Path(journal_dir) / f"{job}.jsonl"
+        self._lock = threading.Lock()
+
+    def _append(self, event, **fields):
+        record = {"event": event, "at": datetime.now().isoformat(timespec="seconds"), **fields}
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def events(self):
+        """Returns the journal's events, skipping a line torn by a crash."""
+        if not self.path.exists():
+            return []
+        events = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping unreadable line in download journal {self.path}.")
+        return events
+
+    def status(self):
+        """
+        Summarizes the latest run of the job.
+
+        Returns:
+        - status (dict): {"job", "started_at", "target_week", "full_refetch", "finished",
+          "total", "done", "failed", "errors", "pending", "attempts"}, with stock lists for
+          "failed" and "pending" and the last error of each failed stock in "errors".
+        """
+        events = self.events()
+        status = {"job": self.job, "started_at": None, "target_week": None, "full_refetch": False,
+                  "finished": False, "total": 0, "done": 0, "failed": [], "errors": {}, "pending": [],
+                  "attempts": {}}
+        if not events:
+            return status
+
+        stocks, done, failed, attempts = [], set(), {}, {}
+        for event in events:
+            if event["event"] == "start":
+                stocks, done, failed, attempts = [str(s) for s in event["stocks"]], set(), {}, {}
+                status.update(started_at=event["at"], target_week=event.get("target_week"),
+                              full_refetch=event.get("full_refetch", False), finished=False)
+            elif event["event"] == "done":
+                done.add(event["stock"])
+                failed.pop(event["stock"], None)
+            elif event["event"] == "fresh":
+                done.update(event["stocks"])
+            elif event["event"] == "failed":
+                failed[event["stock"]] = event.get("error")
+                attempts[event["stock"]] = attempts.get(event["stock"], 0) + 1
+            elif event["event"] == "finish":
+                status["finished"] = True
+
+        failed_stocks = [s for s in stocks if s in failed and s not in done]
+        status.update(total=len(stocks), done=len(done), failed=failed_stocks,
+                      errors={s: failed[s] for s in failed_stocks},
+                      pending=[s for s in stocks if s not in done], attempts=attempts)
+        return status
+
+    def resume(self, stock_numbers, target_week, full_refetch=False):
+        """
+        Starts a run, or resumes the unfinished one if it targets the same data.
+
+        An unfinished run for another target week or full_refetch flag is not resumed:
+        its completed stocks may lack the week this run needs, or were only fetched
+        incrementally, so a new run is started instead.
+
+        Args:
+        - stock_numbers (list): Stocks the job covers.
+        - target_week (str): ISO date of the week-ending Friday the run downloads up to.
+        - full_refetch (bool): Whether the run re-fetches full histories.
+
+        Returns:
+        - pending (list): Stocks still to download, in the given order.
+        """
+        status = self.status()
+        if status["started_at"] and not status["finished"]:
+            if status["target_week"] == target_week and status["full_refetch"] == full_refetch:
+                completed = set(_done_stocks(self.events()))
+                pending = [s for s in stock_numbers if str(s) not in completed]
+                logging.info(f"Resuming download job '{self.job}' started at {status['started_at']}: "
+                             f"{len(stock_numbers) - len(pending)} done, {len(pending)} pending.")
+                return pending
+            logging.info(f"Not resuming download job '{self.job}' started at {status['started_at']} "
+                         f"for week {status['target_week']} (full_refetch={status['full_refetch']}).")
+
+        if self.path.exists():
+            os.replace(self.path, self.path.with_suffix(".jsonl.prev"))
+        self._append("start", stocks=list(stock_numbers), target_week=target_week, full_refetch=full_refetch)
+        logging.info(f"Started download job '{self.job}' for {len(stock_numbers)} stocks, "
+                     f"week ending {target_week}.")
+        return list(stock_numbers)
+
+    def mark_done(self, stock_number):
+        self._append("done", stock=str(stock_number))
+
+    def mark_fresh(self, stock_numbers):
+        """Marks stocks that were up to date and needed no download, in one event."""
+        self._append("fresh", stocks=[str(s) for s in stock_numbers])
+
+    def mark_failed(self, stock_number, error=None):
+        self._append("failed", stock=str(stock_number), error=str(error) if error else None)
+
+    def mark_retry(self, attempt, stock_numbers, delay):
+        self._append("retry", attempt=attempt, stocks=list(stock_numbers), delay=delay)
+
+    def finish(self, failed):
+        self._append("finish", failed=list(failed))
+
+
+def run_download_job(job, stock_numbers, download, full_refetch=False, max_attempts=DOWNLOAD_MAX_ATTEMPTS,
+                     backoff=DOWNLOAD_RETRY_BACKOFF, journal_dir=JOURNAL_DIR):
+    """
+    Runs a resumable download job with retries.
+
+    Stocks completed by an earlier, interrupted run of the same job are skipped, if that
+    run targeted the same trading week with the same `full_refetch`. Stocks that fail
+    are retried on their own, waiting `backoff`, 2 x `backoff`, ... seconds
+    between rounds, up to `max_attempts` rounds in total.
+
+    Args:
+    - job (str): Job name; runs with the same name share one journal.
+    - stock_numbers (list): Stocks to download.
+    - download (callable): download(stocks, journal) downloads stocks, marks each
+      completed one with `journal.mark_done` (or `mark_fresh` if it needed no download)
+      and each failed one with `journal.mark_failed` and its error, and returns the
+      failed stocks.
+    - full_refetch (bool): Whether `download` re-fetches full histories.
+    - max_attempts (int): Maximum download rounds.
+    - backoff (float): Wait before the first retry, in seconds.
+    - journal_dir (str or Path): Where the journal is kept.
+
+    Returns:
+    - error_stocks (list): Stocks that still failed after the last attempt.
+    """
+    journal = DownloadJournal(job, journal_dir)
+    pending = journal.resume(stock_numbers, latest_trading_week_end().isoformat(), full_refetch)
+
+    for attempt in range(1, max(1, max_attempts) + 1):
+        if not pending:
+            break
+        if attempt > 1:
+            delay = backoff * 2 ** (attempt - 2)
+            journal.mark_retry(attempt, pending, delay)
+            logging.info(f"Retrying {len(pending)} failed stocks in {delay:.0f}s (attempt {attempt}/{max_attempts}).")
+            time.sleep(delay)
+        pending = list(download(pending, journal))
+
+    journal.finish(pending)
+    if pending:
+        logging.warning(f"Download job '{job}' finished with {len(pending)} failed stocks: {pending}")
+    else:
+        logging.info(f"Download job '{job}' finished.")
+    return pending
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from app.helpers import *
+from app.config import (DOWNLOAD_DIR, DOWNLOAD_MANIFEST_PATH, HISTORY_START_DATE, FULL_REFETCH_INTERVAL_DAYS,
+                        MANIFEST_FLUSH_EVERY)
+from app.data_store import find_stock_file, read_stock, stored_names
+from app.trading_calendar import latest_trading_week_end, first_trading_day_of_week
+
+# Serializes read-modify-write cycles of the manifest within a process
+_manifest_lock = threading.Lock()
+
+
+@contextmanager
+def _locked_manifest(manifest_path):
+    """
+    Holds the manifest's locks for a read-modify-write cycle.
+
+    The thread lock covers this process; an exclusive flock on a sidecar ".lock" file
+    covers other processes, such as the CLI and the API updating the same store. Where
+    fcntl is not available, only the thread lock is taken.
+    """
+    manifest_path = Path(manifest_path)
+    with _manifest_lock:
+        if fcntl is None:
+            yield
+            return
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest_path.with_name(f"{manifest_path.name}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_manifest(manifest_path=DOWNLOAD_MANIFEST_PATH):
+    """
+    Loads the download manifest.
+
+    Returns:
+    - manifest (dict): {partition name: {"latest_week", "latest_date", "rows", "sha256",
+      "fetched_at", "full_fetched_at"}}, or an empty dict if there is no readable manifest.
+    """
+    manifest_path = Path(manifest_path)
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f"Error reading download manifest {manifest_path}: {e}. Ignoring it.")
+        return {}
+
+
+def _save_manifest(manifest, manifest_path):
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(f".{manifest_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def manifest_entry(dataframe, file_path, fetched_at=None, full_fetched_at=None):
+    """
+    Builds the manifest entry of a stored partition.
+
+    Args:
+    - dataframe (pd.DataFrame): The stored data, with a "Date" column of week codes.
+    - file_path (str or Path): The stored file, hashed as written.
+    - fetched_at (datetime): When the data was downloaded. Default is now.
+    - full_fetched_at (str): When the full history was last downloaded, in ISO format.
+      Default is `fetched_at`.
+
+    Returns:
+    - entry (dict): Latest week code and its Friday, row count, sha256 of the file,
+      fetch time and last full fetch time.
+    """
+    weeks = [(parsed, code) for parsed, code in zip(parse_custom_dates(dataframe["Date"]), dataframe["Date"])
+             if parsed is not None] if "Date" in dataframe else []
+    latest_date, latest_week = max(weeks) if weeks else (None, None)
+    with open(file_path, "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    fetched_at = (fetched_at or datetime.now()).isoformat(timespec="seconds")
+    return {
+        "latest_week": latest_week,
+        "latest_date": latest_date.isoformat() if latest_date else None,
+        "rows": int(len(dataframe)),
+        "sha256": sha256,
+        "fetched_at": fetched_at,
+        "full_fetched_at": full_fetched_at or fetched_at,
+    }
+
+
+def _merge_entries(updates, manifest_path):
+    """
+    Writes entries into the manifest in one locked read-modify-write.
+
+    Args:
+    - updates (list): (name, entry, inherit_full) tuples. With `inherit_full`, the
+      entry keeps the full fetch time already in the manifest, if there is one.
+    - manifest_path (str or Path): Manifest location.
+    """
+    with _locked_manifest(manifest_path):
+        manifest = load_manifest(manifest_path)
+        for name, entry, inherit_full in updates:
+            previous = manifest.get(name) or {}
+            if inherit_full and previous.get("full_fetched_at"):
+                entry["full_fetched_at"] = previous["full_fetched_at"]
+            manifest[name] = entry
+        _save_manifest(manifest, manifest_path)
+
+
+def record_download(name, dataframe, file_path, full=True, manifest_path=DOWNLOAD_MANIFEST_PATH,
+                    fetched_at=None, full_fetched_at=None):
+    """
+    Records a freshly stored partition in the manifest.
+
+    The manifest is re-read under a thread lock and, where fcntl is available, a file
+    lock, then replaced atomically, so downloaders in any thread or process never lose
+    each other's entries and readers never see a partial file. Downloads of many partitions should
+    use a `ManifestWriter`, which rewrites the manifest once per batch instead.
+
+    Args:
+    - name (str): Partition name, e.g. "2330" or "shareholder_2330".
+    - dataframe (pd.DataFrame): The data that was stored.
+    - file_path (str or Path): The file it was stored to.
+    - full (bool): Whether the full history was downloaded, rather than a delta.
+    - manifest_path (str or Path): Manifest location.
+    - fetched_at (datetime): When the data was downloaded. Default is now.
+    - full_fetched_at (str): Overrides the last full fetch time, in ISO format.
+
+    Returns:
+    - entry (dict): The recorded entry.
+    """
+    entry = manifest_entry(dataframe, file_path, fetched_at, full_fetched_at)
+    _merge_entries([(str(name), entry, full_fetched_at is None and not full)], manifest_path)
+    return entry
+
+
+class ManifestWriter:
+    """
+    Batches the manifest entries of a download run.
+
+    `record` takes the same arguments as `record_download`, but entries are written
+    every `flush_every` partitions and on `flush()`, so a run rewrites the manifest
+    once per batch rather than once per stock. Meant for the single writer thread of a
+    download; use it as a context manager so the last batch is written even if the
+    run fails. Entries of a crashed run that were not flushed yet only make those
+    stocks look stale, so the next run downloads them again; anything that must not run
+    before the entry is written, such as journaling the stock as done, goes in
+    `on_written`.
+    """
+
+    def __init__(self, manifest_path=DOWNLOAD_MANIFEST_PATH, flush_every=MANIFEST_FLUSH_EVERY):
+        self.manifest_path = manifest_path
+        self.flush_every = max(1, flush_every or 1)
+        self._pending = []
+
+    def record(self, name, dataframe, file_path, full=True, fetched_at=None, full_fetched_at=None,
+               on_written=None):
+        """Queues the entry of a stored partition and returns it; `on_written()` runs once it is written."""
+        entry = manifest_entry(dataframe, file_path, fetched_at, full_fetched_at)
+        self._pending.append((str(name), entry, full_fetched_at is None and not full, on_written))
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+        return entry
+
+    def flush(self):
+        """Writes the queued entries to the manifest."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        _merge_entries([update[:3] for update in pending], self.manifest_path)
+        logging.debug(f"Wrote {len(pending)} entries to the download manifest.")
+        for *_, on_written in pending:
+            if on_written is not None:
+                on_written()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+def download_start_date(name, manifest, full_refetch=False, data_dir=DOWNLOAD_DIR):
+    """
+    Chooses the START_DT of a download: the full history or only the newest weeks.
+
+    A delta download starts at the first trading day of the latest stored week, so a
+    week stored while still in progress is fetched again. The full history is fetched when asked
+    to, when nothing usable is stored, or when the last full download is older than
+    FULL_REFETCH_INTERVAL_DAYS, so revised history is eventually picked up.
+
+    Args:
+    - name (str): Partition name.
+    - manifest (dict): Manifest from `load_manifest`.
+    - full_refetch (bool): Force a full download.
+    - data_dir (str or Path): Store directory the manifest describes.
+
+    Returns:
+    - (start_date, full) (tuple): Start date as YYYY-MM-DD, and whether it is a full download.
+    """
+    entry = manifest.get(str(name))
+    if full_refetch or not entry or not entry.get("latest_date") or find_stock_file(data_dir, name) is None:
+        return HISTORY_START_DATE, True
+    full_fetched_at = entry.get("full_fetched_at") or entry.get("fetched_at")
+    if datetime.now() - datetime.fromisoformat(full_fetched_at) > timedelta(days=FULL_REFETCH_INTERVAL_DAYS):
+        return HISTORY_START_DATE, True
+    return first_trading_day_of_week(date.fromisoformat(entry["latest_date"])).isoformat(), False
+
+
+def _backfill_entries(names, manifest_path, data_dir):
+    """Adds manifest entries for partitions stored before the manifest existed."""
+    entries = {}
+    for name in names:
+        file_path = find_stock_file(data_dir, name)
+        df = read_stock(data_dir, name)
+        if file_path is None or df is None:
+            continue
+        fetched_at = datetime.fromtimestamp(os.path.getmtime(file_path))
+        entries[name] = manifest_entry(df, file_path, fetched_at)
+    if entries:
+        _merge_entries([(name, entry, False) for name, entry in entries.items()], manifest_path)
+        logging.info(f"Added {len(entries)} existing partitions to the download manifest.")
+    return entries
+
+
+def is_entry_fresh(entry, as_of=None):
+    """Checks whether a manifest entry has data up to the latest trading week (or `as_of`)."""
+    if not entry or not entry.get("rows") or not entry.get("latest_date"):
+        return False
+    return date.fromisoformat(entry["latest_date"]) >= (as_of or latest_trading_week_end())
+
+
+def stale_stocks(stock_numbers, prefix="", manifest_path=DOWNLOAD_MANIFEST_PATH, data_dir=DOWNLOAD_DIR):
+    """
+    Finds the stocks whose downloaded data is missing or out of date.
+
+    Freshness is read from the manifest in one go instead of parsing every stored file,
+    and the stored partitions from one listing of `data_dir`. Stored partitions the
+    manifest does not know about yet are read once and added. A
+    stock is fresh once it has the latest week with trading, so market holidays do not
+    make every stock stale.
+
+    Args:
+    - stock_numbers (list): Stocks to check.
+    - prefix (str): Partition name prefix, e.g. "shareholder_".
+    - manifest_path (str or Path): Manifest location.
+    - data_dir (str or Path): Store directory the manifest describes.
+
+    Returns:
+    - stale (list): Stocks to download, those never downloaded first, then by oldest
+      latest week; ties keep the given order.
+    """
+    manifest = load_manifest(manifest_path)
+    unknown = [f"{prefix}{s}" for s in stock_numbers if f"{prefix}{s}" not in manifest]
+    if unknown:
+        manifest.update(_backfill_entries(unknown, manifest_path, data_dir))
+
+    as_of = latest_trading_week_end()
+    stored = stored_names(data_dir)
+    stale = []
+    for stock_number in stock_numbers:
+        name = f"{prefix}{stock_number}"
+        if not is_entry_fresh(manifest.get(name), as_of) or name not in stored:
+            stale.append(stock_number)
+    stale.sort(key=lambda s: (manifest.get(f"{prefix}{s}") or {}).get("latest_date") or "")
+    logging.info(f"{len(stale)} of {len(stock_numbers)} stocks need downloading.")
+    return stale
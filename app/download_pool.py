@@ -0,0 +1,144 @@
+import logging
+import queue
+import threading
+import time
+
+from halo import Halo
+
+from app.config import DOWNLOAD_WORKERS, DOWNLOAD_RATE_LIMIT
+
+# Marks the end of the work queue for one worker, and of one worker's results for the writer
+_DONE = object()
+
+
+class RateLimiter:
+    """
+    Global politeness limit shared by every download worker.
+
+    Request start times are spaced at least 1 / `rate` seconds apart across all threads.
+    A rate of None or 0 disables the limit.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller may start its next request."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+def run_download_pool(items, make_driver, fetch, store, workers=DOWNLOAD_WORKERS,
+                      rate_limit=DOWNLOAD_RATE_LIMIT, description="Downloading", on_error=None):
+    """
+    Downloads items with a pool of workers fed from a shared queue.
+
+    Each worker thread owns one fetcher from `make_driver` and takes items from the
+    queue until it is empty. Fetched data goes to a single writer thread, so the store
+    and the manifest are only ever written by one thread.
+
+    Args:
+    - items (list): Items to download, e.g. stock numbers.
+    - make_driver (callable): Returns a new browser or client with a `quit()` method;
+      called once per worker.
+    - fetch (callable): fetch(driver, item) downloads one item and returns its data.
+    - store (callable): store(item, data) saves one item; runs in the writer thread.
+    - workers (int): Number of workers.
+    - rate_limit (float): Maximum page loads per second across all workers.
+    - description (str): Spinner text.
+    - on_error (callable): on_error(item, error) is called with each failure, e.g. to
+      journal it.
+
+    Returns:
+    - error_items (list): Items that failed to download or store, in input order.
+    """
+    workers = max(1, min(workers or 1, len(items) or 1))
+    limiter = RateLimiter(rate_limit)
+    work = queue.Queue()
+    results = queue.Queue()
+    errors = set()
+    errors_lock = threading.Lock()
+    for item in items:
+        work.put(item)
+    for _ in range(workers):
+        work.put(_DONE)
+
+    def fail(item, stage, e):
+        logging.error(f"Error {stage} {item}: {e}")
+        with errors_lock:
+            errors.add(item)
+        if on_error is not None:
+            on_error(item, f"Error {stage}: {e}")
+
+    def worker():
+        try:
+            driver = make_driver()
+        except Exception as e:
+            logging.error(f"Failed to start a download worker: {e}")
+            results.put(_DONE)
+            return
+        try:
+            while True:
+                item = work.get()
+                if item is _DONE:
+                    break
+                limiter.wait()
+                try:
+                    results.put((item, fetch(driver, item)))
+                except Exception as e:
+                    fail(item, "downloading", e)
+        finally:
+            # The writer waits for one _DONE per worker, so it must be sent even if quit() fails
+            try:
+                driver.quit()
+            except Exception as e:
+                logging.warning(f"Error closing a download worker's browser: {e}")
+            finally:
+                results.put(_DONE)
+
+    spinner = Halo(text=f"{description}: 0/{len(items)}", spinner="line", color="cyan")
+    spinner.start()
+
+    def writer():
+        finished_workers = 0
+        done = 0
+        while finished_workers < workers:
+            result = results.get()
+            if result is _DONE:
+                finished_workers += 1
+                continue
+            item, data = result
+            try:
+                store(item, data)
+            except Exception as e:
+                fail(item, "storing", e)
+            done += 1
+            spinner.text = f"{description}: {done}/{len(items)}"
+
+    threads = [threading.Thread(target=worker, name=f"download-worker-{i}", daemon=True)
+               for i in range(workers)]
+    writer_thread = threading.Thread(target=writer, name="download-writer", daemon=True)
+    writer_thread.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer_thread.join()
+
+    # Items left behind when every worker failed to start
+    while not work.empty():
+        item = work.get()
+        if item is not _DONE:
+            fail(item, "downloading", "no download worker available")
+
+    error_items = [item for item in items if item in errors]
+    if error_items:
+        spinner.fail(f"{description}: {len(items) - len(error_items)}/{len(items)} succeeded")
+    else:
+        spinner.succeed(f"{description}: {len(items)}/{len(items)} succeeded")
+    return error_items
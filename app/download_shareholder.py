@@ -1,33 +1,23 @@
 import pandas as pd
 import logging
 from datetime import datetime
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from bs4 import BeautifulSoup
 from pathlib import Path
 from halo import Halo
 from app.helpers import *
-from app.config import DOWNLOAD_DIR, WEB_CHROMEDRIVER_PATH
+from app.data_store import read_stock, stock_exists, write_stock, merge_weeks
+from app.download_manifest import ManifestWriter, load_manifest, download_start_date
+from app.download_pool import run_download_pool
+from app.async_downloader import run_async_download
+from app.goodinfo_client import GoodinfoClient, goodinfo_url
+from app.table_parser import parse_detail_table
+from app.raw_cache import cache_page, replay_dataset
+from app.browser_manager import browser_manager
+from app.trading_calendar import latest_trading_week_end
+from app.config import DOWNLOAD_DIR, DOWNLOAD_WORKERS, DOWNLOAD_ENGINE
 
 MAX_PER = 1000000
 MAX_EPS = 1000000
 
-def get_service():
-    try:
-        if WEB_CHROMEDRIVER_PATH.exists():
-            logging.info("Using Heroku's ChromeDriver.")
-            return ChromeService(executable_path=str(WEB_CHROMEDRIVER_PATH))
-        else:
-            logging.warning("Heroku ChromeDriver not found. Falling back to WebDriverManager.")
-            return ChromeService(ChromeDriverManager().install())
-    except Exception as e:
-        logging.error(f"Failed to initialize ChromeDriver service: {e}")
-        raise
-
 def read_stock_numbers_from_file(file_path):
     logging.info(f"Reading stock numbers from file: {file_path}")
     try:
@@ -40,81 +30,88 @@ def read_stock_numbers_from_file(file_path):
         raise
 
 def is_stock_data_up_to_date(stock_number):
-    stock_file = Path(DOWNLOAD_DIR) / f"{stock_number}.csv"
-    if not stock_file.exists():
+    stock_file = Path(DOWNLOAD_DIR) / f"{stock_number}"
+    if not stock_exists(DOWNLOAD_DIR, stock_number):
         return False
     try:
-        df = pd.read_csv(stock_file)
-        if df.empty:
+        df = read_stock(DOWNLOAD_DIR, stock_number)
+        if df is None or df.empty:
             return False
-        df["ParsedDate"] = df["Date"].apply(parse_custom_date)
+        df["ParsedDate"] = parse_custom_dates(df["Date"])
         if df["ParsedDate"].isnull().all():
             return False
-        return df["ParsedDate"].max() >= get_most_recent_friday()
+        return df["ParsedDate"].max() >= latest_trading_week_end()
     except Exception as e:
         logging.error(f"Error reading stock file {stock_file}: {e}")
         return False
 
-def download_data(stock_numbers, data_type):
+PAGES = {
+    "shareholder": ("EquityDistributionClassHis.asp", {}),
+    "stocks": ("ShowK_ChartFlow.asp", {"RPT_CAT": "PER"})
+}
+HEADERS = {
+    "shareholder": ["Date", "End Date", "Price", "Change", "% Change", "Inventory", "<=10", ">10<=50", ">50<=100", ">100<=200", ">200<=400", ">400<=800", ">800<=1000", ">1000"],
+    "stocks": ["Date", "Price", "Change", "% Change", "EPS", "PER", "8X", "9.8X", "11.6X", "13.4X", "15.2X", "17X"]
+}
+
+def new_driver():
+    return browser_manager().lease()
+
+def parse_table(html, data_type):
+    numeric_columns = ["EPS", "PER"] if data_type == "stocks" else []
+    caps = {"EPS": MAX_EPS, "PER": MAX_PER} if data_type == "stocks" else None
+    df = parse_detail_table(html, HEADERS[data_type], numeric_columns, caps)
+    if df is None:
+        raise ValueError("tblDetail not found")
+    return df
+
+def fetch_table(client, stock_number, data_type, start_date, end_date):
+    page, params = PAGES[data_type]
+    url = goodinfo_url(page, **params, STEP="DATA", STOCK_ID=stock_number, CHT_CAT="WEEK",
+                       PRICE_ADJ="F", START_DT=start_date, END_DT=end_date)
+    html = client.fetch_table_html(url)
+    cache_page(data_type, stock_number, start_date, end_date, html)
+    return parse_table(html, data_type)
+
+def download_data(stock_numbers, data_type, full_refetch=False, workers=DOWNLOAD_WORKERS, engine=DOWNLOAD_ENGINE,
+                  replay=False, journal=None):
+    if replay:
+        return replay_dataset(data_type, stock_numbers, lambda html: parse_table(html, data_type),
+                              name=lambda stock_number: f"{data_type}_{stock_number}")
+
     logging.info(f"Starting {data_type} stock data download.")
-    start_date = "2001-03-28"
+    manifest = load_manifest()
     end_date = datetime.now().strftime("%Y-%m-%d")
+    start_dates = {stock_number: download_start_date(f"{data_type}_{stock_number}", manifest, full_refetch)
+                   for stock_number in stock_numbers}
     create_folder(DOWNLOAD_DIR)
+    manifest_writer = ManifestWriter()
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    prefs = {"download.default_directory": str(Path(DOWNLOAD_DIR).resolve())}
-    chrome_options.add_experimental_option("prefs", prefs)
+    def fetch(client, stock_number):
+        return fetch_table(client, stock_number, data_type, start_dates[stock_number][0], end_date)
 
-    service = get_service()
-    driver = webdriver.Chrome(service=service, options=chrome_options)
+    def store(stock_number, df):
+        name = f"{data_type}_{stock_number}"
+        full = start_dates[stock_number][1]
+        if not full:
+            df = merge_weeks(read_stock(DOWNLOAD_DIR, name), df)
 
-    error_stocks = []
-    url_template = {
-        "shareholder": "https://goodinfo.tw/tw/EquityDistributionClassHis.asp?STEP=DATA&STOCK_ID={}&CHT_CAT=WEEK&PRICE_ADJ=F&START_DT={}&END_DT={}",
-        "stocks": "https://goodinfo.tw/tw/ShowK_ChartFlow.asp?RPT_CAT=PER&STEP=DATA&STOCK_ID={}&CHT_CAT=WEEK&PRICE_ADJ=F&START_DT={}&END_DT={}"
-    }
-    headers = {
-        "shareholder": ["Date", "End Date", "Price", "Change", "% Change", "Inventory", "<=10", ">10<=50", ">50<=100", ">100<=200", ">200<=400", ">400<=800", ">800<=1000", ">1000"],
-        "stocks": ["Date", "Price", "Change", "% Change", "EPS", "PER", "8X", "9.8X", "11.6X", "13.4X", "15.2X", "17X"]
-    }
-    
-    try:
-        for stock_number in stock_numbers:
-            spinner = Halo(text=f"Processing {data_type} stock: {stock_number}", spinner="line", color="cyan")
-            spinner.start()
-            try:
-                driver.delete_all_cookies()
-                driver.get(url_template[data_type].format(stock_number, start_date, end_date))
-                
-                WebDriverWait(driver, 5).until(lambda d: d.find_element(By.ID, "tblDetail"))
-                table_html = driver.execute_script("return document.getElementById('tblDetail').innerHTML")
-                
-                soup = BeautifulSoup(table_html, "html.parser")
-                rows = soup.find_all("tr")
-                data = [[cell.get_text(strip=True) for cell in row.find_all("td")] for row in rows[1:] if row]
-                df = pd.DataFrame(data, columns=headers[data_type])
-                df = df.dropna(how="all")
-                df = df[~df["Date"].str.endswith("W53")]
-                
-                if data_type == "stocks":
-                    df["EPS"] = pd.to_numeric(df["EPS"], errors="coerce")
-                    df["PER"] = pd.to_numeric(df["PER"], errors="coerce")
-                    df.loc[df["EPS"] > MAX_EPS, "EPS"] = None
-                    df.loc[df["PER"] > MAX_PER, "PER"] = None
-                
-                save_to_csv(df, Path(DOWNLOAD_DIR) / f"{data_type}_{stock_number}.csv", False)
-                spinner.succeed(f"{data_type.capitalize()} stock {stock_number} downloaded successfully.")
-            except Exception as e:
-                spinner.fail(f"Error processing {data_type} stock {stock_number}")
-                logging.error(f"Error downloading {data_type} data for {stock_number}: {e}")
-                error_stocks.append(stock_number)
-    finally:
-        driver.quit()
-        logging.info(f"{data_type.capitalize()} download process completed.")
+        output_file_path = write_stock(df, DOWNLOAD_DIR, name)
+        if output_file_path is None:
+            raise IOError(f"Could not store {data_type} data for {stock_number}")
+        manifest_writer.record(name, df, output_file_path, full=full,
+                               on_written=(lambda: journal.mark_done(stock_number)) if journal is not None else None)
+
+    make_client = lambda: GoodinfoClient(new_driver)
+    on_error = journal.mark_failed if journal is not None else None
+    with manifest_writer:
+        if engine == "async":
+            error_stocks = run_async_download(stock_numbers, make_client, fetch, store,
+                                              description=f"Downloading {data_type} data", on_error=on_error)
+        else:
+            error_stocks = run_download_pool(stock_numbers, make_client, fetch, store, workers,
+                                             description=f"Downloading {data_type} data", on_error=on_error)
+    logging.info(f"{data_type.capitalize()} download process completed.")
     return error_stocks
 
 if __name__ == "__main__":
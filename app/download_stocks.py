@@ -2,38 +2,24 @@ import logging
 from pathlib import Path
 
 import pandas as pd
-from bs4 import BeautifulSoup
 from halo import Halo
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
-
-from app.config import DOWNLOAD_DIR, WEB_CHROMEDRIVER_PATH
+
+from app.config import DOWNLOAD_DIR, DOWNLOAD_WORKERS, DOWNLOAD_ENGINE
 from app.helpers import *
+from app.data_store import read_stock, stock_exists, write_stock, merge_weeks
+from app.download_manifest import ManifestWriter, stale_stocks, load_manifest, download_start_date
+from app.download_pool import run_download_pool
+from app.async_downloader import run_async_download
+from app.goodinfo_client import GoodinfoClient, goodinfo_url
+from app.table_parser import parse_detail_table
+from app.raw_cache import cache_page, replay_dataset
+from app.browser_manager import browser_manager
+from app.trading_calendar import latest_trading_week_end, missing_trading_weeks
 
 MAX_PER = 1000000
 MAX_EPS = 1000000
 
 
-def get_service():
-    try:
-        # Use Heroku ChromeDriver if available
-        if WEB_CHROMEDRIVER_PATH.exists():
-            logging.info("Using Heroku's ChromeDriver.")
-            return ChromeService(executable_path=str(WEB_CHROMEDRIVER_PATH))
-        else:
-            logging.warning(
-                "Heroku ChromeDriver not found. Falling back to WebDriverManager."
-            )
-            return ChromeService(ChromeDriverManager().install())
-    except Exception as e:
-        logging.error(f"Failed to initialize ChromeDriver service: {e}")
-        raise
-
-
 def read_stock_numbers_from_file(file_path):
     """Reads stock numbers from a text file."""
     logging.info(f"Reading stock numbers from file: {file_path}")
@@ -49,19 +35,19 @@ def read_stock_numbers_from_file(file_path):
 
 def is_stock_data_up_to_date(stock_number):
     """Check if the stock data exists, contains valid data, and is up-to-date."""
-    stock_file = Path(DOWNLOAD_DIR) / f"{stock_number}.csv"
+    stock_file = Path(DOWNLOAD_DIR) / f"{stock_number}"
     logging.info(f"Checking if stock data is up-to-date for stock: {stock_number}")
-    if not stock_file.exists():
+    if not stock_exists(DOWNLOAD_DIR, stock_number):
         logging.info(f"Stock file {stock_file} does not exist. Download needed.")
         return False
 
     try:
-        df = pd.read_csv(stock_file)
-        if df.empty:
+        df = read_stock(DOWNLOAD_DIR, stock_number)
+        if df is None or df.empty:
             logging.info(f"Stock file {stock_file} is empty. Download needed.")
             return False
 
-        df["ParsedDate"] = df["Date"].apply(parse_custom_date)
+        df["ParsedDate"] = parse_custom_dates(df["Date"])
         if df["ParsedDate"].isnull().all():
             logging.info(
                 f"No valid dates found in stock file {stock_file}. Download needed."
@@ -70,8 +56,8 @@ def is_stock_data_up_to_date(stock_number):
 
         latest_date_in_file = df["ParsedDate"].max()
 
-        # Check if the data is up-to-date with the most recent Friday
-        if latest_date_in_file < get_most_recent_friday():
+        # Check if the data is up-to-date with the most recent week with trading
+        if latest_date_in_file < latest_trading_week_end():
             logging.info(
                 f"Data in {stock_file} is outdated. Latest date: {latest_date_in_file}"
             )
@@ -84,108 +70,161 @@ def is_stock_data_up_to_date(stock_number):
         return False
 
 
-def download_stock_data(stock_numbers):
+HEADER = [
+    "Date",
+    "Price",
+    "Change",
+    "% Change",
+    "EPS",
+    "PER",
+    "8X",
+    "9.8X",
+    "11.6X",
+    "13.4X",
+    "15.2X",
+    "17X",
+]
+
+
+def new_driver():
+    """Leases a warm headless Chrome configured for Goodinfo downloads."""
+    return browser_manager().lease()
+
+
+def parse_stock_table(html):
+    """
+    Parses a weekly PER page into a DataFrame.
+
+    Returns:
+    - df (pd.DataFrame): The table, newest week first, without week 53 and with
+      out-of-range EPS and PER set to NaN.
+    """
+    # Week 53 rows are dropped during the parsing pass; EPS/PER are converted with
+    # pd.to_numeric and capped on the parsed columns afterwards
+    df = parse_detail_table(html, HEADER, numeric_columns=["EPS", "PER"],
+                            caps={"EPS": MAX_EPS, "PER": MAX_PER})
+    if df is None:
+        raise ValueError("tblDetail not found")
+    return df
+
+
+def fetch_stock_table(client, stock_number, start_date, end_date):
+    """
+    Loads one stock's weekly PER table from Goodinfo and keeps the raw page in the cache.
+
+    Args:
+    - client (GoodinfoClient): HTTP client with browser fallback to fetch with.
+    - stock_number (str): Stock to fetch.
+    - start_date (str): START_DT as YYYY-MM-DD.
+    - end_date (str): END_DT as YYYY-MM-DD.
+
+    Returns:
+    - df (pd.DataFrame): The parsed table, see `parse_stock_table`.
+    """
+    url = goodinfo_url("ShowK_ChartFlow.asp", RPT_CAT="PER", STEP="DATA", STOCK_ID=stock_number,
+                       CHT_CAT="WEEK", PRICE_ADJ="F", START_DT=start_date, END_DT=end_date)
+    html = client.fetch_table_html(url)
+    cache_page("stocks", stock_number, start_date, end_date, html)
+    return parse_stock_table(html)
+
+
+def download_stock_data(stock_numbers, full_refetch=False, workers=DOWNLOAD_WORKERS, engine=DOWNLOAD_ENGINE,
+                        replay=False, journal=None):
+    """
+    Downloads weekly PER data from Goodinfo into DOWNLOAD_DIR.
+
+    Stocks already stored are fetched from their latest stored week only and merged
+    into the store, unless `full_refetch` is set or their last full download is older
+    than FULL_REFETCH_INTERVAL_DAYS. Pages are fetched over plain HTTP by a pool of
+    `workers` clients under the global DOWNLOAD_RATE_LIMIT, each falling back to its own
+    Chrome when blocked; a single writer stores the results. With `engine="async"` the
+    asyncio scheduler keeps up to ASYNC_CONCURRENCY requests in flight instead. With
+    `replay` the store is rebuilt from the raw page cache with no browser or network.
+
+    Args:
+    - stock_numbers (list): Stocks to download.
+    - full_refetch (bool): Download the full history of every stock.
+    - workers (int): Number of download workers to run in parallel ("pool" engine).
+    - engine (str): "pool" or "async".
+    - replay (bool): Re-parse the cached pages instead of downloading.
+    - journal (DownloadJournal): Journal to mark each stored or failed stock in, if any.
+
+    Returns:
+    - error_stocks (list): Stocks that failed to download.
+    """
+    if replay:
+        return replay_dataset("stocks", stock_numbers, parse_stock_table)
+
     logging.info("Starting stock data download.")
-    start_date = "2001-03-28"
+    manifest = load_manifest()
     end_date = datetime.now().strftime("%Y-%m-%d")
+    start_dates = {stock_number: download_start_date(stock_number, manifest, full_refetch)
+                   for stock_number in stock_numbers}
 
     create_folder(DOWNLOAD_DIR)
+    manifest_writer = ManifestWriter()
+
+    def fetch(client, stock_number):
+        return fetch_stock_table(client, stock_number, start_dates[stock_number][0], end_date)
+
+    def store(stock_number, df):
+        start_date, full = start_dates[stock_number]
+        fetched_rows = len(df)
+        if not full:
+            missing = missing_trading_weeks(df["Date"], date.fromisoformat(start_date), latest_trading_week_end())
+            if missing:
+                logging.warning(f"Stock {stock_number} has no data for trading weeks ending {missing}.")
+            df = merge_weeks(read_stock(DOWNLOAD_DIR, stock_number), df)
+
+        output_file_path = write_stock(df, DOWNLOAD_DIR, stock_number)
+        if output_file_path is None:
+            raise IOError(f"Could not store data for stock {stock_number}")
+        manifest_writer.record(stock_number, df, output_file_path, full=full,
+                               on_written=(lambda: journal.mark_done(stock_number)) if journal is not None else None)
+        logging.info(
+            f"Downloaded {fetched_rows} rows ({'full' if full else f'since {start_date}'}) "
+            f"for stock {stock_number} and saved to {output_file_path}."
+        )
+
+    make_client = lambda: GoodinfoClient(new_driver)
+    on_error = journal.mark_failed if journal is not None else None
+    with manifest_writer:
+        if engine == "async":
+            error_stocks = run_async_download(stock_numbers, make_client, fetch, store,
+                                              description="Downloading stocks", on_error=on_error)
+        else:
+            error_stocks = run_download_pool(stock_numbers, make_client, fetch, store, workers,
+                                             description="Downloading stocks", on_error=on_error)
+    if error_stocks:
+        logging.warning(f"Stocks with errors: {error_stocks}")
+    logging.info("Download process completed.")
+    return error_stocks
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    prefs = {
-        "download.default_directory": str(Path(DOWNLOAD_DIR).resolve()),
-        "download.prompt_for_download": False,
-        "download.directory_upgrade": True,
-        "safebrowsing.enabled": True,
-    }
-    chrome_options.add_experimental_option("prefs", prefs)
-
-    service = get_service()
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-
-    header = [
-        "Date",
-        "Price",
-        "Change",
-        "% Change",
-        "EPS",
-        "PER",
-        "8X",
-        "9.8X",
-        "11.6X",
-        "13.4X",
-        "15.2X",
-        "17X",
-    ]
-    error_stocks = []
 
-    try:
-        total_stocks = len(stock_numbers)
-        for index, stock_number in enumerate(stock_numbers, start=1):
-            spinner = Halo(
-                text=f"Processing stock: {stock_number} ({index}/{total_stocks})",
-                spinner="line",
-                color="cyan",
-            )
-            spinner.start()
-            try:
-                driver.delete_all_cookies()
-                url = f"https://goodinfo.tw/tw/ShowK_ChartFlow.asp?RPT_CAT=PER&STEP=DATA&STOCK_ID={stock_number}&CHT_CAT=WEEK&PRICE_ADJ=F&START_DT={start_date}&END_DT={end_date}"
-                driver.get(url)
-
-                WebDriverWait(driver, 5).until(
-                    lambda d: d.find_element(By.ID, "tblDetail")
-                )
-                table_html = driver.execute_script(
-                    "return document.getElementById('tblDetail').innerHTML"
-                )
-
-                soup = BeautifulSoup(table_html, "html.parser")
-                rows = soup.find_all("tr")
-                data = [
-                    [cell.get_text(strip=True) for cell in row.find_all("td")]
-                    for row in rows[1:]
-                    if row
-                ]
-
-                output_file_path = Path(DOWNLOAD_DIR) / f"{stock_number}.csv"
-                df = pd.DataFrame(data, columns=header)
-                df = df.dropna(how="all")
-                # Remove rows with 53rd week
-                df = df[~df["Date"].str.endswith("W53")]
-                # Convert EPS and PER to numeric and filter out rows where values are over 100000
-                df["EPS"] = pd.to_numeric(df["EPS"], errors="coerce")
-                df["PER"] = pd.to_numeric(df["PER"], errors="coerce")
-                # Replace EPS or PER values exceeding the thresholds with NaN
-                df.loc[df["EPS"] > MAX_EPS, "EPS"] = None
-                df.loc[df["PER"] > MAX_PER, "PER"] = None
-
-                save_to_csv(df, output_file_path, False)
-                logging.info(
-                    f"Downloaded and saved data for stock {stock_number} to {output_file_path}."
-                )
-                spinner.succeed(f"Stock {stock_number} downloaded successfully.")
-            except Exception as e:
-                spinner.fail(f"Error processing stock {stock_number}")
-                logging.error(f"Error downloading data for stock {stock_number}: {e}")
-                error_stocks.append(stock_number)
-    finally:
-        if error_stocks:
-            logging.warning(f"Stocks with errors: {error_stocks}")
-        driver.quit()
-        logging.info("Download process completed.")
-    return error_stocks
+def check_and_download_stocks(stock_numbers, full_refetch=False, engine=DOWNLOAD_ENGINE, journal=None):
+    """
+    Downloads the stocks whose stored data is stale, oldest data first.
 
+    Args:
+    - stock_numbers (list): Stock numbers to check.
+    - full_refetch (bool): If True, download every stock's full history, whether or not
+      the manifest considers it fresh.
+    - engine (str): Download engine passed to `download_stock_data`.
+    - journal (DownloadJournal): Optional journal of the run. Stocks found fresh are
+      marked in it as well, as they need no download.
 
-def check_and_download_stocks(stock_numbers):
+    Returns:
+    - error_stocks (list): Stocks that failed to download.
+    """
     logging.info("Checking and downloading stocks as needed.")
     spinner = Halo(text="Checking stock data...", spinner="line", color="cyan")
     spinner.start()
-    stocks_to_download = [s for s in stock_numbers if not is_stock_data_up_to_date(s)]
+    # A full re-fetch bypasses the staleness check: fresh stocks would otherwise be
+    # skipped and keep their incrementally merged history
+    stocks_to_download = list(stock_numbers) if full_refetch else stale_stocks(stock_numbers)
+    if journal is not None and len(stocks_to_download) < len(stock_numbers):
+        stale = set(map(str, stocks_to_download))
+        journal.mark_fresh([s for s in stock_numbers if str(s) not in stale])
     error_stocks = []
     if stocks_to_download:
         if len(stocks_to_download) > 10:
@@ -195,7 +234,7 @@ def check_and_download_stocks(stock_numbers):
                 f"{len(stocks_to_download)} Stocks to download: {stocks_to_download}"
             )
         logging.info(f"Stocks to download: {stocks_to_download}")
-        error_stocks = download_stock_data(stocks_to_download)
+        error_stocks = download_stock_data(stocks_to_download, full_refetch, engine=engine, journal=journal)
     else:
         spinner.succeed("All stocks checked, no download required.")
         logging.info("All stocks are up-to-date.")
@@ -0,0 +1,113 @@
+import logging
+import re
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+from app.config import GOODINFO_BASE_URL, HTTP_TIMEOUT, HTTP_USER_AGENT
+
+# Status codes Goodinfo answers with when it throttles or rejects a client
+BLOCKED_STATUS = {403, 429, 503}
+DETAIL_TABLE = re.compile(r"""id\s*=\s*["']?tblDetail\b""")
+
+
+class BlockedError(Exception):
+    """Raised when a plain HTTP request does not get the data table."""
+
+
+def goodinfo_url(page, **params):
+    """Builds a Goodinfo URL under GOODINFO_BASE_URL, e.g. goodinfo_url("ShowK_ChartFlow.asp", STOCK_ID=2330)."""
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    return f"{GOODINFO_BASE_URL}/{page}?{query}"
+
+
+def has_detail_table(page_html):
+    """Checks whether a page contains the `tblDetail` data table."""
+    return DETAIL_TABLE.search(page_html) is not None
+
+
+class GoodinfoClient:
+    """
+    Fetches Goodinfo data tables over plain HTTP, falling back to Chrome when blocked.
+
+    The HTTP session keeps its cookies and browser-like headers across requests. The
+    browser is started only on the first blocked request, so a client that is never
+    blocked never launches Chrome. One client belongs to one download worker.
+    """
+
+    def __init__(self, make_driver=None, timeout=HTTP_TIMEOUT):
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+        self.opener.addheaders = [
+            ("User-Agent", HTTP_USER_AGENT),
+            ("Accept", "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"),
+            ("Accept-Language", "zh-TW,zh;q=0.9,en;q=0.8"),
+            ("Referer", f"{GOODINFO_BASE_URL}/index.asp"),
+        ]
+        self.timeout = timeout
+        self._make_driver = make_driver
+        self._driver = None
+        self.http_fetches = 0
+        self.browser_fetches = 0
+
+    def get(self, url):
+        """
+        Fetches a page over HTTP and returns its decoded HTML.
+
+        Raises:
+        - BlockedError: On a throttling or rejection status code.
+        """
+        try:
+            with self.opener.open(Request(url), timeout=self.timeout) as response:
+                charset = response.headers.get_content_charset() or "utf-8"
+                return response.read().decode(charset, errors="replace")
+        except HTTPError as e:
+            if e.code in BLOCKED_STATUS:
+                raise BlockedError(f"HTTP {e.code}") from e
+            raise
+
+    def fetch_table_html(self, url):
+        """
+        Returns HTML containing the `tblDetail` table of a Goodinfo DATA page.
+
+        Args:
+        - url (str): Page URL, usually from `goodinfo_url`.
+
+        Returns:
+        - html (str): The page from the HTTP request or, when that is blocked, the
+          table as rendered by the browser.
+        """
+        try:
+            page_html = self.get(url)
+            if not has_detail_table(page_html):
+                raise BlockedError("tblDetail not found in the response")
+            self.http_fetches += 1
+            return page_html
+        except BlockedError as e:
+            if self._make_driver is None:
+                raise
+            logging.info(f"HTTP fetch blocked ({e}) for {url}. Falling back to the browser.")
+        return self._browser_table_html(url)
+
+    def _browser_table_html(self, url):
+        if self._driver is None:
+            self._driver = self._make_driver()
+        driver = self._driver
+        driver.delete_all_cookies()
+        driver.get(url)
+
+        WebDriverWait(driver, 5).until(lambda d: d.find_element(By.ID, "tblDetail"))
+        table_html = driver.execute_script("return document.getElementById('tblDetail').innerHTML")
+        self.browser_fetches += 1
+        return f"<table id='tblDetail'>{table_html}</table>"
+
+    def quit(self):
+        """Closes the browser if one was started."""
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+        logging.debug(f"Goodinfo client closed after {self.http_fetches} HTTP and "
+                      f"{self.browser_fetches} browser fetches.")
@@ -1,8 +1,10 @@
 import pandas as pd
 from pathlib import Path
 from halo import Halo
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from app.config import DATA_DIR, STOCK_DATA_DIR, RESOURCES_DIR, RESULTS_DIR, DOWNLOAD_DIR, INPUT_STOCK_DIR, LOGS_DIR
 
 def read_excel(file_path, sheet_name=None):
@@ -78,6 +80,77 @@ def run_process(task, task_description, success_message, failure_message):
         spinner.fail(failure_message)
         raise e
     
+class _LogRecordCollector(logging.Handler):
+    """Logging handler that keeps records so a worker process can send them back."""
+
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        # Flatten the record so it can be pickled back to the parent process
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _run_with_captured_logs(task, level, item):
+    """
+    Run `task(item)` in a worker, returning its result and the log records it emitted.
+
+    Records are captured at `level`, the parent's effective level, so a worker does not
+    build and ship DEBUG records the parent would drop.
+    """
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    collector = _LogRecordCollector()
+    root.handlers = [collector]
+    root.setLevel(level)
+    try:
+        result = task(item)
+    except Exception as e:
+        logging.error(f"Error processing {item}: {e}. Skipping.")
+        result = None
+    finally:
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+    return result, collector.records
+
+
+def parallel_map(task, items, workers=None, chunk_size=1):
+    """
+    Runs `task` on every item across a process pool.
+
+    Results come back in the same order as `items`. Log records emitted inside the
+    workers are replayed in the parent in that same order, filtered by the parent's
+    logger levels, so the log reads like a serial run. An item whose task raises is logged and returned as None.
+
+    Args:
+    - task (callable): Module-level function taking one item.
+    - items (list): Items to process.
+    - workers (int): Number of worker processes. Default is one per CPU core.
+    - chunk_size (int): Number of items sent to a worker at a time.
+
+    Returns:
+    - results (list): One result per item.
+    """
+    results = []
+    level = logging.getLogger().getEffectiveLevel()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        outputs = executor.map(partial(_run_with_captured_logs, task, level), items,
+                               chunksize=max(1, chunk_size or 1))
+        for result, records in outputs:
+            for record in records:
+                # Logger.handle skips the level check, so apply the parent's levels here
+                logger = logging.getLogger(record.name)
+                if logger.isEnabledFor(record.levelno):
+                    logger.handle(record)
+            results.append(result)
+    return results
+
 def check_all_folders():
     """Check if all necessary folders exist."""
     logging.info("Verifying required folders.")
@@ -105,7 +178,54 @@ def parse_custom_date(custom_date):
     except Exception as e:
         logging.warning(f"Error parsing date '{custom_date}': {e}")
         return None
-    
+
+
+@lru_cache(maxsize=1)
+def _week_code_calendar():
+    """
+    ISO-week calendar table {week code: Friday} for 2000-2099, weeks 01-53.
+
+    Week 53 of a 52-week year maps into week 1 of the next year, the same as strptime.
+    """
+    calendar = {}
+    for year in range(2000, 2100):
+        # Monday of ISO week 1 is the Monday on or before 4 January
+        january_4 = date(year, 1, 4)
+        week_1_monday = january_4 - timedelta(days=january_4.weekday())
+        for week in range(1, 54):
+            calendar[f"{year % 100:02d}W{week:02d}"] = week_1_monday + timedelta(weeks=week - 1, days=4)
+    return calendar
+
+
+def parse_custom_dates(custom_dates):
+    """
+    Vectorized `parse_custom_date` for a column of week codes.
+
+    Codes are looked up in a precomputed calendar table. Codes missing from the table
+    are parsed once per distinct value with `parse_custom_date`, so invalid codes
+    still give None with the same warning.
+
+    Args:
+    - custom_dates (pd.Series or list): Week codes such as 24W52.
+
+    Returns:
+    - dates (pd.Series): Friday of each week as datetime.date, or None where invalid.
+    """
+    codes = pd.Series(custom_dates, dtype=object)
+    dates = codes.map(_week_code_calendar()).astype(object)
+    missing = dates.isna()
+    if missing.any():
+        positions, uniques = pd.factorize(codes[missing], use_na_sentinel=False)
+        fallback = [parse_custom_date(code) for code in uniques]
+        dates[missing] = [fallback[position] for position in positions]
+    return dates
+
+def week_code_sort_key(custom_date):
+    """
+    Returns a sortable (year, week) tuple for a custom week code (e.g., 24W52 -> (24, 52)).
+    """
+    return int(custom_date[:2]), int(custom_date[3:])
+
 def get_most_recent_friday():
     """
     Get the most recent Friday (including today if today is Friday).
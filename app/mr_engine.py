@@ -0,0 +1,121 @@
+import logging
+import numpy as np
+
+NaN_THRESHOLD = 0.2
+
+
+def first_improvement_offsets(per, median_per, max_weeks, end=None):
+    """
+    For every week, find how many weeks it takes for PER to move closer to the median.
+
+    Works on a single series (1D) or on a stocks x weeks panel (2D). The forward
+    deviations are built once for the largest horizon, so any shorter horizon can be
+    answered from the same result.
+
+    Args:
+    - per (ndarray): PER values in chronological order, shape (weeks,) or (stocks, weeks).
+    - median_per (float or ndarray): Median PER, broadcastable against `per`.
+    - max_weeks (int): Largest number of weeks to look ahead.
+    - end (ndarray): Optional exclusive end column per stock; weeks at or after it are
+      never used as future weeks. Defaults to the full width.
+
+    Returns:
+    - offsets (ndarray): Same shape as `per`; the first look-ahead week (1..max_weeks)
+      whose deviation is smaller than the entry deviation, or 0 if there is none.
+    """
+    per = np.asarray(per, dtype=float)
+    initial_deviation = np.abs(per - median_per)
+    offsets = np.zeros(per.shape, dtype=np.int64)
+    width = per.shape[-1]
+    columns = np.arange(width)
+
+    for j in range(1, max_weeks + 1):
+        if j >= width:
+            break
+        future_per = np.full(per.shape, np.nan)
+        future_per[..., :-j] = per[..., j:]
+        if end is not None:
+            future_per[(columns + j)[None, :] >= np.asarray(end)[:, None]] = np.nan
+        # NaN comparisons are False, exactly like the scalar loop
+        improved = np.abs(future_per - median_per) < initial_deviation
+        offsets[(offsets == 0) & improved] = j
+
+    return offsets
+
+
+def _as_panel(stat, per, panel):
+    """Shape a median/quartile argument so it broadcasts against the stocks x weeks panel."""
+    stat = np.asarray(stat, dtype=float)
+    if stat.ndim > 0 and stat.shape == np.shape(per):
+        # One value per week (e.g. rolling statistics)
+        return stat.reshape(panel.shape)
+    return stat.reshape(-1, 1)
+
+
+def median_reversion_rates(per, horizons, median_per, quartile_per, start=None, end=None, valid=None):
+    """
+    Compute Median Reversion (MR) success rates for several horizons in one pass.
+
+    This is the array form of `median_reversion_calculation`: a week is an entry when its
+    PER is not above the 25th percentile, and it succeeds for a horizon of `w` weeks when
+    PER moves closer to the median within the next `w` weeks. Only weeks with at least
+    `w` weeks after them are tested.
+
+    Args:
+    - per (ndarray): PER values in chronological order, shape (weeks,) or (stocks, weeks).
+    - horizons (list): Look-ahead windows in weeks, e.g. [4, 8, 12].
+    - median_per (float or ndarray): Median PER, one value per stock, or one value per week
+      with the same shape as `per` for rolling statistics.
+    - quartile_per (float or ndarray): 25th percentile PER, shaped like `median_per`.
+    - start (ndarray): Optional first column of each stock's history in a panel.
+    - end (ndarray): Optional exclusive last column of each stock's history in a panel.
+    - valid (ndarray): Optional boolean mask shaped like `per`; weeks where it is False are
+      never entries (e.g. before rolling statistics are available).
+
+    Returns:
+    - results (dict): {weeks: (success_rates, incidents, entries, nan_exceeded)} with one
+      value per stock (scalars for a 1D series). `incidents` counts successful entries,
+      `entries` counts tested weeks, and `nan_exceeded` flags stocks whose NaN ratio is
+      above NaN_THRESHOLD (their success rate is NaN).
+    """
+    per = np.asarray(per, dtype=float)
+    is_series = per.ndim == 1
+    panel = np.atleast_2d(per)
+    n_stocks, width = panel.shape
+
+    start = np.zeros(n_stocks, dtype=np.int64) if start is None else np.asarray(start)
+    end = np.full(n_stocks, width, dtype=np.int64) if end is None else np.asarray(end)
+    median_per = _as_panel(median_per, per, panel)
+    quartile_per = _as_panel(quartile_per, per, panel)
+
+    columns = np.arange(width)[None, :]
+    in_history = (columns >= start[:, None]) & (columns < end[:, None])
+    length = end - start
+    total_NaN = (np.isnan(panel) & in_history).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nan_exceeded = total_NaN / length > NaN_THRESHOLD
+
+    # A NaN entry PER is not "above the quartile", so the scalar loop counts it as an entry
+    entries = ~(panel > quartile_per) & in_history
+    if valid is not None:
+        entries &= np.asarray(valid, dtype=bool).reshape(panel.shape)
+    offsets = first_improvement_offsets(panel, median_per, max(horizons), end=end)
+
+    results = {}
+    for weeks in horizons:
+        eligible = entries & (columns < (end - weeks)[:, None])
+        total_under_median = eligible.sum(axis=1)
+        total_improve_median = (eligible & (offsets > 0) & (offsets <= weeks)).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            success_rate = np.where(
+                total_under_median > 0, total_improve_median / total_under_median, 0.0)
+        success_rate = np.where(nan_exceeded, np.nan, success_rate)
+
+        if is_series:
+            results[weeks] = (float(success_rate[0]), int(total_improve_median[0]),
+                              int(total_under_median[0]), bool(nan_exceeded[0]))
+        else:
+            results[weeks] = (success_rate, total_improve_median, total_under_median, nan_exceeded)
+        logging.debug(f"MR kernel finished for {weeks} weeks across {n_stocks} series.")
+
+    return results
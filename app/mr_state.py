@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .helpers import *
+from .config import MR_STATE_DIR
+from .mr_engine import NaN_THRESHOLD, first_improvement_offsets
+
+
+def _history_hash(per):
+    """Fingerprint of a PER history, used to detect revised data."""
+    return hashlib.sha256(np.ascontiguousarray(per, dtype=float).tobytes()).hexdigest()
+
+
+def build_mr_state(per, horizons, median_per, quartile_per):
+    """
+    Build the Median Reversion (MR) state for a PER series from scratch.
+
+    Args:
+    - per (ndarray): PER values in chronological order.
+    - horizons (list): Look-ahead windows in weeks.
+    - median_per (float): The median PER value.
+    - quartile_per (float): The 25th percentile PER value.
+
+    Returns:
+    - state (dict): Entry and success counts per horizon, the entries still inside the
+      look-ahead window, and the statistics and history fingerprint they depend on.
+    """
+    per = np.asarray(per, dtype=float)
+    rows = len(per)
+    max_weeks = max(horizons)
+    entries = ~(per > quartile_per)
+    offsets = first_improvement_offsets(per, median_per, max_weeks)
+
+    state = {
+        "median_per": float(median_per),
+        "quartile_per": float(quartile_per),
+        "horizons": list(horizons),
+        "rows": rows,
+        "nan_count": int(np.isnan(per).sum()),
+        "history_hash": _history_hash(per),
+        "entries": {},
+        "successes": {},
+        "open_entries": [],
+    }
+    for weeks in horizons:
+        eligible = entries[:max(rows - weeks, 0)]
+        hits = offsets[:max(rows - weeks, 0)]
+        state["entries"][str(weeks)] = int(eligible.sum())
+        state["successes"][str(weeks)] = int((eligible & (hits > 0) & (hits <= weeks)).sum())
+
+    # Entries not yet eligible for the longest horizon can still change
+    for i in range(max(rows - max_weeks, 0), rows):
+        if entries[i]:
+            state["open_entries"].append(
+                [i, float(abs(per[i] - median_per)), int(offsets[i]) or None])
+    return state
+
+
+def append_mr_state(state, new_per):
+    """
+    Advance an MR state by the weeks appended after `state["rows"]`.
+
+    Only the open entries inside the look-ahead window are touched, so the cost is
+    proportional to the number of new weeks.
+
+    Args:
+    - state (dict): State from `build_mr_state`, updated in place.
+    - new_per (ndarray): PER values of the new weeks in chronological order.
+
+    Returns:
+    - state (dict): The updated state.
+    """
+    median_per = state["median_per"]
+    quartile_per = state["quartile_per"]
+    horizons = state["horizons"]
+    max_weeks = max(horizons)
+    open_entries = {entry[0]: entry for entry in state["open_entries"]}
+
+    for value in np.asarray(new_per, dtype=float):
+        k = state["rows"]
+        deviation = abs(value - median_per)
+        for i, entry in open_entries.items():
+            if entry[2] is None and k - i <= max_weeks and deviation < entry[1]:
+                entry[2] = k - i
+        if not value > quartile_per:
+            open_entries[k] = [k, float(deviation), None]
+
+        state["rows"] = k + 1
+        state["nan_count"] += int(np.isnan(value))
+        for weeks in horizons:
+            entry = open_entries.get(state["rows"] - weeks - 1)
+            if entry is not None:
+                state["entries"][str(weeks)] += 1
+                if entry[2] is not None and entry[2] <= weeks:
+                    state["successes"][str(weeks)] += 1
+
+        for i in [i for i in open_entries if i < state["rows"] - max_weeks]:
+            del open_entries[i]
+
+    state["open_entries"] = list(open_entries.values())
+    return state
+
+
+def mr_state_results(state):
+    """
+    Read MR results out of a state, in the same layout as `median_reversion_rates`.
+
+    Returns:
+    - results (dict): {weeks: (success_rate, incidents, entries, nan_exceeded)}.
+    """
+    nan_exceeded = state["rows"] > 0 and state["nan_count"] / state["rows"] > NaN_THRESHOLD
+    results = {}
+    for weeks in state["horizons"]:
+        total_under_median = state["entries"][str(weeks)]
+        total_improve_median = state["successes"][str(weeks)]
+        success_rate = total_improve_median / total_under_median if total_under_median > 0 else 0.0
+        results[weeks] = (float("nan") if nan_exceeded else success_rate,
+                          total_improve_median, total_under_median, nan_exceeded)
+    return results
+
+
+def load_mr_state(stock_id):
+    """Load the saved MR state for a stock, or None if there is none."""
+    state_file = Path(MR_STATE_DIR) / f"{stock_id}.json"
+    if not state_file.exists():
+        return None
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f"Error reading MR state {state_file}: {e}. Rebuilding.")
+        return None
+
+
+def save_mr_state(stock_id, state):
+    """Save the MR state for a stock, replacing the old file atomically."""
+    create_folder(MR_STATE_DIR)
+    state_file = Path(MR_STATE_DIR) / f"{stock_id}.json"
+    tmp_file = state_file.with_suffix(".json.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+
+def update_stock_mr_state(stock_id, per, horizons, median_per, quartile_per):
+    """
+    Bring a stock's saved MR state up to date with its PER history and return the results.
+
+    The saved state is extended with the new weeks when the earlier history, the
+    statistics and the horizons are unchanged. Otherwise (revised history, new
+    median/quartile, or no saved state) it is rebuilt from scratch.
+
+    Args:
+    - stock_id (str): Stock ID the state belongs to.
+    - per (ndarray): Full PER history in chronological order.
+    - horizons (list): Look-ahead windows in weeks.
+    - median_per (float): The median PER value.
+    - quartile_per (float): The 25th percentile PER value.
+
+    Returns:
+    - results (dict): {weeks: (success_rate, incidents, entries, nan_exceeded)}.
+    """
+    per = np.asarray(per, dtype=float)
+    state = load_mr_state(stock_id)
+
+    reusable = (
+        state is not None
+        and state["horizons"] == list(horizons)
+        and np.array_equal([state["median_per"], state["quartile_per"]],
+                           [float(median_per), float(quartile_per)], equal_nan=True)
+        and state["rows"] <= len(per)
+        and state["history_hash"] == _history_hash(per[:state["rows"]])
+    )
+    if reusable:
+        logging.info(f"Extending MR state for {stock_id} by {len(per) - state['rows']} weeks.")
+        state = append_mr_state(state, per[state["rows"]:])
+        state["history_hash"] = _history_hash(per)
+    else:
+        logging.info(f"Rebuilding MR state for {stock_id}.")
+        state = build_mr_state(per, horizons, median_per, quartile_per)
+
+    save_mr_state(stock_id, state)
+    return mr_state_results(state)
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.helpers import *
+from app.config import DOWNLOAD_DIR, PANEL_DIR, PANEL_SPARE_WEEKS
+from app.data_store import read_stock
+
+# Panel fields and the stored column each one is built from
+FIELDS = {"per": "PER", "price": "Price", "eps": "EPS"}
+INDEX_FILE = "index.json"
+
+
+class PanelStore:
+    """
+    Memory-mapped stocks x weeks panel of PER, Price and EPS.
+
+    Rows are stocks and columns are ISO week codes in chronological order. Arrays are
+    opened with numpy memory mapping, so slicing a stock or a week reads only those
+    bytes from disk and never parses text.
+    """
+
+    def __init__(self, panel_dir=PANEL_DIR, mode="r"):
+        self.panel_dir = Path(panel_dir)
+        with open(self.panel_dir / INDEX_FILE, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.stock_ids = index["stock_ids"]
+        self.weeks = index["weeks"]
+        self.spans = index["spans"]
+        self.capacity = index["capacity"]
+        self.stock_index = {stock_id: row for row, stock_id in enumerate(self.stock_ids)}
+        self.week_index = {code: column for column, code in enumerate(self.weeks)}
+        self._arrays = {field: np.load(self.panel_dir / f"{field}.npy", mmap_mode=mode) for field in FIELDS}
+
+    def __getattr__(self, field):
+        if field in FIELDS:
+            # Only the filled weeks; a view, not a copy
+            return self._arrays[field][:, :len(self.weeks)]
+        raise AttributeError(field)
+
+    def stock(self, stock_id):
+        """Returns {field: 1D view} of one stock over all weeks."""
+        row = self.stock_index[str(stock_id)]
+        return {field: self._arrays[field][row, :len(self.weeks)] for field in FIELDS}
+
+    def week(self, week_code):
+        """Returns {field: 1D view} of one week across all stocks."""
+        column = self.week_index[week_code]
+        return {field: self._arrays[field][:, column] for field in FIELDS}
+
+    def span(self, stock_id):
+        """Returns the (start, end) column range of a stock's history, end exclusive."""
+        return tuple(self.spans[str(stock_id)])
+
+
+def open_panel_store(panel_dir=PANEL_DIR):
+    """Opens the panel store read-only, or returns None if it has not been built."""
+    if not (Path(panel_dir) / INDEX_FILE).exists():
+        return None
+    return PanelStore(panel_dir)
+
+
+def _load_frames(stock_numbers, data_dir):
+    frames = {}
+    for stock_id in stock_numbers:
+        df = read_stock(data_dir, stock_id)
+        if df is None or df.empty:
+            logging.warning(f"No stored data for {stock_id} in {data_dir}. Skipping in panel.")
+            continue
+        frames[str(stock_id)] = df
+    return frames
+
+
+def _write_index(panel_dir, stock_ids, weeks, spans, capacity):
+    tmp_file = Path(panel_dir) / f".{INDEX_FILE}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"stock_ids": stock_ids, "weeks": weeks, "spans": spans, "capacity": capacity}, f)
+    os.replace(tmp_file, Path(panel_dir) / INDEX_FILE)
+
+
+def build_panel_store(stock_numbers, data_dir=DOWNLOAD_DIR, panel_dir=PANEL_DIR):
+    """
+    Builds the memory-mapped panel from scratch.
+
+    Args:
+    - stock_numbers (list): Stocks to include.
+    - data_dir (str or Path): Store directory with the downloaded data.
+    - panel_dir (str or Path): Where to write the panel.
+
+    Returns:
+    - store (PanelStore): The new panel, opened read-only.
+    """
+    create_folder(panel_dir)
+    frames = _load_frames(stock_numbers, data_dir)
+    weeks = sorted({code for df in frames.values() for code in df["Date"].astype(str)},
+                   key=week_code_sort_key)
+    week_index = {code: column for column, code in enumerate(weeks)}
+    stock_ids = list(frames)
+    capacity = len(weeks) + PANEL_SPARE_WEEKS
+    spans = {}
+
+    for field, column_name in FIELDS.items():
+        tmp_file = Path(panel_dir) / f".{field}.npy.tmp"
+        array = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=np.float64,
+                                          shape=(len(stock_ids), capacity))
+        array[:] = np.nan
+        for row, stock_id in enumerate(stock_ids):
+            df = frames[stock_id]
+            columns = df["Date"].astype(str).map(week_index).to_numpy(dtype=np.int64)
+            array[row, columns] = pd.to_numeric(df[column_name], errors="coerce").to_numpy(dtype=float)
+            spans[stock_id] = [int(columns.min()), int(columns.max()) + 1]
+        array.flush()
+        del array
+        os.replace(tmp_file, Path(panel_dir) / f"{field}.npy")
+
+    _write_index(panel_dir, stock_ids, weeks, spans, capacity)
+    logging.info(f"Built panel with {len(stock_ids)} stocks and {len(weeks)} weeks in {panel_dir}.")
+    return PanelStore(panel_dir)
+
+
+def update_panel_store(stock_numbers=None, data_dir=DOWNLOAD_DIR, panel_dir=PANEL_DIR):
+    """
+    Adds newly downloaded weeks to the panel in place.
+
+    New weeks are written into the spare columns of the existing memory-mapped files.
+    Each stock's rows are rewritten from its last stored week on, so a re-fetched
+    in-progress week gets its final values and a stock that lagged behind gets the
+    weeks it was missing. The panel is rebuilt instead when it does not exist yet, when
+    a stock with stored data is new, when a week would land before the last stored
+    week, or when the spare columns run out.
+
+    Args:
+    - stock_numbers (list): Stocks to refresh. Default is every stock in the panel.
+    - data_dir (str or Path): Store directory with the downloaded data.
+    - panel_dir (str or Path): Panel location.
+
+    Returns:
+    - store (PanelStore): The updated panel, opened read-only.
+    """
+    if not (Path(panel_dir) / INDEX_FILE).exists():
+        return build_panel_store(stock_numbers or [], data_dir, panel_dir)
+
+    store = PanelStore(panel_dir, mode="r+")
+    # Only stocks with stored data count: one that was never downloaded would otherwise
+    # look new on every update and force a rebuild that skips it again
+    frames = _load_frames([str(stock_id) for stock_id in (stock_numbers or store.stock_ids)], data_dir)
+    new_stocks = [stock_id for stock_id in frames if stock_id not in store.stock_index]
+    if new_stocks:
+        logging.info(f"New stocks found: {new_stocks}. Rebuilding panel.")
+        return build_panel_store(store.stock_ids + new_stocks, data_dir, panel_dir)
+
+    new_weeks = sorted({code for df in frames.values() for code in df["Date"].astype(str)
+                        if code not in store.week_index}, key=week_code_sort_key)
+    if new_weeks and ((store.weeks and week_code_sort_key(new_weeks[0]) < week_code_sort_key(store.weeks[-1]))
+                      or len(store.weeks) + len(new_weeks) > store.capacity):
+        logging.info("New weeks do not fit the existing panel. Rebuilding panel.")
+        return build_panel_store(store.stock_ids, data_dir, panel_dir)
+
+    weeks = store.weeks + new_weeks
+    week_index = {code: column for column, code in enumerate(weeks)}
+    spans = dict(store.spans)
+    updated = 0
+    for stock_id, df in frames.items():
+        row = store.stock_index[stock_id]
+        start, end = spans[stock_id]
+        # Rewrite from the stock's last stored week on: delta downloads re-fetch that week
+        # while it is in progress, and a stock that lagged behind catches up on weeks
+        # other stocks already have
+        columns = df["Date"].astype(str).map(week_index).to_numpy(dtype=np.int64)
+        tail = columns >= max(end - 1, start)
+        if not tail.any():
+            continue
+        columns = columns[tail]
+        changed = False
+        for field, column_name in FIELDS.items():
+            values = pd.to_numeric(df.loc[tail, column_name], errors="coerce").to_numpy(dtype=float)
+            array = store._arrays[field]
+            if not np.array_equal(array[row, columns], values, equal_nan=True):
+                array[row, columns] = values
+                changed = True
+        new_end = max(end, int(columns.max()) + 1)
+        if changed or new_end != end:
+            spans[stock_id] = [start, new_end]
+            updated += 1
+
+    if not new_weeks and not updated:
+        logging.info("Panel is already up-to-date.")
+        return PanelStore(panel_dir)
+
+    for array in store._arrays.values():
+        array.flush()
+    _write_index(panel_dir, store.stock_ids, weeks, spans, store.capacity)
+    logging.info(f"Added {len(new_weeks)} weeks to the panel and updated {updated} stocks in {panel_dir}.")
+    return PanelStore(panel_dir)
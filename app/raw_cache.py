@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from app.config import RAW_CACHE_DIR, RAW_CACHE_ENABLED, HISTORY_START_DATE, DOWNLOAD_DIR
+from app.data_store import merge_weeks, read_stock, write_stock
+from app.download_manifest import ManifestWriter
+
+# Serializes updates of the per-stock index files within a process
+_index_lock = threading.Lock()
+
+
+def _object_path(sha256, cache_dir):
+    return Path(cache_dir) / "objects" / sha256[:2] / f"{sha256}.html.gz"
+
+
+def _index_path(dataset, stock_id, cache_dir):
+    return Path(cache_dir) / "index" / dataset / f"{stock_id}.json"
+
+
+def _atomic_write(path, payload):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def cached_pages(dataset, stock_id, cache_dir=RAW_CACHE_DIR):
+    """
+    Lists the cached responses of a stock, oldest first.
+
+    Returns:
+    - entries (list): [{"start_date", "end_date", "sha256", "fetched_at"}].
+    """
+    index_path = _index_path(dataset, stock_id, cache_dir)
+    if not index_path.exists():
+        return []
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def store_page(dataset, stock_id, start_date, end_date, html, cache_dir=RAW_CACHE_DIR):
+    """
+    Stores a fetched page in the raw cache.
+
+    The page is gzip-compressed and stored once under its sha256, so identical
+    responses share one object. The stock's index records the request's date range.
+
+    Args:
+    - dataset (str): "stocks" or "shareholder".
+    - stock_id (str): Stock the page belongs to.
+    - start_date (str): START_DT of the request.
+    - end_date (str): END_DT of the request.
+    - html (str): The response as fetched.
+    - cache_dir (str or Path): Cache root.
+
+    Returns:
+    - sha256 (str): Content address of the page.
+    """
+    payload = html.encode("utf-8")
+    sha256 = hashlib.sha256(payload).hexdigest()
+    object_path = _object_path(sha256, cache_dir)
+    if not object_path.exists():
+        _atomic_write(object_path, gzip.compress(payload))
+
+    entry = {"start_date": start_date, "end_date": end_date, "sha256": sha256,
+             "fetched_at": datetime.now().isoformat(timespec="seconds")}
+    with _index_lock:
+        entries = cached_pages(dataset, stock_id, cache_dir) + [entry]
+        _atomic_write(_index_path(dataset, stock_id, cache_dir), json.dumps(entries).encode("utf-8"))
+    return sha256
+
+
+def cache_page(dataset, stock_id, start_date, end_date, html):
+    """Stores a page if RAW_CACHE_ENABLED; a cache failure never fails the download."""
+    if not RAW_CACHE_ENABLED:
+        return
+    try:
+        store_page(dataset, stock_id, start_date, end_date, html)
+    except Exception as e:
+        logging.warning(f"Error caching raw {dataset} page for {stock_id}: {e}")
+
+
+def load_page(sha256, cache_dir=RAW_CACHE_DIR):
+    """Returns a cached page by its content address."""
+    with gzip.open(_object_path(sha256, cache_dir), "rb") as f:
+        return f.read().decode("utf-8")
+
+
+def replay_entries(dataset, stock_id, cache_dir=RAW_CACHE_DIR):
+    """
+    Returns the cached responses that rebuild a stock's current data, in apply order.
+
+    That is the latest full-history response followed by every later delta response.
+    If no full response is cached, every cached response is returned; those are deltas
+    only, to be merged into the stored data.
+    """
+    entries = cached_pages(dataset, stock_id, cache_dir)
+    full = [i for i, entry in enumerate(entries) if entry["start_date"] == HISTORY_START_DATE]
+    return entries[full[-1]:] if full else entries
+
+
+def replay_dataset(dataset, stock_numbers, parse, name=str, data_dir=DOWNLOAD_DIR, cache_dir=RAW_CACHE_DIR):
+    """
+    Rebuilds stored data from the raw cache, with no browser or network.
+
+    Each stock's cached responses are parsed with the current parsing rules and merged
+    in the order they were fetched, then written to the store and the manifest as if
+    freshly downloaded. Without a cached full-history response, e.g. for stocks first
+    downloaded before the cache existed, the deltas are merged into the stored data
+    instead of replacing it, and a stock with no stored data fails. Only a full-history
+    response sets the manifest's last full fetch time.
+
+    Args:
+    - dataset (str): "stocks" or "shareholder".
+    - stock_numbers (list): Stocks to rebuild.
+    - parse (callable): parse(html) returns the DataFrame of one response.
+    - name (callable): Maps a stock number to its partition name in the store.
+    - data_dir (str or Path): Store directory to write to.
+    - cache_dir (str or Path): Cache root.
+
+    Returns:
+    - error_stocks (list): Stocks with nothing cached or that failed to rebuild.
+    """
+    logging.info(f"Replaying cached {dataset} pages for {len(stock_numbers)} stocks.")
+    error_stocks = []
+    with ManifestWriter() as manifest_writer:
+        for stock_number in stock_numbers:
+            try:
+                entries = replay_entries(dataset, stock_number, cache_dir)
+                if not entries:
+                    raise LookupError("no cached pages")
+                full = entries[0]["start_date"] == HISTORY_START_DATE
+                df = None if full else read_stock(data_dir, name(stock_number))
+                if df is None and not full:
+                    raise LookupError("no full-history page cached and no stored data to merge the cached deltas into")
+                for entry in entries:
+                    part = parse(load_page(entry["sha256"], cache_dir))
+                    df = part if df is None else merge_weeks(df, part)
+
+                output_file_path = write_stock(df, data_dir, name(stock_number))
+                if output_file_path is None:
+                    raise IOError(f"Could not store data for {stock_number}")
+                manifest_writer.record(name(stock_number), df, output_file_path, full=full,
+                                       fetched_at=datetime.fromisoformat(entries[-1]["fetched_at"]),
+                                       full_fetched_at=entries[0]["fetched_at"] if full else None)
+            except Exception as e:
+                logging.error(f"Error replaying {dataset} data for {stock_number}: {e}")
+                error_stocks.append(stock_number)
+    logging.info(f"Replay completed with {len(error_stocks)} errors.")
+    return error_stocks
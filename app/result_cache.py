@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from app.config import BACKTEST_CACHE_DIR, BACKTEST_CACHE_SIZE
+
+
+class ResultCache:
+    """
+    Two-tier cache of per-stock backtest results.
+
+    Entries are keyed by (stock_id, latest data date, parameter set). The in-memory
+    tier is an LRU of at most `max_entries` results; the on-disk tier keeps one pickle
+    per entry under `cache_dir/<stock_id>/` so results survive restarts.
+    """
+
+    def __init__(self, cache_dir=BACKTEST_CACHE_DIR, max_entries=BACKTEST_CACHE_SIZE):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(stock_id, latest_date, params):
+        return (str(stock_id), str(latest_date), repr(sorted(params.items())))
+
+    def _path(self, key):
+        digest = hashlib.sha1("|".join(key).encode("utf-8")).hexdigest()
+        return self.cache_dir / key[0] / f"{digest}.pkl"
+
+    def get(self, stock_id, latest_date, params):
+        """Return the cached result, or None on a miss."""
+        key = self._key(stock_id, latest_date, params)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"Error reading cached result {path}: {e}")
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, stock_id, latest_date, params, value):
+        """Store a result in both tiers."""
+        key = self._key(stock_id, latest_date, params)
+        self._remember(key, value)
+
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Error writing cached result {path}: {e}")
+
+    def invalidate(self, stock_ids):
+        """Drop every cached result for the given stocks."""
+        stock_ids = {str(stock_id) for stock_id in stock_ids}
+        with self._lock:
+            for key in [key for key in self._memory if key[0] in stock_ids]:
+                del self._memory[key]
+        for stock_id in stock_ids:
+            shutil.rmtree(self.cache_dir / stock_id, ignore_errors=True)
+        logging.info(f"Invalidated cached backtest results for {len(stock_ids)} stocks.")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+# Shared by the backtest and the database layer so ingests can invalidate results
+backtest_cache = ResultCache()
@@ -0,0 +1,146 @@
+import argparse
+import logging
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .helpers import *
+from .config import ENTRY_QUANTILE, MR_HORIZONS, VERDICT_THRESHOLD, SWEEP_OUTPUT_PATH, STOCK_NUMBERS_PATH
+from .backtest_panel import compact_rows, load_panel
+from .download_stocks import read_stock_numbers_from_file
+from .mr_engine import median_reversion_rates
+
+
+def quantile_from_sorted(sorted_values, counts, q):
+    """
+    Linear-interpolated quantile of each row of an already sorted panel.
+
+    Matches numpy/pandas' default ("linear") quantile, so sorting once is enough
+    for any number of quantiles.
+
+    Args:
+    - sorted_values (ndarray): Rows sorted ascending with NaN at the end.
+    - counts (ndarray): Number of non-NaN values in each row.
+    - q (float): Quantile between 0 and 1.
+
+    Returns:
+    - values (ndarray): One quantile per row, NaN for empty rows.
+    """
+    rows = np.arange(sorted_values.shape[0])
+    position = q * np.maximum(counts - 1, 0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, np.maximum(counts - 1, 0))
+    t = position - lower
+    a = sorted_values[rows, lower]
+    b = sorted_values[rows, upper]
+    # Same lerp as numpy so results agree to the last bit
+    diff = b - a
+    values = np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+    return np.where(counts > 0, values, np.nan)
+
+
+def run_sweep(stock_numbers, entry_quantiles=(ENTRY_QUANTILE,), horizon_sets=(MR_HORIZONS,),
+              verdict_thresholds=(VERDICT_THRESHOLD,), output_path=None):
+    """
+    Evaluate the MR strategy over a grid of parameters for every stock.
+
+    Each stock's PER series is sorted once; every entry quantile is read from that
+    sorted copy, and the MR kernel runs once per quantile for all horizons in the grid.
+
+    Args:
+    - stock_numbers (list): List of stock numbers to process.
+    - entry_quantiles (list): PER quantiles used as the entry level, e.g. [0.1, 0.25].
+    - horizon_sets (list): Horizon sets averaged into the MR rate, e.g. [(4, 8, 12)].
+    - verdict_thresholds (list): Minimum average MR rate for a positive verdict.
+    - output_path (str or Path): Where to save the results. Defaults to SWEEP_OUTPUT_PATH.
+
+    Returns:
+    - results_df (DataFrame): One row per (stock, entry quantile, horizons, threshold).
+    """
+    output_path = output_path or SWEEP_OUTPUT_PATH
+    logging.info(
+        f"Starting sweep for {len(stock_numbers)} stocks: quantiles={list(entry_quantiles)}, "
+        f"horizons={list(horizon_sets)}, thresholds={list(verdict_thresholds)}")
+
+    panel = load_panel(stock_numbers)
+    if panel is None:
+        return pd.DataFrame()
+
+    rows = np.arange(len(panel.stock_ids))
+    last = np.maximum(panel.end - 1, 0)
+    sorted_per = np.sort(panel.per, axis=1)
+    counts = (~np.isnan(panel.per)).sum(axis=1)
+
+    median_per = np.round(quantile_from_sorted(sorted_per, counts, 0.5), 2)
+    current_per = panel.per[rows, last]
+    current_price = panel.price[rows, last]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        median_price = np.where(current_per != 0, median_per / current_per * current_price, np.nan)
+        mp_updown = np.where(current_price != 0, (median_price - current_price) / current_price, np.nan)
+
+    all_horizons = sorted({weeks for horizons in horizon_sets for weeks in horizons})
+    compact_per, lengths = compact_rows(panel)
+    frames = []
+    for entry_quantile in entry_quantiles:
+        quartile_per = np.round(quantile_from_sorted(sorted_per, counts, entry_quantile), 2)
+        mr_results = median_reversion_rates(compact_per, all_horizons, median_per, quartile_per, end=lengths)
+
+        for horizons in horizon_sets:
+            rates = np.column_stack([mr_results[weeks][0] for weeks in horizons])
+            # Horizons with too many NaN weeks count as NaN incidents, like the backtest's Incident columns
+            incidents = np.sum([np.where(mr_results[weeks][3], np.nan, mr_results[weeks][1])
+                                for weeks in horizons], axis=0)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                avg_mr = np.nanmean(rates, axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                kelly = np.where(mp_updown != 0, (avg_mr * (mp_updown + 1) - 1) / mp_updown, np.nan)
+
+            for threshold in verdict_thresholds:
+                frames.append(pd.DataFrame({
+                    "Stock ID": panel.stock_ids,
+                    "Entry Quantile": entry_quantile,
+                    "Horizons": "-".join(str(weeks) for weeks in horizons),
+                    "Verdict Threshold": threshold,
+                    "Entry PER": quartile_per,
+                    "Median PER": median_per,
+                    "MP UpDown": mp_updown,
+                    "Avg. MR": avg_mr,
+                    "Incidents": incidents,
+                    "Kelly": kelly,
+                    "Verdict": (mp_updown > 0) & (avg_mr > threshold),
+                }))
+
+    results_df = pd.concat(frames, ignore_index=True)
+    save_to_csv(results_df, output_path, False)
+    logging.info(f"Sweep results ({len(results_df)} rows) saved to {output_path}.")
+    return results_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep MR strategy parameters over every stock.")
+    parser.add_argument("--stocks-file", default=STOCK_NUMBERS_PATH,
+                        help="Text file with one stock ID per line.")
+    parser.add_argument("--quantiles", type=float, nargs="+", default=[ENTRY_QUANTILE],
+                        help="Entry PER quantiles, e.g. 0.1 0.2 0.25.")
+    parser.add_argument("--horizons", nargs="+", default=[",".join(map(str, MR_HORIZONS))],
+                        help="Comma-separated horizon sets in weeks, e.g. 4,8,12 2,4,8.")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[VERDICT_THRESHOLD],
+                        help="Verdict thresholds on the average MR rate, e.g. 0.8 0.84.")
+    parser.add_argument("--output", default=SWEEP_OUTPUT_PATH, help="Output CSV path.")
+    args = parser.parse_args()
+
+    horizon_sets = [tuple(int(weeks) for weeks in value.split(",")) for value in args.horizons]
+    stock_numbers = read_stock_numbers_from_file(args.stocks_file)
+    results_df = run_sweep(stock_numbers, args.quantiles, horizon_sets, args.thresholds, args.output)
+    print(results_df)
+
+
+if __name__ == "__main__":
+    logging.info("Script execution started.")
+    try:
+        main()
+    except Exception as e:
+        logging.critical(f"Unhandled exception during sweep: {e}", exc_info=True)
+    logging.info("Script execution finished.")
@@ -0,0 +1,148 @@
+from html.parser import HTMLParser
+
+import pandas as pd
+
+# Elements whose text is not part of a cell's visible text
+SKIPPED_TEXT_TAGS = {"script", "style"}
+
+
+class DetailTableParser(HTMLParser):
+    """
+    Single-pass extractor of one HTML table into column lists.
+
+    Cell text matches BeautifulSoup's `get_text(strip=True)`: the text nodes inside the
+    cell, each stripped, joined without separators. The first row (the header) and rows
+    without cells are skipped, and rows are filtered as they are closed, so no
+    intermediate tree or list of rows is built.
+    """
+
+    def __init__(self, columns, table_id="tblDetail", skip_week_53=True):
+        super().__init__(convert_charrefs=True)
+        self.columns = list(columns)
+        self.data = {column: [] for column in self.columns}
+        self.table_id = table_id
+        self.skip_week_53 = skip_week_53
+        self.found = table_id is None
+        self._table_depth = 1 if table_id is None else 0
+        self._done = False
+        self._rows_seen = 0
+        self._row = None
+        self._cell = None
+        self._text = []
+        self._skip_depth = 0
+
+    def _flush_text(self):
+        if self._text:
+            if self._cell is not None and not self._skip_depth:
+                text = "".join(self._text).strip()
+                if text:
+                    self._cell.append(text)
+            self._text = []
+
+    def _close_cell(self):
+        if self._cell is not None:
+            self._row.append("".join(self._cell))
+            self._cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        row, self._row = self._row, None
+        if row is None:
+            return
+        self._rows_seen += 1
+        if self._rows_seen == 1 or not row:
+            return
+        if len(row) > len(self.columns):
+            raise ValueError(f"{len(self.columns)} columns passed, passed data had {len(row)} columns")
+        if self.skip_week_53 and row[0].endswith("W53"):
+            return
+        for column, value in zip(self.columns, row + [None] * (len(self.columns) - len(row))):
+            self.data[column].append(value)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if self._done:
+            return
+        if tag == "table":
+            if self._table_depth:
+                self._table_depth += 1
+            elif dict(attrs).get("id") == self.table_id:
+                self.found = True
+                self._table_depth = 1
+            return
+        if not self._table_depth:
+            return
+        if tag == "tr":
+            self._close_row()
+            self._row = []
+        elif tag == "td" and self._row is not None:
+            self._close_cell()
+            self._cell = []
+        elif tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if self._done or not self._table_depth:
+            return
+        if tag == "td":
+            self._close_cell()
+        elif tag == "tr":
+            self._close_row()
+        elif tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "table":
+            self._table_depth -= 1
+            if not self._table_depth:
+                self._close_row()
+                self._done = True
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        if self._table_depth:
+            self._close_row()
+
+
+def parse_detail_table(html, columns, numeric_columns=(), caps=None, table_id="tblDetail"):
+    """
+    Parses a Goodinfo data table straight into a typed DataFrame.
+
+    Equivalent to parsing with BeautifulSoup, building a string DataFrame, dropping
+    week 53 and converting and capping the numeric columns. Cells stream into column
+    lists in one pass over the HTML with week 53 dropped on the way; each numeric column
+    is then converted and capped in one vectorized step.
+
+    Args:
+    - html (str): Page or table HTML.
+    - columns (list): Column names, in table order.
+    - numeric_columns (list): Columns converted with `pd.to_numeric(errors="coerce")`.
+    - caps (dict): {column: maximum}; larger values become NaN.
+    - table_id (str): id of the table to read, or None if `html` is the table's inner HTML.
+
+    Returns:
+    - df (pd.DataFrame): The data rows, newest week first, or None if the table is missing.
+    """
+    parser = DetailTableParser(columns, table_id)
+    parser.feed(html)
+    parser.close()
+    if not parser.found:
+        return None
+
+    rows = len(parser.data[columns[0]]) if columns else 0
+    df = pd.DataFrame(parser.data, columns=columns) if rows else pd.DataFrame([], columns=columns)
+    for column in numeric_columns:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    for column, maximum in (caps or {}).items():
+        df.loc[df[column] > maximum, column] = None
+    return df
@@ -0,0 +1,128 @@
+import logging
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+from app.config import TRADING_HOLIDAYS_PATH
+from app.helpers import parse_custom_dates
+
+HOLIDAY_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:\.\.(\d{4}-\d{2}-\d{2}))?\b")
+
+
+@lru_cache(maxsize=None)
+def load_holidays(path=TRADING_HOLIDAYS_PATH):
+    """
+    Loads the market holidays from a holiday file.
+
+    Each line holds a date (YYYY-MM-DD) or an inclusive range (YYYY-MM-DD..YYYY-MM-DD),
+    optionally followed by a description. Blank lines and lines starting with "#" are
+    ignored.
+
+    Returns:
+    - holidays (frozenset): Dates without trading, besides weekends. Empty if the file
+      is missing.
+    """
+    path = Path(path)
+    if not path.exists():
+        logging.warning(f"Trading holiday file {path} not found. Only weekends count as closed.")
+        return frozenset()
+
+    holidays = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            match = HOLIDAY_LINE.match(line)
+            if not match:
+                logging.warning(f"Skipping unreadable line {line_number} in {path}: {line}")
+                continue
+            start = date.fromisoformat(match.group(1))
+            end = date.fromisoformat(match.group(2)) if match.group(2) else start
+            holidays.update(start + timedelta(days=i) for i in range((end - start).days + 1))
+    return frozenset(holidays)
+
+
+def is_trading_day(day, holidays=None):
+    """Checks whether the market is open on a date."""
+    holidays = load_holidays() if holidays is None else holidays
+    return day.weekday() < 5 and day not in holidays
+
+
+def week_trading_days(friday, holidays=None):
+    """Trading days of the week (Monday to Friday) ending on `friday`."""
+    return [day for day in (friday - timedelta(days=4 - i) for i in range(5)) if is_trading_day(day, holidays)]
+
+
+def _has_stored_week(friday, holidays):
+    # The downloaders drop Goodinfo's week 53 rows, so ISO week 53 never has stored data
+    return friday.isocalendar()[1] != 53 and bool(week_trading_days(friday, holidays))
+
+
+def latest_trading_week_end(as_of=None, holidays=None):
+    """
+    Friday of the most recent week with trading, up to `as_of`.
+
+    The calendar-aware version of `get_most_recent_friday`: weeks the market is closed
+    all week (e.g. Lunar New Year) are skipped, since no stock can have data for them,
+    and so is ISO week 53, which is never stored.
+
+    Args:
+    - as_of (date): Reference date. Default is today.
+    - holidays (frozenset): Holidays to use. Default is the holiday file.
+
+    Returns:
+    - friday (date): Week-ending Friday, labelling the week like `parse_custom_date`.
+    """
+    as_of = as_of or datetime.now().date()
+    friday = as_of - timedelta(days=(as_of.weekday() - 4) % 7)
+    # Any closure is far shorter than a year
+    for _ in range(53):
+        if _has_stored_week(friday, holidays):
+            return friday
+        friday -= timedelta(weeks=1)
+    return friday
+
+
+def trading_week_ends(start, end, holidays=None):
+    """
+    Fridays of the weeks with trading between two dates, except ISO week 53.
+
+    Args:
+    - start (date): First date; its week is included.
+    - end (date): Last date; its week is included if it ends by `end`.
+
+    Returns:
+    - fridays (list): Week-ending Fridays, oldest first.
+    """
+    friday = start + timedelta(days=(4 - start.weekday()) % 7)
+    fridays = []
+    while friday <= end:
+        if _has_stored_week(friday, holidays):
+            fridays.append(friday)
+        friday += timedelta(weeks=1)
+    return fridays
+
+
+def first_trading_day_of_week(day, holidays=None):
+    """The first trading day of the week containing `day`, or its Monday if the week has none."""
+    monday = day - timedelta(days=day.weekday())
+    trading_days = week_trading_days(monday + timedelta(days=4), holidays)
+    return trading_days[0] if trading_days else monday
+
+
+def missing_trading_weeks(week_codes, start, end, holidays=None):
+    """
+    Finds the trading weeks between two dates that a set of week codes does not cover.
+
+    Args:
+    - week_codes (list or pd.Series): Week codes such as 24W52.
+    - start (date): First date checked.
+    - end (date): Last date checked.
+
+    Returns:
+    - missing (list): Week-ending Fridays of the uncovered weeks, oldest first.
+    """
+    present = {day for day in parse_custom_dates(week_codes) if day is not None}
+    return [friday for friday in trading_week_ends(start, end, holidays) if friday not in present]
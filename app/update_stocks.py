@@ -1,9 +1,12 @@
 import os
+import sys
 import logging
 from app.db.db_CRUD import CRUDHelper
-from app.config import RESOURCES_DIR
+from app.config import RESOURCES_DIR, DOWNLOAD_ENGINE
 from app.app_logging import setup_logging
 from app.download_stocks import download_stock_data, check_and_download_stocks
+from app.panel_store import update_panel_store
+from app.download_journal import run_download_job, UPDATE_ALL_JOB
 
 # Setup logging
 setup_logging(debug_mode=True)
@@ -17,8 +20,11 @@ if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
 crud_helper = CRUDHelper(database_url=DATABASE_URL)
 
 
-def update_all_stock_data():
-    """Update stock data for all stock symbols."""
+def update_all_stock_data(full_refetch=False, engine=DOWNLOAD_ENGINE, replay=False):
+    """
+    Update stock data for all stock symbols, re-fetching full histories if `full_refetch`
+    or rebuilding them from the raw page cache if `replay`.
+    """
     logging.info("Loading stock numbers from file...")
     try:
         with open(RESOURCES_DIR / "all_stocks_number.txt", "r") as f:
@@ -31,26 +37,46 @@ def update_all_stock_data():
     # Step 1: Download all stock data locally first
     logging.info("Checking and downloading missing stock data...")
     try:
-        error_download = check_and_download_stocks(stock_numbers)
+        if replay:
+            error_download = download_stock_data(stock_numbers, replay=True)
+        else:
+            # Journaled under the same job as the API, so either can resume the other's run
+            error_download = run_download_job(
+                UPDATE_ALL_JOB, stock_numbers,
+                lambda stocks, journal: check_and_download_stocks(stocks, full_refetch, engine, journal),
+                full_refetch=full_refetch)
         if error_download:
             logging.warning(f"Failed to download data for stocks: {error_download}")
     except Exception as e:
         logging.error(f"Error during stock download process: {e}")
         raise
 
+    # Add the new weeks to the memory-mapped panel
+    try:
+        update_panel_store(stock_numbers)
+    except Exception as e:
+        logging.error(f"Error updating the stock panel: {e}")
+
     # Step 2: Initialize tracking lists
-    all_missing_records = []  # Collect all missing records
+    stock_frames = []         # New rows of each stock, typed for the bulk loader
     updated_stocks = []       # Stocks that need to be updated
     already_updated_stocks = []  # Stocks that are already up-to-date
     error_stocks = []         # Stocks that encountered errors
 
-    # Step 3: Update the database
+    # Step 3: Prepare the rows missing from the database, against the latest stored
+    # dates of all stocks fetched in one grouped query
     logging.info("Starting database updates...")
+    latest_dates = crud_helper.get_latest_dates(stock_numbers)
+    if latest_dates is None:
+        logging.error("Failed to fetch the latest stored dates.")
+        return False
     for stock_id in stock_numbers:
         try:
-            missing_records = crud_helper.update_stock_data(stock_id)
-            if missing_records:
-                all_missing_records.extend(missing_records)
+            stock_frame = crud_helper.prepare_stock_frame(stock_id, latest_dates)
+            if stock_frame is None:
+                error_stocks.append(stock_id)
+            elif not stock_frame.empty:
+                stock_frames.append(stock_frame)
                 updated_stocks.append(stock_id)
                 logging.info(f"Stock {stock_id} updated with missing records.")
             else:
@@ -60,12 +86,13 @@ def update_all_stock_data():
             error_stocks.append(stock_id)
             logging.error(f"Error updating stock {stock_id}: {e}")
 
-    # Step 4: Insert missing records into the database at once
-    if all_missing_records:
-        logging.info(f"Inserting {len(all_missing_records)} missing records into the database...")
+    # Step 4: Bulk load the missing rows in batches, skipping rows already stored
+    load_stats = None
+    if stock_frames:
+        logging.info(f"Inserting {sum(len(df) for df in stock_frames)} missing records into the database...")
         try:
-            success = crud_helper.add_bulk_stock_data(all_missing_records)
-            if not success:
+            load_stats = crud_helper.bulk_load_stock_frames(stock_frames)
+            if load_stats is None:
                 logging.error("Failed to insert missing records into the database.")
                 return False
         except Exception as e:
@@ -76,7 +103,8 @@ def update_all_stock_data():
     result = {
         "updated": updated_stocks,
         "already_updated": already_updated_stocks,
-        "errors": error_stocks
+        "errors": error_stocks,
+        "load": load_stats
     }
     logging.info(f"Update process completed. Results: {result}")
     return result
@@ -85,7 +113,9 @@ def update_all_stock_data():
 if __name__ == "__main__":
     logging.info("Script execution started.")
     try:
-        update_results = update_all_stock_data()
+        update_results = update_all_stock_data(full_refetch="full" in sys.argv[1:],
+                                               engine="async" if "async" in sys.argv[1:] else DOWNLOAD_ENGINE,
+                                               replay="replay" in sys.argv[1:])
     except Exception as e:
         logging.critical(f"Unhandled exception: {e}", exc_info=True)
     logging.info("Script execution finished.")
@@ -0,0 +1,146 @@
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+from sortedcontainers import SortedList
+
+from .helpers import *
+from .config import MR_HORIZONS, VERDICT_THRESHOLD, ENTRY_QUANTILE, WALK_FORWARD_WINDOW, WALK_FORWARD_OUTPUT_PATH
+from .backtest_panel import compact_rows, horizon_label, load_panel
+from .mr_engine import NaN_THRESHOLD, median_reversion_rates
+
+
+def _sorted_quantile(values, q):
+    """Linear-interpolated quantile of a SortedList, matching numpy's default method."""
+    position = q * (len(values) - 1)
+    lower = math.floor(position)
+    t = position - lower
+    a = values[lower]
+    b = values[min(lower + 1, len(values) - 1)]
+    diff = b - a
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+def rolling_order_stats(values, window, quantiles, min_periods=None):
+    """
+    Rolling quantiles of a series, updated incrementally.
+
+    The trailing window is kept in a SortedList, so each week costs one insert and one
+    removal (O(log window)) instead of re-sorting the whole window. NaN values are
+    skipped, like `Series.quantile`.
+
+    Args:
+    - values (ndarray): Series in chronological order.
+    - window (int): Number of weeks in the trailing window, including the current week.
+    - quantiles (list): Quantiles to compute, e.g. [0.5, 0.25].
+    - min_periods (int): Minimum number of non-NaN values needed in the window.
+      Default is the window size minus the NaN_THRESHOLD allowance.
+
+    Returns:
+    - stats (ndarray): Shape (len(values), len(quantiles)); NaN where not available.
+    """
+    if min_periods is None:
+        min_periods = window - int(window * NaN_THRESHOLD)
+
+    values = np.asarray(values, dtype=float)
+    stats = np.full((len(values), len(quantiles)), np.nan)
+    in_window = SortedList()
+
+    for i, value in enumerate(values):
+        if not np.isnan(value):
+            in_window.add(value)
+        if i >= window and not np.isnan(values[i - window]):
+            in_window.remove(values[i - window])
+        if i >= window - 1 and len(in_window) >= min_periods:
+            stats[i] = [_sorted_quantile(in_window, q) for q in quantiles]
+
+    return stats
+
+
+def process_stocks_walk_forward(stock_numbers, window=WALK_FORWARD_WINDOW, horizons=MR_HORIZONS):
+    """
+    Walk-forward Median Reversion (MR) backtest without look-ahead bias.
+
+    Each week is tested against the rolling median and entry quantile of the `window`
+    weeks up to and including that week, i.e. only what was known at that date. Weeks
+    before the first full window are not tested.
+
+    Args:
+    - stock_numbers (list): List of stock numbers to process.
+    - window (int): Rolling window in weeks. Default is 260 (5 years).
+    - horizons (tuple): Look-ahead windows in weeks; each gets "<label> MR" and
+      "<label> Incident" columns (see `horizon_label`), 1M/2M/3M for the default.
+
+    Returns:
+    - result_df (DataFrame): Same columns as backtest_MR_data.csv, with the current
+      median taken from the latest rolling window. Saved to WALK_FORWARD_OUTPUT_PATH.
+    """
+    logging.info(f"Starting walk-forward backtest for {len(stock_numbers)} stocks with a {window}-week window.")
+
+    panel = load_panel(stock_numbers)
+    if panel is None:
+        return pd.DataFrame()
+
+    # Windows and look-ahead count each stock's own rows, not the weeks of other stocks
+    per, lengths = compact_rows(panel)
+    median_per = np.full(per.shape, np.nan)
+    quartile_per = np.full(per.shape, np.nan)
+    for row, stock_id in enumerate(panel.stock_ids):
+        span = slice(0, lengths[row])
+        stats = rolling_order_stats(per[row, span], window, [0.5, ENTRY_QUANTILE])
+        median_per[row, span] = stats[:, 0]
+        quartile_per[row, span] = stats[:, 1]
+        logging.debug(f"Rolling statistics computed for stock {stock_id}.")
+
+    mr_results = median_reversion_rates(
+        per, list(horizons), median_per, quartile_per, end=lengths, valid=~np.isnan(quartile_per))
+
+    rows = np.arange(len(panel.stock_ids))
+    last = np.maximum(lengths - 1, 0)
+    # Latest week each stock has a row for, as a column of the union panel
+    last_column = panel.present.shape[1] - 1 - np.argmax(panel.present[:, ::-1], axis=1)
+    current_median = median_per[rows, last]
+    current_per = per[rows, last]
+    current_price = panel.price[rows, last_column]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        median_price = np.where(current_per != 0, current_median / current_per * current_price, np.nan)
+        mp_updown = np.where(current_price != 0, (median_price - current_price) / current_price, np.nan)
+
+    mr_rates = np.column_stack([mr_results[weeks][0] for weeks in horizons])
+    mr_cases = [np.where(mr_results[weeks][3], np.nan, mr_results[weeks][1]) for weeks in horizons]
+    avg_mr = pd.DataFrame(mr_rates).mean(axis=1).to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kelly = np.where(mp_updown != 0, (avg_mr * (mp_updown + 1) - 1) / mp_updown, np.nan)
+    verdict = (mp_updown > 0) & (avg_mr > VERDICT_THRESHOLD)
+
+    labels = [horizon_label(weeks) for weeks in horizons]
+    result_df = pd.DataFrame({
+        "Stock ID": panel.stock_ids,
+        "C$": current_price,
+        "M$": median_price,
+        "T$": "####",  # Leave blank
+        "MP UpDown": mp_updown,
+        **{f"{label} MR": mr_rates[:, i] for i, label in enumerate(labels)},
+        "Avg.": avg_mr,
+        "####": "####",  # Leave blank
+        "Kelly": kelly,
+        "Verdict": verdict,
+        "#####": "#####",  # Leave blank
+        **{f"{label} Incident": mr_cases[i] for i, label in enumerate(labels)}
+    })
+
+    save_to_csv(result_df, WALK_FORWARD_OUTPUT_PATH, False)
+    logging.info(f"Walk-forward results saved to {WALK_FORWARD_OUTPUT_PATH}.")
+    return result_df
+
+
+if __name__ == "__main__":
+    logging.info("Script execution started.")
+    stock_numbers = ["1213", "2330", "2303"]  # Example stock numbers
+    try:
+        print(process_stocks_walk_forward(stock_numbers))
+    except Exception as e:
+        logging.critical(
+            f"Unhandled exception during walk-forward backtest: {e}", exc_info=True)
+    logging.info("Script execution finished.")
@@ -18,11 +18,14 @@ setup(
         "webdriver-manager",
         "sqlalchemy",
         "Flask-SQLAlchemy",
-        "psycopg2-binary"
+        "psycopg2-binary",
+        "sortedcontainers",
+        "pyarrow"
     ],
     entry_points={
         "console_scripts": [
-            "run=app.main:main"
+            "run=app.main:main",
+            "sweep=app.sweep:main"
         ]
     },
     include_package_data=True,
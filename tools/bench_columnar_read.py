@@ -0,0 +1,92 @@
+# Benchmark of the columnar stock read path against the ORM path.
+#
+#   python tools/bench_columnar_read.py --stocks 300 --weeks 1200
+#
+# Builds a SQLite stand-in of stock_prices_weekly with synthetic rows, then reads every
+# stock's full history both ways: ORM objects converted from Decimal per row as the
+# backtests did, and the core SELECT with float casts. Both must give identical frames;
+# the script exits with an error otherwise.
+
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.db.bulk_loader import bulk_load  # noqa: E402
+from app.db.db_CRUD import CRUDHelper  # noqa: E402
+from app.db.db_models import Base  # noqa: E402
+
+
+def synthetic_frames(stocks, weeks, seed=0):
+    """Weekly rows with two-decimal prices and ratios and a few NULL PERs, like Numeric(12, 2)."""
+    rng = np.random.default_rng(seed)
+    latest = date.today() - timedelta(days=(date.today().weekday() - 4) % 7)
+    dates = [latest - timedelta(weeks=i) for i in range(weeks)]
+    for i in range(stocks):
+        per = np.round(rng.random(weeks) * 30, 2)
+        per[rng.random(weeks) < 0.03] = np.nan
+        yield pd.DataFrame({
+            "stock_id": str(1000 + i),
+            "date": dates,
+            "price": np.round(rng.random(weeks) * 100 + 1, 2),
+            "EPS": np.round(rng.random(weeks) * 5, 2),
+            "PER": per,
+        })
+
+
+def read_with_orm(crud_helper, stock_id):
+    """The read path the API and backtests used before the columnar one."""
+    stocks = crud_helper.get_all_stock_info(stock_id)
+    return pd.DataFrame([{
+        "date": stock.date,
+        "price": float(stock.price) if isinstance(stock.price, Decimal) else stock.price,
+        "EPS": float(stock.EPS) if isinstance(stock.EPS, Decimal) else stock.EPS,
+        "PER": float(stock.PER) if isinstance(stock.PER, Decimal) else stock.PER
+    } for stock in stocks]).astype({"price": float, "EPS": float, "PER": float})
+
+
+def time_reader(reader, stock_ids):
+    start = time.perf_counter()
+    frames = [reader(stock_id) for stock_id in stock_ids]
+    return time.perf_counter() - start, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ORM and columnar stock read paths.")
+    parser.add_argument("--stocks", type=int, default=300, help="Number of stocks in the stand-in.")
+    parser.add_argument("--weeks", type=int, default=1200, help="Weeks of history per stock.")
+    parser.add_argument("--db", type=str, default=None, help="SQLite file to build. Default is a temporary file.")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    db_path = Path(args.db) if args.db else Path(tempfile.mkdtemp()) / "bench_columnar_read.db"
+    db_path.unlink(missing_ok=True)
+    crud_helper = CRUDHelper(database_url=f"sqlite:///{db_path}")
+    Base.metadata.create_all(crud_helper.engine)
+    stats = bulk_load(crud_helper.engine, synthetic_frames(args.stocks, args.weeks))
+    print(f"{args.stocks} stocks, {stats['rows']} rows in {db_path} "
+          f"({db_path.stat().st_size / 1e6:.1f} MB, loaded at {stats['rows_per_second']:,} rows/s)")
+
+    stock_ids = [str(1000 + i) for i in range(args.stocks)]
+    orm_seconds, orm_frames = time_reader(lambda stock_id: read_with_orm(crud_helper, stock_id), stock_ids)
+    columnar_seconds, columnar_frames = time_reader(crud_helper.get_stock_frame, stock_ids)
+    for expected, actual in zip(orm_frames, columnar_frames):
+        pd.testing.assert_frame_equal(expected, actual)
+
+    rows = stats["rows"]
+    print(f"ORM:      {orm_seconds:.2f}s ({rows / orm_seconds:,.0f} rows/s)")
+    print(f"Columnar: {columnar_seconds:.2f}s ({rows / columnar_seconds:,.0f} rows/s)")
+    print(f"Speed-up: {orm_seconds / columnar_seconds:.1f}x, identical output")
+
+
+if __name__ == "__main__":
+    main()
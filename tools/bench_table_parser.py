@@ -0,0 +1,75 @@
+# Benchmark of the streaming tblDetail parser against the previous BeautifulSoup path.
+#
+#   python tools/bench_table_parser.py --pages 100 --years 24
+#
+# Pages are synthetic Goodinfo PER tables from goodinfo_standin_server.py. Both parsers
+# must produce identical frames; the script exits with an error otherwise.
+
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.download_stocks import HEADER, MAX_EPS, MAX_PER  # noqa: E402
+from app.table_parser import parse_detail_table  # noqa: E402
+from goodinfo_standin_server import render_page, synthetic_rows  # noqa: E402
+
+
+def parse_with_beautifulsoup(page_html):
+    """The parsing path the downloaders used before the streaming parser."""
+    soup = BeautifulSoup(page_html, "html.parser")
+    rows = soup.find(id="tblDetail").find_all("tr")
+    data = [[cell.get_text(strip=True) for cell in row.find_all("td")] for row in rows[1:] if row]
+
+    df = pd.DataFrame(data, columns=HEADER)
+    df = df.dropna(how="all")
+    df = df[~df["Date"].str.endswith("W53")]
+    df["EPS"] = pd.to_numeric(df["EPS"], errors="coerce")
+    df["PER"] = pd.to_numeric(df["PER"], errors="coerce")
+    df.loc[df["EPS"] > MAX_EPS, "EPS"] = None
+    df.loc[df["PER"] > MAX_PER, "PER"] = None
+    return df.reset_index(drop=True)
+
+
+def parse_streaming(page_html):
+    return parse_detail_table(page_html, HEADER, numeric_columns=["EPS", "PER"],
+                              caps={"EPS": MAX_EPS, "PER": MAX_PER})
+
+
+def time_parser(parser, pages):
+    start = time.perf_counter()
+    frames = [parser(page) for page in pages]
+    return time.perf_counter() - start, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tblDetail parsers.")
+    parser.add_argument("--pages", type=int, default=50, help="Number of stock pages to parse.")
+    parser.add_argument("--years", type=int, default=24, help="Years of weekly history per page.")
+    args = parser.parse_args()
+
+    end_date = date.today()
+    start_date = end_date - timedelta(days=365 * args.years)
+    pages = [render_page("ShowK_ChartFlow", synthetic_rows("ShowK_ChartFlow", str(1000 + i), start_date, end_date))
+             for i in range(args.pages)]
+    rows = sum(page.count("<tr>") - 1 for page in pages)
+    print(f"{args.pages} pages, {rows} rows, {sum(map(len, pages)) / 1e6:.1f} MB of HTML")
+
+    soup_seconds, soup_frames = time_parser(parse_with_beautifulsoup, pages)
+    stream_seconds, stream_frames = time_parser(parse_streaming, pages)
+    for expected, actual in zip(soup_frames, stream_frames):
+        pd.testing.assert_frame_equal(expected, actual)
+
+    print(f"BeautifulSoup: {soup_seconds:.2f}s ({rows / soup_seconds:,.0f} rows/s)")
+    print(f"Streaming:     {stream_seconds:.2f}s ({rows / stream_seconds:,.0f} rows/s)")
+    print(f"Speed-up:      {soup_seconds / stream_seconds:.1f}x, identical output")
+
+
+if __name__ == "__main__":
+    main()
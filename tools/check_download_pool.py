@@ -0,0 +1,81 @@
+# Regression check of the download pool's shutdown paths.
+#
+#   python tools/check_download_pool.py
+#
+# Runs run_download_pool with stand-in drivers whose quit() raises, that fail to start
+# or whose fetch raises, and checks that every run finishes within a timeout with the
+# expected failed items. A run that hangs (e.g. the writer waiting for a worker that
+# never signalled it was done) makes the script exit with an error.
+
+import logging
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.download_pool import run_download_pool  # noqa: E402
+
+TIMEOUT = 10
+
+
+class StandInDriver:
+    def __init__(self, fail_quit=False):
+        self.fail_quit = fail_quit
+
+    def quit(self):
+        if self.fail_quit:
+            raise RuntimeError("browser already gone")
+
+
+def fetch(driver, item):
+    if item % 5 == 0:
+        raise ValueError(f"no table for {item}")
+    return item * 2
+
+
+def failing_make_driver():
+    raise RuntimeError("ChromeDriver did not start")
+
+
+def run_with_timeout(make_driver, items, workers):
+    outcome = {}
+
+    def run():
+        outcome["errors"] = run_download_pool(items, make_driver, fetch, lambda item, data: None,
+                                              workers=workers, rate_limit=None, description="Check")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    if thread.is_alive():
+        return None
+    return outcome["errors"]
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    items = list(range(1, 21))
+    fetch_errors = [item for item in items if item % 5 == 0]
+    cases = [
+        ("quit() works", lambda: StandInDriver(), fetch_errors),
+        ("quit() raises", lambda: StandInDriver(fail_quit=True), fetch_errors),
+        ("driver fails to start", failing_make_driver, items),
+    ]
+
+    failed = False
+    for name, make_driver, expected in cases:
+        errors = run_with_timeout(make_driver, items, workers=4)
+        if errors is None:
+            print(f"FAIL {name}: pool did not finish within {TIMEOUT}s")
+            failed = True
+        elif errors != expected:
+            print(f"FAIL {name}: failed items {errors}, expected {expected}")
+            failed = True
+        else:
+            print(f"ok   {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from app.panel_store import open_panel_store
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -103,6 +105,27 @@ def download_stock_data(stock_numbers, start_date):
         driver.quit()
 
     print("All stock data downloaded!")
+
+
+def find_stale_tickers(stock_tickers):
+    """
+    Return the tickers that are missing from the latest week of the memory-mapped panel.
+
+    Only the latest week column is read from the panel, so this needs no CSV parsing.
+    Every ticker is returned when the panel has not been built or holds no weeks yet.
+    """
+    store = open_panel_store()
+    if store is None or not store.weeks:
+        return list(stock_tickers)
+
+    latest_prices = store.week(store.weeks[-1])["price"]
+    stale = []
+    for ticker in stock_tickers:
+        ticker = str(int(ticker)) if isinstance(ticker, float) else str(ticker)
+        row = store.stock_index.get(ticker)
+        if row is None or np.isnan(latest_prices[row]):
+            stale.append(ticker)
+    return stale
     
     
 # Path to the Excel file
@@ -115,4 +138,7 @@ data_df = pd.read_excel(excel_file_path)
 stock_tickers = data_df["Ticker"].dropna().tolist()
 
 # Print or use the list of stock tickers
-print(stock_tickers)
\ No newline at end of file
+print(stock_tickers)
+
+# Tickers whose latest week is missing from the panel need a download
+print(find_stale_tickers(stock_tickers))
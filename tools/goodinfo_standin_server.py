@@ -0,0 +1,126 @@
+# Local stand-in for the Goodinfo DATA pages, for testing and benchmarking the
+# downloaders offline.
+#
+#   python tools/goodinfo_standin_server.py --port 8765 --record-dir recorded_pages
+#   GOODINFO_BASE_URL=http://127.0.0.1:8765/tw python -m app.update_stocks
+#
+# A request for e.g. /tw/ShowK_ChartFlow.asp?STOCK_ID=2330&... is answered with
+# <record-dir>/ShowK_ChartFlow_2330.html when that recording exists, and otherwise
+# with a synthetic tblDetail table covering START_DT..END_DT, newest week first.
+
+import argparse
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+PAGES = {
+    "ShowK_ChartFlow": ["週別", "收盤價", "漲跌價", "漲跌幅", "EPS", "PER", "8X", "9.8X", "11.6X", "13.4X", "15.2X", "17X"],
+    "EquityDistributionClassHis": ["週別", "統計日期", "收盤價", "漲跌價", "漲跌幅", "集保張數", "≦10張", ">10張≦50張",
+                                   ">50張≦100張", ">100張≦200張", ">200張≦400張", ">400張≦800張", ">800張≦1千張", ">1千張"],
+}
+
+
+def fridays(start_date, end_date):
+    """Fridays from end_date back to start_date, newest first."""
+    friday = end_date - timedelta(days=(end_date.weekday() - 4) % 7)
+    while friday >= start_date:
+        yield friday
+        friday -= timedelta(weeks=1)
+
+
+def synthetic_rows(page, stock_id, start_date, end_date):
+    """Deterministic fake rows for a stock, in the column layout of the page."""
+    rows = []
+    for friday in fridays(start_date, end_date):
+        year, week, _ = friday.isocalendar()
+        rng = random.Random(f"{page}-{stock_id}-{friday}")
+        price = round(rng.uniform(10, 1000), 2)
+        change = round(rng.uniform(-5, 5), 2)
+        code = f"{year % 100:02d}W{week:02d}"
+        if page == "ShowK_ChartFlow":
+            eps = round(rng.uniform(-2, 40), 2)
+            per = round(price / eps, 2) if eps > 0 else ""
+            bands = [f"{eps * multiple:.1f}" for multiple in (8, 9.8, 11.6, 13.4, 15.2, 17)]
+            rows.append([code, price, change, f"{change / price * 100:.2f}", eps, per] + bands)
+        else:
+            shares = [f"{rng.uniform(0, 30):.2f}" for _ in range(8)]
+            rows.append([code, friday.strftime("%m/%d"), price, change, f"{change / price * 100:.2f}",
+                         f"{rng.randint(1000, 9999999):,}"] + shares)
+    return rows
+
+
+def render_page(page, rows):
+    header = "".join(f"<th>{name}</th>" for name in PAGES[page])
+    body = "".join("<tr>" + "".join(f"<td>{value}</td>" for value in row) + "</tr>\n" for row in rows)
+    return (f"<html><head><meta charset='utf-8'></head><body>"
+            f"<table id='tblDetail'><tr>{header}</tr>\n{body}</table></body></html>")
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    record_dir = None
+    latency = 0.0
+    block_every = 0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        page = Path(url.path).stem
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with StandinHandler.lock:
+            StandinHandler.requests_served += 1
+            served = StandinHandler.requests_served
+        time.sleep(self.latency)
+
+        if self.block_every and served % self.block_every == 0:
+            self.send_error(403, "Blocked by stand-in server")
+            return
+        if page not in PAGES or "STOCK_ID" not in params:
+            self.send_error(404)
+            return
+
+        recording = Path(self.record_dir or ".") / f"{page}_{params['STOCK_ID']}.html"
+        if self.record_dir and recording.exists():
+            html = recording.read_text(encoding="utf-8")
+        else:
+            start_date = date.fromisoformat(params.get("START_DT", "2001-03-28"))
+            end_date = date.fromisoformat(params.get("END_DT", date.today().isoformat()))
+            html = render_page(page, synthetic_rows(page, params["STOCK_ID"], start_date, end_date))
+
+        payload = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded or synthetic Goodinfo DATA pages.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--record-dir", help="Directory of recorded <page>_<stock_id>.html files.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument("--block-every", type=int, default=0,
+                        help="Answer every Nth request with 403 to exercise the browser fallback.")
+    args = parser.parse_args()
+
+    StandinHandler.record_dir = args.record_dir
+    StandinHandler.latency = args.latency
+    StandinHandler.block_every = args.block_every
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StandinHandler)
+    print(f"Goodinfo stand-in serving on http://127.0.0.1:{args.port}/tw")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()